@@ -1,8 +1,17 @@
 """This module contains functions for creating and retrieving assistants."""
 import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
 import openai
 import requests
 from dotenv import load_dotenv
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from data.intergration.http_client import PooledSession, RETRY_METHODS, http_session, retry_after
 load_dotenv('../config/.env')
 
 
@@ -15,6 +24,122 @@ BASE_URL = "https://api.openai.com/v1/assistants"
 openai.api_key = OPENAI_API_KEY
 openai.organization = ORGANIZATION_ID
 
+# Seconds before the assistant catalog is fetched again
+CATALOG_TTL = float(os.getenv("ASSISTANT_CATALOG_TTL", "300"))
+
+
+def _field(obj, name, default=None):
+    """Read a field from an API object or from a plain dict."""
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+class AssistantCatalog:
+    """
+    Local index of every assistant in the organisation, by id and by name.
+
+    The full list is paged through once and kept for ttl seconds, or until
+    invalidate is called after an assistant is created or deleted. Only one
+    thread pages through the API at a time; the others wait and use its
+    result. A refresh that started before an invalidate is not kept, since
+    it may not include the change.
+    """
+
+    def __init__(self, client=None, ttl: float = CATALOG_TTL, page_size: int = 100):
+        """
+        Parameters:
+            client: The OpenAI client. Defaults to the openai module's client.
+            ttl (float): Seconds before the catalog is refreshed.
+            page_size (int): Assistants fetched per request, at most 100.
+        """
+        self.client = client
+        self.ttl = ttl
+        self.page_size = page_size
+        self._assistants = []
+        self._by_id = {}
+        self._by_name = defaultdict(list)
+        self._loaded_at = None
+        # bumped by invalidate, so a refresh can tell it was overtaken
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Fetch every page of assistants and rebuild the indexes.
+
+        Returns:
+            list: All assistants, newest first.
+        """
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        with self._lock:
+            generation = self._generation
+        api = (self.client or openai).beta.assistants
+        assistants = []
+        params = {"limit": self.page_size}
+        while True:
+            page = api.list(**params)
+            data = list(_field(page, "data", []) or [])
+            assistants.extend(data)
+            if not data or not _field(page, "has_more", False):
+                break
+            params["after"] = _field(data[-1], "id")
+        by_id = {_field(assistant, "id"): assistant for assistant in assistants}
+        by_name = defaultdict(list)
+        for assistant in assistants:
+            by_name[_field(assistant, "name")].append(assistant)
+        with self._lock:
+            if generation == self._generation:
+                self._assistants, self._by_id, self._by_name = assistants, by_id, by_name
+                self._loaded_at = time.monotonic()
+        return assistants
+
+    def _is_stale(self) -> bool:
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at > self.ttl
+
+    def _ensure_fresh(self):
+        if not self._is_stale():
+            return
+        with self._refresh_lock:
+            # another thread may have refreshed while this one waited
+            if self._is_stale():
+                self._refresh()
+
+    def invalidate(self):
+        """Refresh on the next lookup."""
+        with self._lock:
+            self._generation += 1
+            self._loaded_at = None
+
+    def all(self):
+        """Return every assistant."""
+        self._ensure_fresh()
+        return list(self._assistants)
+
+    def get(self, assistant_id):
+        """Return the assistant with assistant_id, or None."""
+        self._ensure_fresh()
+        return self._by_id.get(assistant_id)
+
+    def by_name(self, name):
+        """Return the assistants called name."""
+        self._ensure_fresh()
+        return list(self._by_name.get(name, []))
+
+    def names(self):
+        """Return the name of every assistant."""
+        return [_field(assistant, "name") for assistant in self.all()]
+
+
+# Shared by the functions below
+catalog = AssistantCatalog()
+
+
 def list_assistants():
     """
     Return a list of all the available assistants.
@@ -22,15 +147,206 @@ def list_assistants():
     Returns:
         list: A list of assistant objects.
     """
-
-    assistant_object = openai.beta.assistants.list()
-    return assistant_object
+    return catalog.all()
 
 HEADERS = {
     "Authorization": f"Bearer {OPENAI_API_KEY}",
-    "Content-Type": "application/json"
+    "Content-Type": "application/json",
+    "OpenAI-Beta": "assistants=v2",
 }
 
+# Bulk operations: requests per second, burst size, worker threads and retries
+BULK_RATE = float(os.getenv("ASSISTANT_API_RATE", "5"))
+BULK_BURST = int(os.getenv("ASSISTANT_API_BURST", "10"))
+BULK_WORKERS = int(os.getenv("ASSISTANT_API_WORKERS", "8"))
+BULK_MAX_RETRIES = 5
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting the request rate, which a 429 response can pause.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        """
+        Parameters:
+            rate (float): Tokens added per second.
+            capacity (int): Most tokens held, i.e. the largest burst.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold every request for seconds, e.g. after a Retry-After header."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+@dataclass
+class BulkResult:
+    """The outcome of one item of a bulk operation."""
+    item: str
+    ok: bool
+    assistant_id: Optional[str] = None
+    status_code: Optional[int] = None
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def _pooled_session():
+    """
+    Return the session used by the bulk operations.
+
+    It retries connection errors only; 429 and 5xx responses are handled by
+    _rate_limited_request so a rate limit slows every worker down.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = PooledSession(retry_statuses=(), pool_maxsize=max(BULK_WORKERS, 10))
+            _http_session.headers.update(HEADERS)
+        return _http_session
+
+
+def _never_sent(error: requests.RequestException) -> bool:
+    """
+    Return True if error happened before the request reached the server.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def _rate_limited_request(bucket: TokenBucket, item: str, method: str, url: str, **kwargs) -> BulkResult:
+    """
+    Send one request through the bucket, retrying 429 and 5xx responses.
+
+    A request that is not idempotent, such as creating an assistant, may already
+    have taken effect after a 5xx response or a read error, so it is only retried
+    on 429 and on errors raised before it was sent.
+    """
+    session = _pooled_session()
+    result = BulkResult(item=item, ok=False)
+    idempotent = method.upper() in RETRY_METHODS
+    for attempt in range(1, BULK_MAX_RETRIES + 1):
+        result.attempts = attempt
+        bucket.acquire()
+        try:
+            response = session.request(method, url, timeout=10, **kwargs)
+        except requests.RequestException as e:
+            result.error = str(e)
+            if not idempotent and not _never_sent(e):
+                return result
+            time.sleep(min(2 ** attempt * 0.1, 5) * random.uniform(0.5, 1.5))
+            continue
+        result.status_code = response.status_code
+        if response.status_code >= 500 and not idempotent:
+            result.error = f"HTTP {response.status_code}"
+            return result
+        if response.status_code == 429 or response.status_code >= 500:
+            wait = retry_after(response) or min(2 ** attempt * 0.25, 10) * random.uniform(0.5, 1.5)
+            if response.status_code == 429:
+                # slow every worker down, not just this one
+                bucket.pause(wait)
+            else:
+                time.sleep(wait)
+            result.error = f"HTTP {response.status_code}"
+            continue
+        if response.ok:
+            result.ok = True
+            result.error = None
+            try:
+                result.assistant_id = response.json().get("id")
+            except (ValueError, AttributeError):
+                # the request succeeded, but its id is unknown
+                result.error = f"Unreadable response body: {response.text[:500]}"
+        else:
+            result.error = response.text[:500]
+        return result
+    return result
+
+
+def _run_bulk(tasks, max_workers: int) -> List[BulkResult]:
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(lambda task: task(), tasks))
+    catalog.invalidate()
+    return results
+
+
+def bulk_delete_assistants(assistant_ids: Iterable[str], max_workers: int = BULK_WORKERS,
+                           rate: float = BULK_RATE, burst: int = BULK_BURST) -> List[BulkResult]:
+    """
+    Delete assistants concurrently, within the API rate limit.
+
+    Parameters:
+        assistant_ids (iterable): The assistants to delete.
+        max_workers (int): Requests in flight at once.
+        rate (float): Requests per second.
+        burst (int): Requests allowed at once before the rate applies.
+
+    Returns:
+        list: A BulkResult per assistant, in the order given.
+    """
+    bucket = TokenBucket(rate, burst)
+    tasks = [
+        (lambda assistant_id=assistant_id: _rate_limited_request(
+            bucket, assistant_id, "DELETE", f"{BASE_URL}/{assistant_id}"))
+        for assistant_id in assistant_ids
+    ]
+    results = _run_bulk(tasks, max_workers)
+    for result in results:
+        if result.ok:
+            result.assistant_id = result.item
+    return results
+
+
+def bulk_create_assistants(specs: Iterable[dict], max_workers: int = BULK_WORKERS,
+                           rate: float = BULK_RATE, burst: int = BULK_BURST) -> List[BulkResult]:
+    """
+    Create assistants concurrently, within the API rate limit.
+
+    Parameters:
+        specs (iterable): Dicts with the create parameters of each assistant,
+            such as name, instructions, tools and model.
+        max_workers (int): Requests in flight at once.
+        rate (float): Requests per second.
+        burst (int): Requests allowed at once before the rate applies.
+
+    Returns:
+        list: A BulkResult per spec, in the order given, with the new assistant ids.
+    """
+    bucket = TokenBucket(rate, burst)
+    tasks = [
+        (lambda spec=spec: _rate_limited_request(bucket, spec.get("name", ""), "POST", BASE_URL, json=spec))
+        for spec in specs
+    ]
+    return _run_bulk(tasks, max_workers)
+
 def retrieve_assistants_by_name(name):
     """
     Retrieves a list of assistant objects that match the provided name.
@@ -43,13 +359,7 @@ def retrieve_assistants_by_name(name):
         list: A list of assistant objects that match the provided name.
     """
     try:
-        # Fetch all assistants
-        response = openai.beta.assistants.list()
-        assistants = response.get('data', [])
-
-        # Filter assistants by name
-        matching_assistants = [assistant for assistant in assistants if assistant['name'] == name]
-        return matching_assistants
+        return catalog.by_name(name)
     except Exception as e:
         print(f"Error retrieving assistants by name: {e}")
         return []
@@ -62,29 +372,33 @@ def get_assistant_names():
     Returns:
         list: A list of assistant names.
     """
-    assistant_object = openai.beta.assistants.list().data
-    assistant_names = []
-    for assistant in assistant_object:
-        assistant_names.append(assistant.name)
-    return assistant_names
+    return catalog.names()
 
 def delete_assistant(assistant_id):
     """Delete an assistant by ID."""
     delete_url = f"{BASE_URL}/{assistant_id}"
-    response = requests.delete(delete_url, headers=HEADERS, timeout=10)
+    response = http_session().delete(delete_url, headers=HEADERS, timeout=10)
 
     if response.status_code == 200:
+        catalog.invalidate()
         print(f"Deleted assistant with ID: {assistant_id}")
     else:
         print(f"Failed to delete assistant with ID: {assistant_id}. Status Code: {response.status_code}")
 
 
 def delete_all_assistants():
-    """Delete all assistants."""
-    a_list = list_assistants()
-    assitant_obj_list = a_list.data
-    for assistant in enumerate(assitant_obj_list):
-        delete_assistant(assistant[1].id)
+    """
+    Delete all assistants.
+
+    Returns:
+        list: A BulkResult per assistant.
+    """
+    catalog.invalidate()
+    results = bulk_delete_assistants([_field(assistant, "id") for assistant in list_assistants()])
+    for result in results:
+        if not result.ok:
+            print(f"Failed to delete assistant with ID: {result.item}. {result.error}")
+    return results
 
 def select_assistant(assistant_id):
     """
@@ -98,7 +412,7 @@ def select_assistant(assistant_id):
     """
     # Use the 'beta.assistants' attribute, not 'Assistant'
     assistant = openai.beta.assistants.retrieve(assistant_id)
-    return assistant.id
+    return _field(assistant, "id")
 
 def create_assistant(name, instructions, tools, model):
     """
@@ -119,7 +433,8 @@ def create_assistant(name, instructions, tools, model):
         tools=tools,
         model=model
     )
-    return assistant.id  # Return the assistant ID
+    catalog.invalidate()
+    return _field(assistant, "id")  # Return the assistant ID
 
 
 
@@ -134,7 +449,7 @@ def get_assistant_by_id(assistant_id):
         str: The ID of the retrieved assistant.
     """
     assistant = openai.beta.assistants.retrieve(assistant_id)
-    return assistant.id
+    return _field(assistant, "id")
 
 
 def create_thread():
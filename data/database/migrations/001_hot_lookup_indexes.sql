@@ -0,0 +1,9 @@
+-- 001_hot_lookup_indexes.sql
+-- Composite indexes for the hot lookup paths declared on the models in db_operations.py.
+
+CREATE INDEX IF NOT EXISTS ix_messages_threadid_timestamp ON messages (threadid, "timestamp");
+CREATE INDEX IF NOT EXISTS ix_chat_history_chat_id_timestamp ON chat_history (chat_id, "timestamp");
+CREATE INDEX IF NOT EXISTS ix_tasks_assigned_agent_id_status ON tasks (assigned_agent_id, status);
+CREATE INDEX IF NOT EXISTS ix_agent_api_calls_agent_id_call_time ON agent_api_calls (agent_id, call_time);
+CREATE INDEX IF NOT EXISTS ix_system_logs_timestamp ON system_logs ("timestamp");
+CREATE INDEX IF NOT EXISTS ix_system_logs_service_name_timestamp ON system_logs (service_name, "timestamp");
@@ -0,0 +1,92 @@
+-- 002_monthly_partition_functions.sql
+-- Helpers for range-partitioning append-heavy tables by month.
+--
+-- create_monthly_partitions(table, from, months) adds one partition per month
+-- and is safe to run repeatedly; migrate.py --ensure-partitions calls it to keep
+-- partitions created ahead of time.
+--
+-- partition_table_by_month(table, column, key) converts an existing table in
+-- place: the old table is renamed, a partitioned copy is created with the
+-- primary key widened to (key, column), monthly partitions are created from the
+-- oldest row up to a few months ahead plus a default partition, the rows are
+-- copied and the old table is dropped. Postgres requires the partition column in
+-- every unique constraint, so foreign keys that point at the table are dropped.
+-- Rows with a NULL partition column are stored with the epoch timestamp, which
+-- lands them in the default partition.
+
+CREATE OR REPLACE FUNCTION create_monthly_partitions(p_table text, p_from date, p_months integer)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_start date := date_trunc('month', p_from)::date;
+    v_end date;
+BEGIN
+    FOR i IN 1 .. p_months LOOP
+        v_end := (v_start + interval '1 month')::date;
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+            p_table || '_' || to_char(v_start, 'YYYY_MM'), p_table, v_start, v_end
+        );
+        v_start := v_end;
+    END LOOP;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION partition_table_by_month(
+    p_table text,
+    p_column text,
+    p_key text,
+    p_months_ahead integer DEFAULT 3
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_old text := p_table || '_unpartitioned';
+    v_sequence text;
+    v_first date;
+    v_months integer;
+    v_fk record;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = p_table::regclass) THEN
+        RETURN;
+    END IF;
+
+    FOR v_fk IN
+        SELECT conname, conrelid::regclass AS referencing_table
+        FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = p_table::regclass
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', v_fk.referencing_table, v_fk.conname);
+    END LOOP;
+
+    v_sequence := pg_get_serial_sequence(p_table, p_key);
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', p_table, v_old);
+    -- free the primary key name for the partitioned table
+    FOR v_fk IN
+        SELECT conname FROM pg_constraint WHERE contype = 'p' AND conrelid = v_old::regclass
+    LOOP
+        EXECUTE format('ALTER TABLE %I DROP CONSTRAINT %I', v_old, v_fk.conname);
+    END LOOP;
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS) PARTITION BY RANGE (%I)', p_table, v_old, p_column);
+    EXECUTE format('ALTER TABLE %I ALTER COLUMN %I SET NOT NULL, ALTER COLUMN %I SET DEFAULT now()',
+                   p_table, p_column, p_column);
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (%I, %I)', p_table, p_key, p_column);
+    IF v_sequence IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.%I', v_sequence, p_table, p_key);
+    END IF;
+
+    EXECUTE format('SELECT min(%I)::date FROM %I', p_column, v_old) INTO v_first;
+    v_first := date_trunc('month', coalesce(v_first, now()))::date;
+    v_months := (extract(year FROM age(date_trunc('month', now()), v_first)) * 12
+                 + extract(month FROM age(date_trunc('month', now()), v_first)))::integer
+                + 1 + p_months_ahead;
+    PERFORM create_monthly_partitions(p_table, v_first, v_months);
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I DEFAULT', p_table || '_default', p_table);
+
+    EXECUTE format('UPDATE %I SET %I = %L WHERE %I IS NULL', v_old, p_column, 'epoch', p_column);
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', p_table, v_old);
+    EXECUTE format('DROP TABLE %I', v_old);
+END;
+$$;
@@ -0,0 +1,7 @@
+-- 003_partition_messages.sql
+-- Partition messages by month on "timestamp". Drops the chat_history.message_id
+-- foreign key, see 002_monthly_partition_functions.sql.
+
+SELECT partition_table_by_month('messages', 'timestamp', 'messageid');
+
+CREATE INDEX IF NOT EXISTS ix_messages_threadid_timestamp ON messages (threadid, "timestamp");
@@ -0,0 +1,6 @@
+-- 004_partition_agent_api_calls.sql
+-- Partition agent_api_calls by month on call_time.
+
+SELECT partition_table_by_month('agent_api_calls', 'call_time', 'api_call_id');
+
+CREATE INDEX IF NOT EXISTS ix_agent_api_calls_agent_id_call_time ON agent_api_calls (agent_id, call_time);
@@ -0,0 +1,7 @@
+-- 005_partition_system_logs.sql
+-- Partition system_logs by month on "timestamp".
+
+SELECT partition_table_by_month('system_logs', 'timestamp', 'log_id');
+
+CREATE INDEX IF NOT EXISTS ix_system_logs_timestamp ON system_logs ("timestamp");
+CREATE INDEX IF NOT EXISTS ix_system_logs_service_name_timestamp ON system_logs (service_name, "timestamp");
@@ -0,0 +1,18 @@
+-- 006_cache_data_unique_key.sql
+-- cache_data is upserted on cache_key by cache_service.py, which needs a unique
+-- constraint. Keep the longest-lived row of any duplicated key before adding it.
+
+DELETE FROM cache_data a
+USING cache_data b
+WHERE a.cache_key = b.cache_key
+  AND (coalesce(a.expiry_time, 'infinity'), a.cache_id) < (coalesce(b.expiry_time, 'infinity'), b.cache_id);
+
+-- init_db() already creates the constraint on new databases
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'cache_data_cache_key_key') THEN
+        ALTER TABLE cache_data ADD CONSTRAINT cache_data_cache_key_key UNIQUE (cache_key);
+    END IF;
+END;
+$$;
+CREATE INDEX IF NOT EXISTS ix_cache_data_expiry_time ON cache_data (expiry_time);
@@ -0,0 +1,21 @@
+-- 007_thread_registry.sql
+-- Columns used by gbts/thread_registry.py to keep GaiaAssistant's OpenAI threads
+-- and read positions across restarts and replicas.
+
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS openai_thread_id VARCHAR(255);
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS openai_assistant_id VARCHAR(255);
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS agent_name VARCHAR(255);
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS unread_index INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE threads ADD COLUMN IF NOT EXISTS last_message_id VARCHAR(255);
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'threads_openai_thread_id_key') THEN
+        ALTER TABLE threads ADD CONSTRAINT threads_openai_thread_id_key UNIQUE (openai_thread_id);
+    END IF;
+END;
+$$;
+CREATE UNIQUE INDEX IF NOT EXISTS ix_threads_openai_assistant_id_agent_name
+    ON threads (openai_assistant_id, agent_name);
+
+ALTER TABLE runs ADD COLUMN IF NOT EXISTS openai_run_id VARCHAR(255);
+CREATE INDEX IF NOT EXISTS ix_runs_openai_run_id ON runs (openai_run_id);
@@ -0,0 +1,64 @@
+-- 008_notion_change_feed.sql
+-- Row change notifications consumed by data/intergration/notion_cdc.py, which
+-- mirrors the assistants, threads, runs and tools tables into Notion.
+--
+-- Every committed insert, update and delete sends a JSON payload on the
+-- '<table>_changes' channel:
+--   {"table", "op", "key", "id", "ts", "row"}
+-- where key names the primary key column, id is its value and ts is the epoch
+-- time of the change. NOTIFY payloads must stay under 8000 bytes, so larger
+-- rows are sent without "row" and with "truncated": true; the consumer reads
+-- those rows back from the table.
+
+CREATE OR REPLACE FUNCTION notify_row_change() RETURNS trigger AS $$
+DECLARE
+    row_data jsonb;
+    payload text;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+    payload := jsonb_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'key', TG_ARGV[0],
+        'id', row_data -> TG_ARGV[0],
+        'ts', extract(epoch FROM clock_timestamp()),
+        'row', row_data
+    )::text;
+    IF octet_length(payload) > 7900 THEN
+        payload := jsonb_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'key', TG_ARGV[0],
+            'id', row_data -> TG_ARGV[0],
+            'ts', extract(epoch FROM clock_timestamp()),
+            'truncated', true
+        )::text;
+    END IF;
+    PERFORM pg_notify(TG_TABLE_NAME || '_changes', payload);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS assistants_notify_changes ON assistants;
+CREATE TRIGGER assistants_notify_changes
+    AFTER INSERT OR UPDATE OR DELETE ON assistants
+    FOR EACH ROW EXECUTE FUNCTION notify_row_change('id');
+
+DROP TRIGGER IF EXISTS threads_notify_changes ON threads;
+CREATE TRIGGER threads_notify_changes
+    AFTER INSERT OR UPDATE OR DELETE ON threads
+    FOR EACH ROW EXECUTE FUNCTION notify_row_change('id');
+
+DROP TRIGGER IF EXISTS runs_notify_changes ON runs;
+CREATE TRIGGER runs_notify_changes
+    AFTER INSERT OR UPDATE OR DELETE ON runs
+    FOR EACH ROW EXECUTE FUNCTION notify_row_change('id');
+
+DROP TRIGGER IF EXISTS tools_notify_changes ON tools;
+CREATE TRIGGER tools_notify_changes
+    AFTER INSERT OR UPDATE OR DELETE ON tools
+    FOR EACH ROW EXECUTE FUNCTION notify_row_change('tool_id');
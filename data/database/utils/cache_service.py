@@ -0,0 +1,325 @@
+# /data/database/utils/cache_service.py
+"""
+cache_service.py is a two-tier cache for values shared between processes.
+
+L1 is an in-process TTLCache. L2 is the cache_data table (CacheData), so a
+value computed by one worker, such as an LLM response or a Notion lookup, is
+reused by every other worker until it expires. Values are stored in the JSON
+cache_value column and must be JSON serialisable.
+
+    cache = CacheService()
+    answer = cache.get_or_compute("notion:page:123", lambda: fetch_page("123"), ttl=600)
+
+get_or_compute only lets one caller compute a missing key at a time: callers
+in the same process wait on a lock for that key, and on PostgreSQL callers in
+other processes wait on a session-level advisory lock for the key. No
+transaction is open while compute runs, so a slow computation never holds row
+locks or leaves a connection idle in transaction.
+"""
+import datetime
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from logging import getLogger
+from typing import Any, Callable, Dict, Iterator, Optional
+from sqlalchemy import delete, select, text
+
+from data.database.utils.setconn import Session
+from data.database.utils.db_operations import CacheData
+from data.database.utils.ttl_cache import TTLCache, MISSING
+
+logger = getLogger(__name__)
+
+
+def _utcnow() -> datetime.datetime:
+    """
+    Return the current UTC time as a naive datetime, matching the TIMESTAMP column.
+    """
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class CacheStats:
+    """Hit and miss counters for a CacheService."""
+    l1_hits: int = 0
+    l2_hits: int = 0
+    misses: int = 0
+    sets: int = 0
+    computes: int = 0
+    purged: int = 0
+    l1_evictions: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, **counts: int) -> None:
+        """Increment counters, safely from any thread."""
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def set(self, **values: int) -> None:
+        """Overwrite counters, safely from any thread."""
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, value)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Return the counters as a dict."""
+        with self._lock:
+            return {f.name: getattr(self, f.name) for f in fields(self) if not f.name.startswith("_")}
+
+    @property
+    def hit_ratio(self) -> float:
+        """Fraction of lookups answered by either tier."""
+        with self._lock:
+            lookups = self.l1_hits + self.l2_hits + self.misses
+            return (self.l1_hits + self.l2_hits) / lookups if lookups else 0.0
+
+
+class CacheService:
+    """
+    In-process LRU cache in front of the cache_data table.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        l1_size: int = 1024,
+        default_ttl: float = 300.0,
+        namespace: str = "",
+        purge_interval: Optional[float] = None,
+    ):
+        """
+        Args:
+            session_factory (callable): Returns a new Session. Defaults to setconn.Session.
+            l1_size (int): Maximum number of entries kept in process.
+            default_ttl (float): Time to live in seconds when set is not given one.
+            namespace (str): Prefix added to every key, to keep callers apart.
+            purge_interval (float): If given, delete expired cache_data rows every
+                purge_interval seconds from a background thread.
+        """
+        self.session_factory = session_factory or Session
+        self.default_ttl = default_ttl
+        self.namespace = namespace
+        self.stats = CacheStats()
+        self._l1 = TTLCache(max_size=l1_size, ttl=default_ttl)
+        # key -> [lock, number of callers using it], for get_or_compute
+        self._key_locks: Dict[str, list] = {}
+        self._key_locks_guard = threading.Lock()
+        self._stop_purger = threading.Event()
+        self._purger = None
+        if purge_interval:
+            self.start_purger(purge_interval)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}{key}"
+
+    @contextmanager
+    def _key_lock(self, key: str) -> Iterator[None]:
+        """
+        Hold the in-process lock for key, dropping it once no caller needs it.
+        """
+        with self._key_locks_guard:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._key_locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    @contextmanager
+    def _advisory_lock(self, key: str) -> Iterator[Callable]:
+        """
+        On PostgreSQL, hold a session-level advisory lock for key across processes.
+
+        The lock belongs to a connection rather than a transaction, so it is held
+        on a dedicated connection that commits after every statement.
+
+        Yields:
+            callable: The session factory to use while the lock is held.
+        """
+        with self.session_factory() as db_session:
+            bind = db_session.get_bind()
+        if bind.dialect.name != "postgresql":
+            yield self.session_factory
+            return
+        with bind.connect() as connection:
+            lock_id = {"key": key}
+            connection.execute(text("SELECT pg_advisory_lock(hashtextextended(:key, 0))"), lock_id)
+            connection.commit()
+            try:
+                yield lambda: self.session_factory(bind=connection)
+            finally:
+                try:
+                    connection.rollback()
+                    connection.execute(text("SELECT pg_advisory_unlock(hashtextextended(:key, 0))"), lock_id)
+                    connection.commit()
+                except Exception:
+                    # never hand a connection that may still hold the lock back to the pool
+                    connection.invalidate()
+                    raise
+
+    def _read_l2(self, db_session, key: str) -> Any:
+        """
+        Return the unexpired L2 value for key and store it in L1, or MISSING.
+        """
+        row = db_session.execute(
+            select(CacheData.cache_value, CacheData.expiry_time).where(CacheData.cache_key == key)
+        ).first()
+        if row is None:
+            return MISSING
+        now = _utcnow()
+        if row.expiry_time is not None and row.expiry_time <= now:
+            return MISSING
+        ttl = (row.expiry_time - now).total_seconds() if row.expiry_time is not None else None
+        self._l1_set(key, row.cache_value, ttl)
+        return row.cache_value
+
+    def _l1_set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        self._l1.set(key, value, ttl=ttl)
+        self.stats.set(l1_evictions=self._l1.evictions)
+
+    def _write_l2(self, db_session, key: str, value: Any, ttl: Optional[float]) -> None:
+        """
+        Upsert key into cache_data without committing.
+        """
+        expiry_time = _utcnow() + datetime.timedelta(seconds=ttl) if ttl is not None else None
+        CacheData.bulk_upsert(
+            db_session,
+            [{"cache_key": key, "cache_value": value, "expiry_time": expiry_time}],
+            conflict_columns=["cache_key"],
+            commit=False,
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Return the cached value for key from L1, falling back to L2.
+
+        Returns:
+            The cached value, or default if the key is missing or expired in both tiers.
+        """
+        key = self._key(key)
+        value = self._l1.get(key)
+        if value is not MISSING:
+            self.stats.add(l1_hits=1)
+            return value
+        with self.session_factory() as db_session:
+            value = self._read_l2(db_session, key)
+        if value is MISSING:
+            self.stats.add(misses=1)
+            return default
+        self.stats.add(l2_hits=1)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store value in both tiers.
+
+        Args:
+            key (str): The cache key.
+            value: A JSON serialisable value.
+            ttl (float): Time to live in seconds. Defaults to default_ttl.
+        """
+        key = self._key(key)
+        ttl = self.default_ttl if ttl is None else ttl
+        with self.session_factory() as db_session:
+            self._write_l2(db_session, key, value, ttl)
+            db_session.commit()
+        self._l1_set(key, value, ttl)
+        self.stats.add(sets=1)
+
+    def delete(self, key: str) -> None:
+        """
+        Remove key from both tiers.
+        """
+        key = self._key(key)
+        self._l1.delete(key)
+        with self.session_factory() as db_session:
+            db_session.execute(delete(CacheData).where(CacheData.cache_key == key))
+            db_session.commit()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Return the cached value for key, computing and storing it if it is missing.
+
+        Only one caller computes a given key at a time. Others wait and then read
+        the stored result instead of calling compute themselves.
+
+        Args:
+            key (str): The cache key.
+            compute (callable): Called with no arguments to produce a missing value.
+            ttl (float): Time to live in seconds. Defaults to default_ttl.
+
+        Returns:
+            The cached or freshly computed value.
+        """
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+
+        full_key = self._key(key)
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._key_lock(full_key):
+            value = self._l1.get(full_key)
+            if value is not MISSING:
+                self.stats.add(l1_hits=1)
+                return value
+            with self._advisory_lock(full_key) as session_factory:
+                # another process may have stored it while we waited for the lock
+                with session_factory() as db_session:
+                    value = self._read_l2(db_session, full_key)
+                if value is not MISSING:
+                    self.stats.add(l2_hits=1)
+                    return value
+                value = compute()
+                self.stats.add(computes=1)
+                with session_factory() as db_session:
+                    self._write_l2(db_session, full_key, value, ttl)
+                    db_session.commit()
+            self._l1_set(full_key, value, ttl)
+            self.stats.add(sets=1)
+            return value
+
+    def purge_expired(self) -> int:
+        """
+        Delete expired rows from cache_data.
+
+        Returns:
+            int: The number of rows deleted.
+        """
+        with self.session_factory() as db_session:
+            result = db_session.execute(delete(CacheData).where(CacheData.expiry_time <= _utcnow()))
+            db_session.commit()
+        self.stats.add(purged=result.rowcount)
+        return result.rowcount
+
+    def start_purger(self, interval: float) -> None:
+        """
+        Start a daemon thread calling purge_expired every interval seconds.
+        """
+        if self._purger is not None:
+            return
+
+        def run():
+            while not self._stop_purger.wait(interval):
+                try:
+                    purged = self.purge_expired()
+                    if purged:
+                        logger.info("Purged %d expired cache rows", purged)
+                except Exception:
+                    logger.exception("Purging expired cache rows failed")
+
+        self._purger = threading.Thread(target=run, name="cache-purger", daemon=True)
+        self._purger.start()
+
+    def close(self) -> None:
+        """
+        Stop the background purger, if running.
+        """
+        self._stop_purger.set()
+        if self._purger is not None:
+            self._purger.join()
+            self._purger = None
@@ -3,9 +3,14 @@
 db_operations.py is a file that contains all the database operations for the Agent_DB.
 each table in the database is mapped to a class in the db_operations.py file.
 """
-from sqlalchemy import Column, Integer, String, ForeignKey, MetaData
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+from sqlalchemy import Column, Integer, String, ForeignKey, MetaData, Index
 from sqlalchemy import TIMESTAMP, JSON, Boolean, Text
-from data.database.utils.setconn import session, Base, engine
+from sqlalchemy import insert, select, and_, or_, func
+from sqlalchemy import Sequence as DBSequence
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from data.database.utils.setconn import session, Base, get_engine
 from logging import getLogger, StreamHandler, INFO, Formatter, FileHandler, basicConfig
 
 
@@ -30,8 +35,25 @@ file_handler.setFormatter(file_formatter)
 logger.addHandler(console_handler)
 logger.addHandler(file_handler)
 
-# Create a session object
-conn = session(Base, engine)
+# Thread-local session registry, also used to annotate session arguments
+conn = session
+
+# Number of rows sent per transaction by the bulk helpers
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _batched(rows: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Split an iterable of row dicts into lists of at most batch_size rows.
+    """
+    batch = []
+    for row in rows:
+        batch.append(dict(row))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 class BaseCRUD:
     """
@@ -64,17 +86,17 @@ class BaseCRUD:
     @classmethod
     def read(cls, session: conn, record_id: int):
         """
-        Read a record from the database based on the given id.
+        Read a record from the database based on its primary key.
 
         :param session: The session object to use for the database query.
         :type session: Session
-        :param id: The id of the record to retrieve.
-        :type id: int
-        :return: The first record found with the given id, or None if no record is found.
+        :param record_id: The primary key of the record to retrieve, a tuple for composite keys.
+        :type record_id: int
+        :return: The record with the given primary key, or None if no record is found.
         :rtype: object
         """
         logger.info("Reading record: %s", record_id, extra={'record_id': record_id})
-        return session.query(cls).filter_by(record_id=record_id).first()
+        return session.get(cls, record_id)
 
 
     @classmethod
@@ -84,13 +106,13 @@ class BaseCRUD:
 
         Args:
             session (Session): The database session.
-            record_id (int): The ID of the record to be updated.
+            record_id (int): The primary key of the record to be updated.
             **kwargs: Variable keyword arguments for the record attributes to be updated.
 
         Returns:
             instance: The updated instance of the record if it exists, otherwise None.
         """
-        instance = session.query(cls).filter_by(record_id=record_id).first()
+        instance = session.get(cls, record_id)
         if instance:
             for attr, value in kwargs.items():
                 setattr(instance, attr, value)
@@ -109,9 +131,9 @@ class BaseCRUD:
 
         Args:
             session (Session): The database session.
-            record_id (int): The ID of the record to be deleted.
+            record_id (int): The primary key of the record to be deleted.
         """
-        instance = session.query(cls).filter_by(record_id=record_id).first()
+        instance = session.get(cls, record_id)
         if instance:
             session.delete(instance)
             session.commit()
@@ -121,6 +143,416 @@ class BaseCRUD:
             # handle the case where the record does not exist
             pass
 
+    @classmethod
+    def _primary_key_columns(cls):
+        """
+        Return the primary key columns of the mapped table.
+        """
+        return list(cls.__mapper__.primary_key)
+
+    @classmethod
+    def _insert_statement(
+        cls,
+        dialect_name: str,
+        conflict_columns: Optional[Sequence[str]] = None,
+        update_columns: Optional[Sequence[str]] = None,
+    ):
+        """
+        Build a multi-row INSERT for the class, optionally with an ON CONFLICT clause.
+
+        Args:
+            dialect_name (str): Name of the dialect the statement will run on.
+            conflict_columns (list): Columns of the unique constraint used for the upsert.
+                When None a plain INSERT is returned.
+            update_columns (list): Columns overwritten when a conflict occurs.
+                An empty list turns the upsert into ON CONFLICT DO NOTHING.
+
+        Returns:
+            Insert: The insert statement returning the primary key columns.
+        """
+        pk_columns = cls._primary_key_columns()
+        if conflict_columns is None:
+            return insert(cls).returning(*pk_columns, sort_by_parameter_order=True)
+        if dialect_name == "postgresql":
+            stmt = postgresql.insert(cls)
+        elif dialect_name == "sqlite":
+            stmt = sqlite.insert(cls)
+        else:
+            raise NotImplementedError(f"bulk_upsert is not supported on the {dialect_name} dialect")
+        if update_columns:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(conflict_columns),
+                set_={column: stmt.excluded[column] for column in update_columns},
+            )
+            return stmt.returning(*pk_columns, sort_by_parameter_order=True)
+        # skipped rows return nothing, so the returned keys cannot be matched to the input order
+        return stmt.on_conflict_do_nothing(index_elements=list(conflict_columns)).returning(*pk_columns)
+
+    @classmethod
+    def _execute_batches(cls, session: conn, rows, batch_size: int, commit: bool, stmt_factory) -> List[Any]:
+        """
+        Run an insert statement over rows in batches and collect the returned primary keys.
+
+        Each batch is executed as a single executemany, which SQLAlchemy renders as
+        multi-row INSERT ... VALUES statements, and committed as its own transaction
+        when commit is True.
+        """
+        single_pk = len(cls._primary_key_columns()) == 1
+        primary_keys = []
+        for batch in _batched(rows, batch_size):
+            stmt = stmt_factory(session.get_bind().dialect.name, batch)
+            try:
+                result = session.execute(stmt, batch)
+                primary_keys.extend(row[0] if single_pk else tuple(row) for row in result)
+                if commit:
+                    session.commit()
+            except Exception:
+                session.rollback()
+                logger.exception("Bulk write of %d %s records failed", len(batch), cls.__tablename__)
+                raise
+            logger.info("Bulk wrote %d %s records", len(batch), cls.__tablename__)
+        return primary_keys
+
+    @classmethod
+    def bulk_create(
+        cls,
+        session: conn,
+        rows: Iterable[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        commit: bool = True,
+    ) -> List[Any]:
+        """
+        Insert many records using batched, multi-row INSERT statements.
+
+        Args:
+            session (Session): The database session.
+            rows (iterable): Dicts of column attribute names to values, one per record.
+            batch_size (int): Number of rows written per transaction.
+            commit (bool): Commit after every batch. Pass False to run inside a
+                transaction managed by the caller.
+
+        Returns:
+            list: The generated primary keys in the order of rows. Tables with a
+            composite primary key return tuples.
+        """
+        return cls._execute_batches(
+            session, rows, batch_size, commit,
+            lambda dialect_name, batch: cls._insert_statement(dialect_name),
+        )
+
+    @classmethod
+    def bulk_upsert(
+        cls,
+        session: conn,
+        rows: Iterable[Dict[str, Any]],
+        conflict_columns: Optional[Sequence[str]] = None,
+        update_columns: Optional[Sequence[str]] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        commit: bool = True,
+    ) -> List[Any]:
+        """
+        Insert many records, updating the existing row when a unique constraint conflicts.
+
+        Args:
+            session (Session): The database session.
+            rows (iterable): Dicts of column attribute names to values, one per record.
+            conflict_columns (list): Columns of the unique constraint to upsert on.
+                Defaults to the primary key.
+            update_columns (list): Columns to overwrite on conflict. Defaults to every
+                column supplied in the batch except the conflict columns. Pass an empty
+                list to skip conflicting rows instead (ON CONFLICT DO NOTHING).
+            batch_size (int): Number of rows written per transaction.
+            commit (bool): Commit after every batch.
+
+        Returns:
+            list: The primary keys of the inserted or updated records. Skipped rows
+            are not returned.
+        """
+        return cls._execute_batches(
+            session, rows, batch_size, commit, cls._upsert_factory(conflict_columns, update_columns)
+        )
+
+    @classmethod
+    def _upsert_factory(cls, conflict_columns, update_columns):
+        """
+        Return a callable building the upsert statement for a batch of rows.
+        """
+        if conflict_columns is None:
+            conflict_columns = [column.key for column in cls._primary_key_columns()]
+
+        def stmt_factory(dialect_name, batch):
+            columns = update_columns
+            if columns is None:
+                supplied = {key for row in batch for key in row}
+                columns = sorted(supplied - set(conflict_columns))
+            return cls._insert_statement(dialect_name, conflict_columns, columns)
+
+        return stmt_factory
+
+    @classmethod
+    def _keyset_scans(
+        cls,
+        filters: Union[Dict[str, Any], Sequence[Any], None],
+        order_by: Union[str, Any, None],
+        descending: bool,
+    ) -> List[tuple]:
+        """
+        Build the queries and ordering columns used by iter_rows and aiter_rows.
+
+        NULL sorts differently per backend and cannot be compared against, so
+        when ordering by a column other than the primary key the rows are read
+        in two scans: those with an order_by value, then those without one in
+        primary key order. NULLs therefore always come last.
+
+        Returns:
+            list: (select statement, key columns) pairs to page through in turn.
+            The key columns are the order_by column first, followed by the
+            primary key as a tie-breaker.
+        """
+        pk_columns = cls._primary_key_columns()
+        stmt = select(cls)
+        if isinstance(filters, dict):
+            stmt = stmt.filter_by(**filters)
+        elif filters is not None:
+            stmt = stmt.where(*filters)
+
+        def ordered(query, key_columns):
+            return query.order_by(*[c.desc() if descending else c.asc() for c in key_columns]), key_columns
+
+        if order_by is None:
+            return [ordered(stmt, pk_columns)]
+        order_column = getattr(cls, order_by) if isinstance(order_by, str) else order_by
+        order_column = order_column.expression if hasattr(order_column, "expression") else order_column
+        if any(order_column is c for c in pk_columns):
+            return [ordered(stmt, [order_column] + [c for c in pk_columns if c is not order_column])]
+        return [
+            ordered(stmt.where(order_column.is_not(None)), [order_column] + pk_columns),
+            ordered(stmt.where(order_column.is_(None)), pk_columns),
+        ]
+
+    @staticmethod
+    def _keyset_after(key_columns, last_key, descending: bool):
+        """
+        Build the condition selecting rows that sort after last_key.
+
+        Expands (a, b) > (x, y) to a > x OR (a = x AND b > y), which every backend supports.
+        """
+        clauses = []
+        for index, column in enumerate(key_columns):
+            beyond = column < last_key[index] if descending else column > last_key[index]
+            equal = [key_columns[i] == last_key[i] for i in range(index)]
+            clauses.append(and_(*equal, beyond))
+        return or_(*clauses)
+
+    @classmethod
+    def iter_rows(
+        cls,
+        session: conn,
+        filters: Union[Dict[str, Any], Sequence[Any], None] = None,
+        order_by: Union[str, Any, None] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        descending: bool = False,
+    ) -> Iterator[Any]:
+        """
+        Lazily yield every matching record using keyset pagination.
+
+        Each page is a separate query that starts after the last key seen, so
+        memory use and query cost stay constant however large the table is.
+        Rows within a page are streamed through a server-side cursor.
+
+        Args:
+            session (Session): The database session.
+            filters (dict or list): Either keyword filters passed to filter_by,
+                for example {"threadid": 7}, or a list of SQL expressions such as
+                [Message.timestamp >= start].
+            order_by (str or column): Column to order by, for example "timestamp".
+                The primary key is always added as a tie-breaker. Defaults to the
+                primary key. Rows whose order_by value is NULL come last, in
+                primary key order.
+            batch_size (int): Number of rows fetched per page.
+            descending (bool): Iterate from the highest key down.
+
+        Yields:
+            The records in key order.
+        """
+        for stmt, key_columns in cls._keyset_scans(filters, order_by, descending):
+            last_key = None
+            while True:
+                page = stmt if last_key is None else stmt.where(cls._keyset_after(key_columns, last_key, descending))
+                page = page.limit(batch_size).execution_options(yield_per=batch_size)
+                count = 0
+                for record in session.scalars(page):
+                    count += 1
+                    last_key = cls._key_of(record, key_columns)
+                    yield record
+                if count < batch_size:
+                    break
+
+    @classmethod
+    def _key_of(cls, record, key_columns) -> tuple:
+        """
+        Read the values of key_columns from a loaded record.
+        """
+        mapper = cls.__mapper__
+        return tuple(getattr(record, mapper.get_property_by_column(column).key) for column in key_columns)
+
+    # Async counterparts, for use with an AsyncSession from setconn.async_session_scope()
+
+    @classmethod
+    async def acreate(cls, session: AsyncSession, **kwargs):
+        """
+        Create a new record from kwargs and commit it.
+
+        Args:
+            session (AsyncSession): The async database session.
+            **kwargs: Column attribute names and values of the new record.
+
+        Returns:
+            The newly created instance.
+        """
+        instance = cls(**kwargs)
+        session.add(instance)
+        await session.commit()
+        await session.refresh(instance)
+        logger.info("Created record: %s", instance)
+        return instance
+
+    @classmethod
+    async def aread(cls, session: AsyncSession, record_id):
+        """
+        Read a record by its primary key.
+
+        Args:
+            session (AsyncSession): The async database session.
+            record_id: The primary key of the record.
+
+        Returns:
+            The record, or None if no record is found.
+        """
+        logger.info("Reading record: %s", record_id, extra={'record_id': record_id})
+        return await session.get(cls, record_id)
+
+    @classmethod
+    async def aupdate(cls, session: AsyncSession, record_id, **kwargs):
+        """
+        Update an existing record with the given kwargs.
+
+        Args:
+            session (AsyncSession): The async database session.
+            record_id: The primary key of the record to update.
+            **kwargs: Column attribute names and their new values.
+
+        Returns:
+            The updated instance if it exists, otherwise None.
+        """
+        instance = await session.get(cls, record_id)
+        if instance is None:
+            return None
+        for attr, value in kwargs.items():
+            setattr(instance, attr, value)
+        await session.commit()
+        logger.info("Updated record: %s", instance, extra={'record_id': record_id})
+        return instance
+
+    @classmethod
+    async def adelete(cls, session: AsyncSession, record_id) -> bool:
+        """
+        Delete a record by its primary key.
+
+        Args:
+            session (AsyncSession): The async database session.
+            record_id: The primary key of the record to delete.
+
+        Returns:
+            bool: True if a record was deleted.
+        """
+        instance = await session.get(cls, record_id)
+        if instance is None:
+            return False
+        await session.delete(instance)
+        await session.commit()
+        logger.info("Deleted record: %s", instance, extra={'record_id': record_id})
+        return True
+
+    @classmethod
+    async def _aexecute_batches(cls, session: AsyncSession, rows, batch_size: int, commit: bool, stmt_factory) -> List[Any]:
+        """
+        Async version of _execute_batches.
+        """
+        single_pk = len(cls._primary_key_columns()) == 1
+        primary_keys = []
+        for batch in _batched(rows, batch_size):
+            stmt = stmt_factory(session.get_bind().dialect.name, batch)
+            try:
+                result = await session.execute(stmt, batch)
+                primary_keys.extend(row[0] if single_pk else tuple(row) for row in result)
+                if commit:
+                    await session.commit()
+            except Exception:
+                await session.rollback()
+                logger.exception("Bulk write of %d %s records failed", len(batch), cls.__tablename__)
+                raise
+            logger.info("Bulk wrote %d %s records", len(batch), cls.__tablename__)
+        return primary_keys
+
+    @classmethod
+    async def abulk_create(
+        cls,
+        session: AsyncSession,
+        rows: Iterable[Dict[str, Any]],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        commit: bool = True,
+    ) -> List[Any]:
+        """
+        Async version of bulk_create.
+        """
+        return await cls._aexecute_batches(
+            session, rows, batch_size, commit,
+            lambda dialect_name, batch: cls._insert_statement(dialect_name),
+        )
+
+    @classmethod
+    async def abulk_upsert(
+        cls,
+        session: AsyncSession,
+        rows: Iterable[Dict[str, Any]],
+        conflict_columns: Optional[Sequence[str]] = None,
+        update_columns: Optional[Sequence[str]] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        commit: bool = True,
+    ) -> List[Any]:
+        """
+        Async version of bulk_upsert.
+        """
+        return await cls._aexecute_batches(
+            session, rows, batch_size, commit, cls._upsert_factory(conflict_columns, update_columns)
+        )
+
+
+    @classmethod
+    async def aiter_rows(
+        cls,
+        session: AsyncSession,
+        filters: Union[Dict[str, Any], Sequence[Any], None] = None,
+        order_by: Union[str, Any, None] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        descending: bool = False,
+    ) -> AsyncIterator[Any]:
+        """
+        Async version of iter_rows, streaming each page with session.stream_scalars.
+        """
+        for stmt, key_columns in cls._keyset_scans(filters, order_by, descending):
+            last_key = None
+            while True:
+                page = stmt if last_key is None else stmt.where(cls._keyset_after(key_columns, last_key, descending))
+                page = page.limit(batch_size).execution_options(yield_per=batch_size)
+                count = 0
+                async for record in await session.stream_scalars(page):
+                    count += 1
+                    last_key = cls._key_of(record, key_columns)
+                    yield record
+                if count < batch_size:
+                    break
 
 
 class Agent(Base, BaseCRUD):
@@ -141,13 +573,6 @@ class Agent(Base, BaseCRUD):
     lastupdated = Column(TIMESTAMP(timezone=True))  
 
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
-
 class AgentProfile(Base, BaseCRUD):
     """
     This class represents the agent_profiles table in the database.
@@ -155,19 +580,13 @@ class AgentProfile(Base, BaseCRUD):
     __tablename__ = 'agent_profiles'
     # Add your columns here, for example:
     profile_id = Column(Integer, primary_key=True)
-    agent_id = Column(Integer, ForeignKey('agents.agent_id'))
+    agent_id = Column(Integer, ForeignKey('agents.agentid'))
     capabilities = Column(JSON)
     assigned_tasks = Column(JSON)
     profile_status = Column(Boolean)
     created_at = Column(TIMESTAMP)
     updated_at = Column(TIMESTAMP)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class AgentFunction(Base, BaseCRUD):
     """
     This class represents the agent_functions table in the database.
@@ -180,31 +599,27 @@ class AgentFunction(Base, BaseCRUD):
     outputformat = Column(JSON)
     executionfreq = Column(Integer)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 
 class AgentAPICall(Base, BaseCRUD):
     """
     This class represents the agent_api_calls table in the database.
     """
     __tablename__ = 'agent_api_calls'
+    __table_args__ = (
+        Index('ix_agent_api_calls_agent_id_call_time', 'agent_id', 'call_time'),
+    )
     # Add your columns here, for example:
-    api_call_id = Column(Integer, primary_key=True)
-    agent_id = Column(Integer, ForeignKey('agents.agent_id'))
+    # Partitioned by month on call_time (migrations/004), so call_time is part of
+    # the primary key and the id is drawn from the sequence SERIAL created.
+    # SQLite has no sequences: rows there need an explicit api_call_id.
+    # read, update and delete take the whole key, (api_call_id, call_time); PostgreSQL
+    # cannot keep an index unique on api_call_id alone across partitions.
+    api_call_id = Column(Integer, DBSequence('agent_api_calls_api_call_id_seq'), primary_key=True)
+    agent_id = Column(Integer, ForeignKey('agents.agentid'))
     api_endpoint = Column(String(255))
-    call_time = Column(TIMESTAMP)
+    call_time = Column(TIMESTAMP, primary_key=True, server_default=func.now())
     response_status = Column(Integer)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 
 class AgentGroupChatAssociation(Base, BaseCRUD):
     """
@@ -212,15 +627,9 @@ class AgentGroupChatAssociation(Base, BaseCRUD):
     """
     __tablename__ = 'agent_group_chat_association'
     # Add your columns here, for example:
-    agent_id = Column(Integer, ForeignKey('agents.agent_id'), primary_key=True)
+    agent_id = Column(Integer, ForeignKey('agents.agentid'), primary_key=True)
     chat_id = Column(Integer, ForeignKey('group_chats.chat_id'), primary_key=True)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class Assistant(Base, BaseCRUD):
     """
     This class represents the assistants table in the database.
@@ -231,12 +640,6 @@ class Assistant(Base, BaseCRUD):
     name = Column(String(255))
     role = Column(String(255))
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class Container(Base, BaseCRUD):
     """
     This class represents the containers table in the database.
@@ -248,12 +651,6 @@ class Container(Base, BaseCRUD):
     resources = Column(JSON)
     status = Column(String(255), nullable=False)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 
 class ConversationThread(Base, BaseCRUD):
     """
@@ -266,12 +663,6 @@ class ConversationThread(Base, BaseCRUD):
     StartTime = Column(TIMESTAMP)
     Status = Column(String(255))
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class DebugInfo(Base, BaseCRUD):
     """
     This class represents the debug_info table in the database.
@@ -285,11 +676,6 @@ class DebugInfo(Base, BaseCRUD):
     line_number = Column(Integer)
     message = Column(String(255))
     
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
 
 class DockerImage(Base, BaseCRUD):
     """
@@ -301,12 +687,6 @@ class DockerImage(Base, BaseCRUD):
     baseos = Column(String(50))
     lastupdate = Column(TIMESTAMP)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class ExternalAPI(Base, BaseCRUD):
     """
     This class represents the external_apis table in the database.
@@ -320,12 +700,6 @@ class ExternalAPI(Base, BaseCRUD):
     usage_count = Column(Integer)
     last_used = Column(TIMESTAMP)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class GBTSPrompt(Base, BaseCRUD):
     """
     This class represents the gbts_prompts table in the database.
@@ -336,12 +710,6 @@ class GBTSPrompt(Base, BaseCRUD):
     template = Column(JSON)
     description = Column(String(255))
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class GBTSResponse(Base, BaseCRUD):
     """
     This class represents the gbts_responses table in the database.
@@ -350,16 +718,10 @@ class GBTSResponse(Base, BaseCRUD):
     # Add your columns here, for example:
     response_id = Column(Integer, primary_key=True)
     prompt_id = Column(Integer, ForeignKey('gbts_prompts.prompt_id'))
-    agent_id = Column(Integer, ForeignKey('agents.agent_id'))
+    agent_id = Column(Integer, ForeignKey('agents.agentid'))
     response = Column(JSON)
     response_time = Column(TIMESTAMP)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class GroupChat(Base, BaseCRUD):
     """
     This class represents the group_chats table in the database.
@@ -371,30 +733,26 @@ class GroupChat(Base, BaseCRUD):
     start_time = Column(TIMESTAMP)
     status = Column(String(255), nullable=False)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 
 class Message(Base, BaseCRUD):
     """
     This class represents the messages table in the database.
     """
     __tablename__ = 'messages'
+    __table_args__ = (
+        Index('ix_messages_threadid_timestamp', 'threadid', 'timestamp'),
+    )
     # Add your columns here, for example:
-    messageid = Column(Integer, primary_key=True)
-    threadid = Column(Integer, ForeignKey('conversation_threads.threadid'))
+    # Partitioned by month on timestamp (migrations/003), so timestamp is part of
+    # the primary key and the id is drawn from the sequence SERIAL created.
+    # SQLite has no sequences: rows there need an explicit messageid.
+    # read, update and delete take the whole key, (messageid, timestamp); PostgreSQL
+    # cannot keep an index unique on messageid alone across partitions.
+    messageid = Column(Integer, DBSequence('messages_messageid_seq'), primary_key=True)
+    threadid = Column(Integer, ForeignKey('conversation_threads.ThreadID'))
     agentid = Column(Integer, ForeignKey('agents.agentid'))
     content = Column(Text)
-    timestamp = Column(TIMESTAMP)
-
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
+    timestamp = Column(TIMESTAMP, primary_key=True, server_default=func.now())
 
 class Project(Base, BaseCRUD):
     """
@@ -409,12 +767,6 @@ class Project(Base, BaseCRUD):
     end_date = Column(TIMESTAMP)
     status = Column(Boolean, nullable=False)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class Run(Base, BaseCRUD):
     """
     This class represents the runs table in the database.
@@ -424,36 +776,38 @@ class Run(Base, BaseCRUD):
     id = Column(Integer, primary_key=True)
     thread_id = Column(Integer, ForeignKey('threads.id'))
     status = Column(String(255))
-
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
+    # ID of the run in the OpenAI assistants API
+    openai_run_id = Column(String(255), index=True)
 
 class SystemLog(Base, BaseCRUD):
     """
     This class represents the system_logs table in the database.
     """
     __tablename__ = 'system_logs'
+    __table_args__ = (
+        Index('ix_system_logs_timestamp', 'timestamp'),
+        Index('ix_system_logs_service_name_timestamp', 'service_name', 'timestamp'),
+    )
     # Add your columns here, for example:
-    log_id = Column(Integer, primary_key=True)
-    timestamp = Column(TIMESTAMP)
+    # Partitioned by month on timestamp (migrations/005), so timestamp is part of
+    # the primary key and the id is drawn from the sequence SERIAL created.
+    # SQLite has no sequences: rows there need an explicit log_id.
+    # read, update and delete take the whole key, (log_id, timestamp); PostgreSQL
+    # cannot keep an index unique on log_id alone across partitions.
+    log_id = Column(Integer, DBSequence('system_logs_log_id_seq'), primary_key=True)
+    timestamp = Column(TIMESTAMP, primary_key=True, server_default=func.now())
     log_level = Column(String(255))
     service_name = Column(String(255))
     message = Column(String(255))
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class Task(Base, BaseCRUD):
     """
     This class represents the tasks table in the database.
     """
     __tablename__ = 'tasks'
+    __table_args__ = (
+        Index('ix_tasks_assigned_agent_id_status', 'assigned_agent_id', 'status'),
+    )
     # Add your columns here, for example:
     taskid = Column(Integer, primary_key=True)
     description = Column(Text)
@@ -461,12 +815,6 @@ class Task(Base, BaseCRUD):
     status = Column(String(255))
     assigned_agent_id = Column(Integer, ForeignKey('agents.agentid'))
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class TaskHistory(Base, BaseCRUD):
     """
     This class represents the task_history table in the database.
@@ -478,12 +826,6 @@ class TaskHistory(Base, BaseCRUD):
     status_changed_to = Column(String(255))
     change_timestamp = Column(TIMESTAMP)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class TaskStatus(Base, BaseCRUD):
     """
     This class represents the task_status table in the database.
@@ -493,12 +835,6 @@ class TaskStatus(Base, BaseCRUD):
     status_id = Column(Integer, primary_key=True)
     status_name = Column(String(255), nullable=False)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class TaskPriority(Base, BaseCRUD):
     """
     This class represents the task_priority table in the database.
@@ -508,27 +844,25 @@ class TaskPriority(Base, BaseCRUD):
     priority_id = Column(Integer, primary_key=True)
     priority_level = Column(String(255), nullable=False)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class Thread(Base, BaseCRUD):
     """
     This class represents the threads table in the database.
     """
     __tablename__ = 'threads'
+    __table_args__ = (
+        # one thread per OpenAI assistant and agent, see gbts/thread_registry.py
+        Index('ix_threads_openai_assistant_id_agent_name', 'openai_assistant_id', 'agent_name', unique=True),
+    )
     # Add your columns here, for example:
     id = Column(Integer, primary_key=True)
     assistant_id = Column(Integer, ForeignKey('assistants.id'))
     title = Column(String(255))
-
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
+    # OpenAI assistants API state, shared by every process running the assistant
+    openai_thread_id = Column(String(255), unique=True)
+    openai_assistant_id = Column(String(255))
+    agent_name = Column(String(255))
+    unread_index = Column(Integer, nullable=False, default=0)
+    last_message_id = Column(String(255))
 
 class User(Base, BaseCRUD):
     """
@@ -545,12 +879,6 @@ class User(Base, BaseCRUD):
     threads = Column(JSON)
     chat = Column(JSON)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class Websocket(Base, BaseCRUD):
     """
     This class represents the websockets table in the database.
@@ -559,15 +887,9 @@ class Websocket(Base, BaseCRUD):
     # Add your columns here, for example:
     socket_id = Column(Integer, primary_key=True)
     endpoint = Column(String(255))
-    assoceated_agent = Column(Integer, ForeignKey('agents.agent_id'))
+    assoceated_agent = Column(Integer, ForeignKey('agents.agentid'))
     protocol = Column(String(255))
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class CacheData(Base, BaseCRUD):
     """
     This class represents the cache_data table in the database.
@@ -575,16 +897,10 @@ class CacheData(Base, BaseCRUD):
     __tablename__ = 'cache_data'
     # Add your columns here, for example:
     cache_id = Column(Integer, primary_key=True)
-    cache_key = Column(String(255))
+    cache_key = Column(String(255), unique=True)
     cache_value = Column(JSON)
     expiry_time = Column(TIMESTAMP)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class DigitalTwin(Base, BaseCRUD):
     """
     This class represents the digital_twins table in the database.
@@ -597,46 +913,33 @@ class DigitalTwin(Base, BaseCRUD):
     created_at = Column(TIMESTAMP)
     last_synced = Column(TIMESTAMP)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class ChatMetadata(Base, BaseCRUD):
     """
     This class represents the chat_metadata table in the database.
     """
     __tablename__ = 'chat_metadata'
     # Add your columns here, for example:
-    chat_id = Column(Integer, ForeignKey('group_chats.chat_id'))
+    chat_id = Column(Integer, ForeignKey('group_chats.chat_id'), primary_key=True)
     topic = Column(String(255))
     creation_time = Column(TIMESTAMP)
     purpose = Column(String(255))
     
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
 
 class ChatHistory(Base, BaseCRUD):
     """
     This class represents the chat_history table in the database.
     """
     __tablename__ = 'chat_history'
+    __table_args__ = (
+        Index('ix_chat_history_chat_id_timestamp', 'chat_id', 'timestamp'),
+    )
     # Add your columns here, for example:
     history_id = Column(Integer, primary_key=True)
     chat_id = Column(Integer, ForeignKey('group_chats.chat_id'))
-    message_id = Column(Integer, ForeignKey('messages.messageid'))
+    # No foreign key: messages is partitioned, see migrations/003
+    message_id = Column(Integer)
     timestamp = Column(TIMESTAMP)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class ChatSetting(Base, BaseCRUD):
     """
     This class represents the chat_settings table in the database.
@@ -647,12 +950,6 @@ class ChatSetting(Base, BaseCRUD):
     chat_id = Column(Integer, ForeignKey('group_chats.chat_id'))
     settings_data = Column(JSON)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class ChatVisualizationData(Base, BaseCRUD):
     """
     This class represents the chat_visualization_data table in the database.
@@ -661,15 +958,9 @@ class ChatVisualizationData(Base, BaseCRUD):
     # Add your columns here, for example:
     data_id = Column(Integer, primary_key=True)
     chat_id = Column(Integer, ForeignKey('group_chats.chat_id'))
-    response_id = Column(Integer, ForeignKey('responses.response_id'))
+    response_id = Column(Integer, ForeignKey('gbts_responses.response_id'))
     visualization_data = Column(JSON)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class CodeExecution(Base, BaseCRUD):
     """
     This class represents the code_executions table in the database.
@@ -677,18 +968,12 @@ class CodeExecution(Base, BaseCRUD):
     __tablename__ = 'code_executions'
     # Add your columns here, for example:
     executionid = Column(Integer, primary_key=True)
-    agentid = Column(Integer, ForeignKey('agents.agent_id'))
-    threadid = Column(Integer, ForeignKey('conversation_threads.threadid'))
+    agentid = Column(Integer, ForeignKey('agents.agentid'))
+    threadid = Column(Integer, ForeignKey('conversation_threads.ThreadID'))
     codeblock = Column(JSON)
     result = Column(JSON)
     executiontime = Column(TIMESTAMP)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class ResourceLimit(Base, BaseCRUD):
     """
     This class represents the resource_limits table in the database.
@@ -699,12 +984,6 @@ class ResourceLimit(Base, BaseCRUD):
     resource_type = Column(String(255))
     max_limit = Column(Integer)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class ResourceUsage(Base, BaseCRUD):
     """
     This class represents the resource_usage table in the database.
@@ -712,16 +991,10 @@ class ResourceUsage(Base, BaseCRUD):
     __tablename__ = 'resource_usage'
     # Add your columns here, for example:
     usage_id = Column(Integer, primary_key=True)
-    agent_id = Column(Integer, ForeignKey('agents.agent_id'))
+    agent_id = Column(Integer, ForeignKey('agents.agentid'))
     resource_type = Column(String(255))
     current_usage = Column(JSON)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class UserPreference(Base, BaseCRUD):
     """
     This class represents the user_preferences table in the database.
@@ -732,12 +1005,6 @@ class UserPreference(Base, BaseCRUD):
     user_id = Column(Integer, ForeignKey('users.user_id'))
     preferences_data = Column(JSON)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 
 class Rule(Base, BaseCRUD):
     """
@@ -750,12 +1017,6 @@ class Rule(Base, BaseCRUD):
     ruledescription = Column(Text)
     priority = Column(Integer)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class Tool(Base, BaseCRUD):
     """
     This class represents the tools table in the database.
@@ -767,12 +1028,6 @@ class Tool(Base, BaseCRUD):
     tool_description = Column(Text)
     tool_resource_requirements = Column(JSON)
 
-    # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
-
 class ContainerTool(Base, BaseCRUD):
     """
     This class represents the container_tools table in the database.
@@ -782,10 +1037,13 @@ class ContainerTool(Base, BaseCRUD):
     container_id = Column(Integer, ForeignKey('containers.container_id'), primary_key=True)
     tool_id = Column(Integer, ForeignKey('tools.tool_id'), primary_key=True)
 
-        # Define the CRUD methods here
-    create = BaseCRUD.create
-    read = BaseCRUD.read
-    update = BaseCRUD.update
-    delete = BaseCRUD.delete
 
-Base.metadata.create_all(engine)
+def init_db(bind=None) -> None:
+    """
+    Create any missing tables. Called explicitly instead of at import time so
+    importing the models never opens a database connection.
+
+    Args:
+        bind (Engine): The engine to create the tables on. Defaults to get_engine().
+    """
+    Base.metadata.create_all(bind if bind is not None else get_engine())
@@ -0,0 +1,104 @@
+# /data/database/utils/migrate.py
+"""
+migrate.py applies the SQL migrations in data/database/migrations in order.
+
+Each file is applied once, inside its own transaction, and recorded in the
+schema_migrations table. The migrations are written for PostgreSQL.
+
+Usage:
+    python -m data.database.utils.migrate                      # apply pending migrations
+    python -m data.database.utils.migrate --ensure-partitions  # also add future monthly partitions
+"""
+import argparse
+import datetime
+from logging import getLogger, basicConfig, INFO
+from pathlib import Path
+from typing import List, Optional
+from sqlalchemy import text
+from data.database.utils.setconn import get_engine
+
+logger = getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+
+# Tables converted to monthly partitions by the migrations
+PARTITIONED_TABLES = ("messages", "agent_api_calls", "system_logs")
+
+
+def pending_migrations(bind=None, directory: Path = MIGRATIONS_DIR) -> List[Path]:
+    """
+    Return the migration files that have not been applied yet, in order.
+    """
+    bind = bind if bind is not None else get_engine()
+    with bind.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version VARCHAR(255) PRIMARY KEY, "
+            "applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now())"
+        )
+        applied = set(connection.execute(text("SELECT version FROM schema_migrations")).scalars())
+    return [path for path in sorted(Path(directory).glob("*.sql")) if path.stem not in applied]
+
+
+def apply_migrations(bind=None, directory: Path = MIGRATIONS_DIR) -> List[str]:
+    """
+    Apply every pending migration.
+
+    Args:
+        bind (Engine): The engine to migrate. Defaults to get_engine().
+        directory (Path): The directory containing the numbered .sql files.
+
+    Returns:
+        list: The versions that were applied.
+    """
+    bind = bind if bind is not None else get_engine()
+    applied = []
+    for path in pending_migrations(bind, directory):
+        logger.info("Applying migration %s", path.name)
+        with bind.begin() as connection:
+            # run through the DBAPI cursor without parameters so the % in format() calls is left alone
+            cursor = connection.connection.cursor()
+            try:
+                cursor.execute(path.read_text(encoding="utf-8"))
+            finally:
+                cursor.close()
+            connection.execute(text("INSERT INTO schema_migrations (version) VALUES (:version)"), {"version": path.stem})
+        applied.append(path.stem)
+    return applied
+
+
+def ensure_partitions(bind=None, months_ahead: int = 3, tables=PARTITIONED_TABLES) -> None:
+    """
+    Create the monthly partitions for the current month and the next months_ahead months.
+
+    Run this on a schedule so inserts never fall through to the default partition.
+    """
+    bind = bind if bind is not None else get_engine()
+    with bind.begin() as connection:
+        for table in tables:
+            connection.execute(
+                text("SELECT create_monthly_partitions(:table, :start, :months)"),
+                {"table": table, "start": datetime.date.today(), "months": months_ahead + 1},
+            )
+            logger.info("Ensured %d monthly partitions for %s", months_ahead + 1, table)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Apply Agent_DB migrations.")
+    parser.add_argument("--ensure-partitions", action="store_true",
+                        help="create monthly partitions ahead of time after migrating")
+    parser.add_argument("--months-ahead", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    basicConfig(level=INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    applied = apply_migrations()
+    logger.info("Applied %d migrations", len(applied))
+    if args.ensure_partitions:
+        ensure_partitions(months_ahead=args.months_ahead)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,57 @@
 # /data/database/utils/setconn.py
 """
-This module sets up the connection to the database. 
+This module sets up the connection to the database.
 db_host, db_port, db_name, db_user, and db_password are environment variables.
 details are stored in .env file
+
+Nothing here touches the database at import time. The engine is created on
+first use by get_engine(), and schema reflection only happens when
+get_reflected_base() is called. Reflected metadata is pickled to
+DB_SCHEMA_CACHE_DIR (default ~/.cache/eco-bot) under a hash of the live
+schema, so later processes load it from disk after one catalog query
+instead of reflecting every table again. The cache directory is created
+private to the current user, and cache files owned by anyone else are
+ignored, since unpickling one could run arbitrary code.
+
+The engine keeps a pool of connections configured from the environment:
+DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE and DB_POOL_PRE_PING.
+
+Use session_scope() for a unit of work with its own session:
+
+    with session_scope() as db_session:
+        Agent.bulk_create(db_session, rows)
+
+`session` is a thread-local registry for synchronous code, so concurrent
+Streamlit sessions and agents on different threads never share one. Call
+session.remove() when a thread is done with it.
+
+Coroutines must not use `session`: tasks on one event loop share a thread.
+They open their own AsyncSession on the asyncpg engine from get_async_engine()
+through async_session_scope(), which never blocks the event loop and always
+closes the session:
+
+    async with async_session_scope() as db_session:
+        await Message.abulk_create(db_session, rows)
 """
 import os
-from sqlalchemy import create_engine, MetaData
-from sqlalchemy.orm import sessionmaker
+import hashlib
+import logging
+import pickle
+from contextlib import contextmanager, asynccontextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+from sqlalchemy import create_engine, MetaData, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session
 from sqlalchemy.ext.automap import automap_base
-from db_operations import * 
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Define the database details
 db_host = os.getenv("DB_HOST")
 db_port = os.getenv("DB_PORT")
@@ -20,33 +59,258 @@ db_name = os.getenv("DB_NAME")
 db_user = os.getenv("DB_USER")
 db_password = os.getenv("DB_PASSWORD")
 
-# Create the engine
-engine = create_engine(f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}")
+# Declarative base for the models defined in db_operations
+Base = declarative_base()
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """
+    Read a boolean flag from the environment.
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def pool_options() -> dict:
+    """
+    Return the connection pool settings for create_engine, read from the environment.
+
+    Returns:
+        dict: pool_size, max_overflow, pool_timeout, pool_recycle and pool_pre_ping.
+    """
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    }
+
+
+def database_url() -> str:
+    """
+    Return the database URL built from the DB_* environment variables.
+    """
+    return f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+
+
+def async_database_url() -> str:
+    """
+    Return the asyncpg database URL built from the DB_* environment variables.
+    """
+    return f"postgresql+asyncpg://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+
+
+@lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    """
+    Create the pooled engine on first call and return the same engine afterwards.
+    """
+    return create_engine(database_url(), **pool_options())
+
+
+@lru_cache(maxsize=None)
+def get_async_engine() -> AsyncEngine:
+    """
+    Create the pooled asyncpg engine on first call and return the same engine afterwards.
+
+    The pool is shared by every task on the event loop, so up to
+    DB_POOL_SIZE + DB_MAX_OVERFLOW queries run concurrently.
+    """
+    return create_async_engine(async_database_url(), **pool_options())
+
+
+_SCHEMA_FINGERPRINT_QUERIES = {
+    "postgresql": (
+        "SELECT table_name, column_name, data_type, is_nullable "
+        "FROM information_schema.columns WHERE table_schema = current_schema() "
+        "UNION ALL "
+        "SELECT table_name, constraint_name, constraint_type, '' "
+        "FROM information_schema.table_constraints WHERE table_schema = current_schema() "
+        "ORDER BY 1, 2"
+    ),
+    "sqlite": "SELECT type, name, tbl_name, sql FROM sqlite_master ORDER BY name",
+}
+
+
+def schema_fingerprint(bind: Engine) -> Optional[str]:
+    """
+    Hash the live schema with a single catalog query.
+
+    Args:
+        bind (Engine): The engine to fingerprint.
+
+    Returns:
+        str or None: A hex digest that changes whenever a table, column or
+        constraint changes, or None if the dialect is not supported.
+    """
+    query = _SCHEMA_FINGERPRINT_QUERIES.get(bind.dialect.name)
+    if query is None:
+        return None
+    digest = hashlib.sha256(str(bind.url).encode("utf-8"))
+    with bind.connect() as connection:
+        for row in connection.execute(text(query)):
+            digest.update(repr(tuple(row)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def schema_cache_dir() -> Path:
+    """
+    Return the directory reflected metadata is cached in.
+    """
+    return Path(os.getenv("DB_SCHEMA_CACHE_DIR", Path.home() / ".cache" / "eco-bot"))
+
+
+def _owned_by_current_user(path: Path) -> bool:
+    """
+    Return True if path belongs to the user running this process.
+    """
+    if not hasattr(os, "getuid"):
+        # no file ownership to check on this platform
+        return True
+    return path.stat().st_uid == os.getuid()
+
+
+def reflect_metadata(bind: Optional[Engine] = None, cache_dir: Optional[Path] = None) -> MetaData:
+    """
+    Reflect the database schema, reusing a cached copy when the schema has not changed.
+
+    Args:
+        bind (Engine): The engine to reflect. Defaults to get_engine().
+        cache_dir (Path): Where cached metadata is stored. Defaults to schema_cache_dir().
+
+    Returns:
+        MetaData: The reflected tables.
+    """
+    bind = bind if bind is not None else get_engine()
+    fingerprint = schema_fingerprint(bind)
+    cache_file = None
+    if fingerprint is not None:
+        cache_file = Path(cache_dir or schema_cache_dir()) / f"schema-{fingerprint}.pickle"
+        if cache_file.exists() and not _owned_by_current_user(cache_file):
+            logger.warning("Ignoring schema cache %s, which belongs to another user", cache_file)
+            cache_file = None
+        elif cache_file.exists():
+            try:
+                with open(cache_file, "rb") as file:
+                    logger.info("Loaded reflected schema from %s", cache_file)
+                    return pickle.load(file)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+                logger.warning("Ignoring unreadable schema cache %s: %s", cache_file, e)
+
+    metadata = MetaData()
+    metadata.reflect(bind)
+    if cache_file is not None:
+        try:
+            cache_file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_file, "wb") as file:
+                pickle.dump(metadata, file)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logger.warning("Could not write schema cache %s: %s", cache_file, e)
+    return metadata
+
+
+@lru_cache(maxsize=None)
+def get_reflected_base():
+    """
+    Return an automap base with a class for every reflected table.
+
+    Example:
+        DockerImages = get_reflected_base().classes.dockerimages
+    """
+    reflected_base = automap_base(metadata=reflect_metadata())
+    reflected_base.prepare()
+    return reflected_base
+
+
+def __getattr__(name):
+    """
+    Resolve the names this module used to build at import time, on first access.
+    """
+    if name == "engine":
+        return get_engine()
+    if name == "metadata":
+        return get_reflected_base().metadata
+    if name == "DockerImages":
+        return get_reflected_base().classes.dockerimages
+    if name == "Agents":
+        return get_reflected_base().classes.agents
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _LazySessionMaker(sessionmaker):
+    """
+    A sessionmaker that binds to get_engine() the first time a session is created.
+    """
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None and local_kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+
+class _LazyAsyncSessionMaker(async_sessionmaker):
+    """
+    An async_sessionmaker that binds to get_async_engine() the first time a session is created.
+    """
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None and local_kw.get("bind") is None:
+            self.configure(bind=get_async_engine())
+        return super().__call__(**local_kw)
+
+
+# Create a session factory and a thread-local session registry
+Session = _LazySessionMaker()
+session = scoped_session(Session)
 
-# Reflect the tables
-metadata = MetaData()
-metadata.reflect(engine)
+# Async sessions keep loaded attributes after commit, since lazy loading is not available
+AsyncSessionFactory = _LazyAsyncSessionMaker(expire_on_commit=False)
 
 
-# Generate mapped classes
-Base = automap_base(metadata=metadata)
-Base.prepare()
+@contextmanager
+def session_scope():
+    """
+    Provide a transactional scope around a series of operations.
 
-# Now you can access your tables as classes. For example:
-DockerImages = Base.classes.dockerimages
-Agents = Base.classes.agents
-# ...
+    Commits when the block exits normally, rolls back on error and always
+    returns the connection to the pool.
 
-# Create a session
-Session = sessionmaker(bind=engine)
-session = Session()
+    Yields:
+        Session: A session used only by this block.
+    """
+    db_session = Session()
+    try:
+        yield db_session
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
 
-# Now you can query your tables. For example:
-images = session.query(DockerImages).all()
 
-# connect to the classes through db_operations
-BaseCRUD = BaseCRUD(session=session)
+@asynccontextmanager
+async def async_session_scope():
+    """
+    Provide a transactional scope around a series of async operations.
 
-# Create a new record
-new_record = BaseCRUD.create(session, name="John Doe", age=30)
+    Commits when the block exits normally, rolls back on error and always
+    returns the connection to the pool.
 
+    Yields:
+        AsyncSession: A session used only by this block.
+    """
+    db_session = AsyncSessionFactory()
+    try:
+        yield db_session
+        await db_session.commit()
+    except Exception:
+        await db_session.rollback()
+        raise
+    finally:
+        await db_session.close()
@@ -0,0 +1,108 @@
+# /data/database/utils/ttl_cache.py
+"""
+ttl_cache.py provides a small thread-safe in-process cache with an LRU size
+limit and per-entry expiry. It has no database dependencies, so it is used as
+the in-process tier in front of slower lookups across the project.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# Returned by TTLCache.get when a key is missing or expired
+MISSING = object()
+
+
+class TTLCache:
+    """
+    A least-recently-used cache whose entries also expire after a time to live.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        """
+        Args:
+            max_size (int): Maximum number of entries. The least recently used
+                entry is evicted when the cache is full.
+            ttl (float): Default time to live in seconds. None keeps entries
+                until they are evicted.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        Return the cached value for key, or default if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store value under key.
+
+        Args:
+            key: The cache key.
+            value: The value to cache.
+            ttl (float): Time to live in seconds, overriding the cache default.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def remaining_ttl(self, key: Hashable) -> Optional[float]:
+        """
+        Return the seconds left before key expires, or None if it never expires or is missing.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] is None:
+                return None
+            return max(entry[1] - time.monotonic(), 0.0)
+
+    def items(self) -> list:
+        """
+        Return a snapshot of the unexpired (key, value) pairs, least recently used first.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, value) for key, (value, expires_at) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def delete(self, key: Hashable) -> None:
+        """
+        Remove key from the cache if present.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,373 @@
+# /data/database/utils/write_behind.py
+"""
+write_behind.py buffers rows in memory and persists them from a background thread.
+
+Chat turns produce a Message row and a ChatHistory row. Writing them through
+BaseCRUD.create costs two synchronous commits on the request path, so the
+WriteBehindWriter queues them instead and flushes everything it has collected
+in a single transaction once max_batch_size rows are waiting or flush_interval
+seconds have passed. The queue is bounded: when it is full, submit blocks for
+up to put_timeout seconds and then raises queue.Full, which pushes back on
+callers instead of growing memory without limit. Pending rows are flushed when
+the writer is closed, including at interpreter exit.
+
+A batch that fails to commit is retried max_retries times with a growing
+delay. If it still fails, it is split in halves that are written separately,
+down to single items, so one bad row does not take the rest of its batch
+with it. Items that still fail are kept in dead_letter (bounded by
+max_dead_letter) rather than dropped, and retry_dead_letter() queues them
+again once the database is back. When the database cannot be reached at all
+the batch is not split, since every part would fail the same way.
+
+default_writer() returns the process-wide writer used by the chat write path.
+"""
+import atexit
+import datetime
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, fields
+from logging import getLogger
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from data.database.utils.setconn import Session
+from data.database.utils.db_operations import Message, ChatHistory
+
+logger = getLogger(__name__)
+
+
+@dataclass
+class _Row:
+    """A single row destined for model's table."""
+    model: Any
+    values: Dict[str, Any]
+
+
+@dataclass
+class _ChatTurn:
+    """A Message row and the ChatHistory row that points at it."""
+    message: Dict[str, Any]
+    chat_id: int
+
+
+@dataclass
+class _Control:
+    """A flush or stop request for the worker thread."""
+    stop: bool = False
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+@dataclass
+class WriterStats:
+    """Counters describing what the writer has done so far."""
+    submitted: int = 0
+    written: int = 0
+    failed: int = 0
+    retried: int = 0
+    dead_lettered: int = 0
+    flushes: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, **counts: int) -> None:
+        """Increment counters, safely from any thread."""
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Return the counters as a dict."""
+        with self._lock:
+            return {f.name: getattr(self, f.name) for f in fields(self) if not f.name.startswith("_")}
+
+
+class WriteBehindWriter:
+    """
+    Accumulates rows in memory and writes them in batched transactions.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        max_batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10000,
+        put_timeout: Optional[float] = 5.0,
+        max_retries: int = 3,
+        retry_delay: float = 0.5,
+        max_dead_letter: int = 10000,
+    ):
+        """
+        Args:
+            session_factory (callable): Returns a new Session. Defaults to setconn.Session.
+            max_batch_size (int): Number of queued rows that triggers a flush.
+            flush_interval (float): Maximum number of seconds a row waits before being flushed.
+            max_queue_size (int): Number of rows that can wait in memory before submit blocks.
+            put_timeout (float): Seconds submit blocks on a full queue before raising
+                queue.Full. None blocks until space is available.
+            max_retries (int): Extra attempts for a batch that fails to commit.
+            retry_delay (float): Seconds before the first retry, doubled for each further one.
+            max_dead_letter (int): Failed items kept for retry_dead_letter. The oldest
+                are discarded, and logged, beyond this.
+        """
+        self.session_factory = session_factory or Session
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.stats = WriterStats()
+        self.dead_letter = deque(maxlen=max_dead_letter)
+        self._dead_letter_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="write-behind-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, model, values: Dict[str, Any]) -> None:
+        """
+        Queue a row for model's table.
+
+        Args:
+            model: A BaseCRUD model class, for example Message or SystemLog.
+            values (dict): Column attribute names to values.
+
+        Raises:
+            queue.Full: If the queue stays full for longer than put_timeout.
+        """
+        self._put(_Row(model, dict(values)))
+
+    def submit_chat_turn(self, message: Dict[str, Any], chat_id: int) -> None:
+        """
+        Queue a Message row together with the ChatHistory row that references it.
+
+        The ChatHistory row is written in the same transaction as the message,
+        using the message id generated by the database.
+
+        Args:
+            message (dict): Values for the Message row (threadid, agentid, content, timestamp).
+            chat_id (int): The group chat the message belongs to.
+
+        Raises:
+            queue.Full: If the queue stays full for longer than put_timeout.
+        """
+        message = dict(message)
+        message.setdefault("timestamp", datetime.datetime.now(datetime.timezone.utc))
+        self._put(_ChatTurn(message, chat_id))
+
+    def flush(self, timeout: Optional[float] = 30.0) -> bool:
+        """
+        Write everything queued so far and wait for it to be committed.
+
+        Args:
+            timeout (float): Seconds to wait, including for room in a full queue.
+
+        Returns:
+            bool: True if the flush finished within timeout.
+        """
+        if self._closed:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        control = _Control()
+        try:
+            self._queue.put(control, timeout=timeout)
+        except queue.Full:
+            return False
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        return control.done.wait(remaining)
+
+    def close(self, timeout: Optional[float] = 30.0) -> None:
+        """
+        Flush pending rows and stop the background thread. Safe to call more than once.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        control = _Control(stop=True)
+        try:
+            self._queue.put(control, timeout=timeout)
+        except queue.Full:
+            logger.error("Write-behind queue still full after %ss, closing without a final flush", timeout)
+            return
+        control.done.wait(timeout)
+        self._thread.join(timeout)
+
+    def retry_dead_letter(self) -> int:
+        """
+        Queue the items of failed batches again.
+
+        Returns:
+            int: The number of items queued.
+
+        Raises:
+            queue.Full: If the queue stays full for longer than put_timeout. The
+                item that did not fit stays in dead_letter.
+        """
+        count = 0
+        while True:
+            with self._dead_letter_lock:
+                if not self.dead_letter:
+                    return count
+                item = self.dead_letter.popleft()
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                with self._dead_letter_lock:
+                    self.dead_letter.appendleft(item)
+                raise
+            count += 1
+
+    def _put(self, item) -> None:
+        """
+        Add an item to the queue, blocking for at most put_timeout when it is full.
+        """
+        if self._closed:
+            raise RuntimeError("WriteBehindWriter is closed")
+        self._queue.put(item, timeout=self.put_timeout)
+        self.stats.add(submitted=1)
+
+    def _run(self) -> None:
+        """
+        Worker loop: collect items until a size or time threshold is hit, then write them.
+        """
+        pending: List[Any] = []
+        deadline = None
+        while True:
+            wait = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, _Control):
+                self._write(pending)
+                pending, deadline = [], None
+                item.done.set()
+                if item.stop:
+                    return
+                continue
+            if item is not None:
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if pending and (len(pending) >= self.max_batch_size or time.monotonic() >= deadline):
+                self._write(pending)
+                pending, deadline = [], None
+
+    def _write(self, items: List[Any]) -> None:
+        """
+        Write items in one transaction, retrying failures and dead-lettering what still fails.
+        """
+        if not items:
+            return
+        self.stats.add(flushes=1)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats.add(retried=1)
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                self._write_batch(items)
+            except Exception as e:
+                logger.exception("Write-behind flush of %d items failed (attempt %d of %d)",
+                                 len(items), attempt + 1, self.max_retries + 1)
+                error = e
+            else:
+                self.stats.add(written=len(items))
+                return
+        if len(items) > 1 and not _unavailable(error):
+            half = len(items) // 2
+            self._write_split(items[:half])
+            self._write_split(items[half:])
+        else:
+            self._dead_letter(items)
+
+    def _write_split(self, items: List[Any]) -> None:
+        """
+        Write part of a failed batch once, halving it again on failure.
+        """
+        try:
+            self._write_batch(items)
+        except Exception as e:
+            if len(items) > 1 and not _unavailable(e):
+                half = len(items) // 2
+                self._write_split(items[:half])
+                self._write_split(items[half:])
+                return
+            logger.error("Write-behind dead-lettering %d items: %s", len(items), e)
+            self._dead_letter(items)
+        else:
+            self.stats.add(written=len(items))
+
+    def _dead_letter(self, items: List[Any]) -> None:
+        """
+        Keep items that could not be written for retry_dead_letter.
+        """
+        self.stats.add(failed=len(items), dead_lettered=len(items))
+        with self._dead_letter_lock:
+            dropped = max(len(self.dead_letter) + len(items) - self.dead_letter.maxlen, 0)
+            if dropped:
+                logger.error("Write-behind dead letter queue is full, discarding %d oldest items", dropped)
+            self.dead_letter.extend(items)
+
+    def _write_batch(self, items: List[Any]) -> None:
+        """
+        Write items in one transaction, grouping plain rows by model.
+        """
+        rows_by_model: Dict[Any, List[Dict[str, Any]]] = {}
+        chat_turns: List[_ChatTurn] = []
+        for item in items:
+            if isinstance(item, _ChatTurn):
+                chat_turns.append(item)
+            else:
+                rows_by_model.setdefault(item.model, []).append(item.values)
+
+        session = self.session_factory()
+        try:
+            for model, rows in rows_by_model.items():
+                model.bulk_create(session, rows, batch_size=self.max_batch_size, commit=False)
+            if chat_turns:
+                message_ids = Message.bulk_create(
+                    session, [turn.message for turn in chat_turns], batch_size=self.max_batch_size, commit=False
+                )
+                ChatHistory.bulk_create(
+                    session,
+                    [
+                        # Message keys are (messageid, timestamp) since messages is partitioned
+                        {"chat_id": turn.chat_id, "message_id": message_key[0], "timestamp": turn.message["timestamp"]}
+                        for turn, message_key in zip(chat_turns, message_ids)
+                    ],
+                    batch_size=self.max_batch_size,
+                    commit=False,
+                )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+
+def _unavailable(error: Exception) -> bool:
+    """
+    Return True if error means the database could not be reached, rather than a bad row.
+    """
+    return isinstance(error, (OperationalError, InterfaceError)) or getattr(error, "connection_invalidated", False)
+
+
+_default_writer = None
+_default_writer_lock = threading.Lock()
+
+
+def default_writer() -> WriteBehindWriter:
+    """
+    Return the writer shared by the process, starting it on first use.
+    """
+    global _default_writer
+    with _default_writer_lock:
+        if _default_writer is None:
+            _default_writer = WriteBehindWriter()
+        return _default_writer
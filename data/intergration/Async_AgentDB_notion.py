@@ -1,65 +1,87 @@
 # data/intergration/Async_AgentDB_notion.py
+"""
+Mirror the assistants, threads, runs and tools tables into Notion.
+
+Apply data/database/migrations/008_notion_change_feed.sql first, then run
+this module. Each table is synced to the Notion database whose id is in
+NOTION_<TABLE>_DATABASE_ID, for example NOTION_ASSISTANTS_DATABASE_ID;
+tables without one are skipped. Metrics are logged every
+NOTION_CDC_METRICS_INTERVAL seconds.
+
+The pipeline itself lives in notion_cdc.py.
+"""
 import os
 import asyncio
-import aiopg
-from notion_integration import async_notion as AsyncClient
+import logging
 from dotenv import load_dotenv
 
+from data.intergration.notion_cdc import (
+    CHANNELS, ChangeEvent, ChangePipeline, NotionSink, listen, notion_http_client,
+    parse_notification, pg_row_loader,
+)
+
+logger = logging.getLogger(__name__)
+
 # Load environment variables from the .env file
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(dotenv_path)
 
-# Retrieve the Notion integration token from environment variables
-NOTION_TOKEN = os.getenv('Eco-Notion_integration')
+METRICS_INTERVAL = float(os.getenv('NOTION_CDC_METRICS_INTERVAL', '60'))
 
-# Ensure the token is available
-if NOTION_TOKEN is None:
-    raise ValueError("Missing 'Eco-Notion_integration' environment variable.")
 
-# Define your PostgreSQL connection details
-# Assuming session.get_bind().url.dsn returns a valid DSN string
-from data.database.utils.setconn import session
-PG_DSN = session().get_bind().url.dsn
+def notion_databases():
+    """Return the Notion database id of each synced table."""
+    databases = {}
+    for channel in CHANNELS:
+        table = channel.rsplit('_changes', 1)[0]
+        database_id = os.getenv(f'NOTION_{table.upper()}_DATABASE_ID')
+        if database_id:
+            databases[table] = database_id
+    return databases
 
-# Initialize the Notion API client with the token
-notion = AsyncClient(auth=NOTION_TOKEN)
 
 # Define a function to update Notion tables asynchronously
-async def update_notion_table(table_id, data):
-    # TODO: Implement the logic to update the Notion table based on the data provided
-    # Example (update this with actual implementation):
-    # response = await notion.pages.update(page_id=table_id, properties=data)
-    pass
+async def update_notion_table(sink: NotionSink, event: ChangeEvent):
+    """Push one row change to its Notion page."""
+    await sink.push(event)
+
+
+async def log_metrics(pipeline: ChangePipeline, interval: float = METRICS_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        logger.info("Notion sync: %s", pipeline.snapshot())
+
 
 # Define a function to listen for database changes asynchronously
-async def listen_db_changes():
-    async with aiopg.create_pool(PG_DSN) as pool:
-        async with pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                # Set up a listen query for each table you're interested in
-                await cur.execute("LISTEN assistants_changes;")
-                await cur.execute("LISTEN threads_changes;")
-                await cur.execute("LISTEN runs_changes;")
-                await cur.execute("LISTEN tools_changes;")
-
-                # Continuously listen for notifications and process them
-                while True:
-                    msg = await conn.notifies.get()
-                    data = parse_notification(msg)
-                    await update_notion_table(data['table_id'], data)
-
-# Function to parse database notifications
-def parse_notification(notification):
-    # TODO: Parse the notification to get the table ID and data
-    # Example (update this with actual implementation):
-    # return {'table_id': notification.channel, 'data': notification.payload}
-    return {'table_id': '...', 'data': {...}}
+async def listen_db_changes(dsn, sink, stop=None):
+    """
+    Listen for row changes and push them to Notion until stop is set.
+    """
+    async with ChangePipeline(sink, row_loader=pg_row_loader(dsn)) as pipeline:
+        reporter = asyncio.create_task(log_metrics(pipeline))
+        try:
+            await listen(dsn, CHANNELS, pipeline.submit_notification, stop=stop)
+        finally:
+            reporter.cancel()
+
 
 # Main function to run the asyncio loop
 async def main():
-    # Run the database change listener
-    await listen_db_changes()
+    # Retrieve the Notion integration token from environment variables
+    notion_token = os.getenv('Eco-Notion_integration')
+    if notion_token is None:
+        raise ValueError("Missing 'Eco-Notion_integration' environment variable.")
+    databases = notion_databases()
+    if not databases:
+        raise ValueError("Set NOTION_<TABLE>_DATABASE_ID for at least one table.")
+
+    from data.database.utils.setconn import database_url
+
+    async with notion_http_client(notion_token) as client:
+        await listen_db_changes(database_url(), NotionSink(client, databases))
+
 
 # Run the asyncio loop
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main())
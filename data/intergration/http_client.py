@@ -0,0 +1,228 @@
+# data/intergration/http_client.py
+"""
+Shared HTTP client layer for the outbound integrations.
+
+Notion, the OpenAI REST endpoints and the AutoGen service are all called over
+one pooled requests session instead of a fresh connection per call. The
+session keeps one keep-alive pool per host, retries connection errors and
+429/5xx responses with exponential backoff (honouring Retry-After), and
+applies a default timeout to every request.
+
+AsyncHttpClient is the asyncio variant, built on httpx. It negotiates HTTP/2
+when the h2 package is installed and falls back to HTTP/1.1 keep-alive
+otherwise; requests itself only speaks HTTP/1.1.
+"""
+import asyncio
+import os
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from logging import getLogger
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = getLogger(__name__)
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+DEFAULT_TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_HOSTS", "10"))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+BACKOFF_FACTOR = 0.3
+BACKOFF_MAX = 10.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Notion and OpenAI page and object updates are idempotent, so PATCH is retried as well
+RETRY_METHODS = frozenset({"DELETE", "GET", "HEAD", "OPTIONS", "PATCH", "PUT", "TRACE"})
+
+
+def _retry(retries: int, retry_statuses) -> Retry:
+    return Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=retry_statuses,
+        allowed_methods=RETRY_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+class PooledSession(requests.Session):
+    """
+    A requests session with per-host keep-alive pools, retries and a default timeout.
+    """
+
+    def __init__(self, timeout: Tuple[float, float] = DEFAULT_TIMEOUT, retries: int = MAX_RETRIES,
+                 retry_statuses=RETRY_STATUSES, pool_maxsize: int = POOL_MAXSIZE):
+        """
+        Args:
+            timeout (tuple): Default (connect, read) timeout in seconds.
+            retries (int): Retries for connection errors and retryable statuses.
+            retry_statuses (iterable): Statuses to retry. Pass () to handle them yourself.
+            pool_maxsize (int): Connections kept alive per host.
+        """
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(
+            pool_connections=POOL_CONNECTIONS,
+            pool_maxsize=pool_maxsize,
+            max_retries=_retry(retries, retry_statuses),
+        )
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def http_session() -> PooledSession:
+    """Return the session shared by every integration in the process."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = PooledSession()
+        return _session
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """Send a request over the shared session."""
+    return http_session().request(method, url, **kwargs)
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def retry_after(response) -> Optional[float]:
+    """
+    Return the seconds to wait given by a response's Retry-After header, or None.
+
+    Both the delay-seconds and HTTP-date forms are understood.
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncHttpClient:
+    """
+    An httpx.AsyncClient with keep-alive pooling, HTTP/2 when available, retries and timeouts.
+
+    Use it as an async context manager, or call aclose() when done.
+    """
+
+    def __init__(self, base_url: str = "", headers: Optional[dict] = None,
+                 timeout: Tuple[float, float] = DEFAULT_TIMEOUT, retries: int = MAX_RETRIES,
+                 max_connections: int = 100, max_keepalive: int = POOL_MAXSIZE,
+                 http2: Optional[bool] = None):
+        """
+        Args:
+            base_url (str): Prefix for relative request URLs.
+            headers (dict): Headers sent with every request.
+            timeout (tuple): (connect, read) timeout in seconds.
+            retries (int): Retries for connection errors and retryable statuses.
+            max_connections (int): Connections open at once across all hosts.
+            max_keepalive (int): Idle connections kept alive.
+            http2 (bool): Use HTTP/2. Defaults to whether h2 is installed.
+        """
+        import httpx
+
+        self._httpx = httpx
+        self.retries = retries
+        self.http2 = _h2_available() if http2 is None else http2
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            http2=self.http2,
+        )
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return min(BACKOFF_FACTOR * 2 ** attempt, BACKOFF_MAX) * random.uniform(0.5, 1.0)
+
+    async def request(self, method: str, url: str, **kwargs):
+        """
+        Send a request, retrying connection errors and retryable statuses.
+
+        Non-idempotent methods are only retried when the connection could not
+        be made, or on 429, since the server has not acted on them.
+
+        Returns:
+            httpx.Response: The last response received.
+        """
+        httpx = self._httpx
+        method = method.upper()
+        idempotent = method in RETRY_METHODS
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if attempt >= self.retries:
+                    raise
+                wait = self._backoff(attempt)
+            except httpx.TransportError:
+                if not idempotent or attempt >= self.retries:
+                    raise
+                wait = self._backoff(attempt)
+            else:
+                retryable = response.status_code == 429 or (
+                    idempotent and response.status_code in RETRY_STATUSES
+                )
+                if not retryable or attempt >= self.retries:
+                    return response
+                wait = retry_after(response)
+                if wait is None:
+                    wait = self._backoff(attempt)
+                await response.aclose()
+            attempt += 1
+            logger.debug("Retrying %s %s in %.2fs (attempt %d)", method, url, wait, attempt)
+            await asyncio.sleep(min(wait, BACKOFF_MAX))
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs):
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs):
+        return await self.request("DELETE", url, **kwargs)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
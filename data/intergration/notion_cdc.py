@@ -0,0 +1,614 @@
+# data/intergration/notion_cdc.py
+"""
+Change data capture from PostgreSQL to Notion.
+
+The triggers in migrations/008_notion_change_feed.sql send a JSON payload on
+'<table>_changes' for every committed row change. The pipeline here turns
+those notifications into Notion page updates:
+
+    listen() -> parse_notification() -> ChangePipeline -> NotionSink
+
+ChangePipeline debounces changes per row: a row is pushed once it has been
+quiet for `debounce` seconds, or `max_delay` seconds after its first
+unpushed change, and only its latest state is sent. Due rows go through a
+bounded queue to a fixed pool of async workers, and a row is never pushed by
+two workers at once. A push that fails with 429, a 5xx status or a network
+error is retried with exponential backoff, up to `max_attempts` pushes, before
+the change is counted as failed. Throughput, lag and counters are kept in
+CdcMetrics.
+
+LISTEN/NOTIFY is not durable: changes committed while no listener is
+connected are not replayed.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+from logging import getLogger
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from data.database.utils.ttl_cache import TTLCache, MISSING
+from data.intergration.http_client import AsyncHttpClient, retry_after
+from data.intergration.notion_integration import (
+    NOTION_API_URL, NOTION_VERSION, NotionClient, rich_text_value,
+)
+
+logger = getLogger(__name__)
+
+CHANNELS = ("assistants_changes", "threads_changes", "runs_changes", "tools_changes")
+WORKERS = int(os.getenv("NOTION_CDC_WORKERS", "4"))
+DEBOUNCE = float(os.getenv("NOTION_CDC_DEBOUNCE", "0.5"))
+MAX_DELAY = float(os.getenv("NOTION_CDC_MAX_DELAY", "5"))
+QUEUE_SIZE = int(os.getenv("NOTION_CDC_QUEUE_SIZE", "100"))
+MAX_ATTEMPTS = int(os.getenv("NOTION_CDC_MAX_ATTEMPTS", "5"))
+RETRY_BACKOFF = float(os.getenv("NOTION_CDC_RETRY_BACKOFF", "1"))
+RETRY_BACKOFF_MAX = 60.0
+# Notion property holding the row's primary key, used to find its page
+ROW_KEY_PROPERTY = "Row ID"
+TITLE_COLUMNS = ("name", "title", "tool_name", "agent_name")
+NOTION_TEXT_LIMIT = 2000
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """One row change from a '<table>_changes' notification."""
+    table: str
+    op: str
+    row_id: Any
+    key_column: str = "id"
+    row: Optional[dict] = None
+    changed_at: float = 0.0
+    truncated: bool = False
+
+    @property
+    def key(self) -> tuple:
+        return (self.table, self.row_id)
+
+
+def parse_notification(channel: str, payload: str) -> ChangeEvent:
+    """
+    Parse a notification payload sent by notify_row_change().
+
+    Args:
+        channel (str): The channel the notification arrived on.
+        payload (str): The JSON payload.
+
+    Returns:
+        ChangeEvent: The change.
+
+    Raises:
+        ValueError: If the payload is not a row change.
+    """
+    try:
+        data = json.loads(payload)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid payload on {channel}: {e}") from e
+    if not isinstance(data, dict) or data.get("id") is None:
+        raise ValueError(f"Payload on {channel} has no row id")
+    op = str(data.get("op", "")).upper()
+    if op not in ("INSERT", "UPDATE", "DELETE"):
+        raise ValueError(f"Unknown operation {op!r} on {channel}")
+    table = data.get("table") or channel.rsplit("_changes", 1)[0]
+    return ChangeEvent(
+        table=table,
+        op=op,
+        row_id=data["id"],
+        key_column=data.get("key") or "id",
+        row=data.get("row"),
+        changed_at=float(data.get("ts") or time.time()),
+        truncated=bool(data.get("truncated")),
+    )
+
+
+def _merge(earlier: ChangeEvent, later: ChangeEvent) -> ChangeEvent:
+    # the latest state wins; an insert followed by updates is still an insert
+    if earlier.op == "INSERT" and later.op == "UPDATE":
+        return replace(later, op="INSERT")
+    return later
+
+
+def _is_transient(error: Exception) -> bool:
+    """
+    Return True if a failed push is worth retrying: 429, 5xx or a network error.
+    """
+    response = getattr(error, "response", None)
+    status_code = getattr(response, "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    if isinstance(error, (OSError, asyncio.TimeoutError)):
+        return True
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(error, httpx.TransportError)
+
+
+class CdcMetrics:
+    """
+    Counters, throughput and lag of a ChangePipeline.
+    """
+
+    def __init__(self, window: float = 60.0, samples: int = 1000):
+        """
+        Args:
+            window (float): Seconds over which throughput is measured.
+            samples (int): Number of recent lag samples kept.
+        """
+        self.window = window
+        self.received = 0
+        self.invalid = 0
+        self.coalesced = 0
+        self.pushed = 0
+        self.failed = 0
+        self.retried = 0
+        self._lags = deque(maxlen=samples)
+        self._pushed_at = deque()
+
+    def record_push(self, changed_at: float) -> None:
+        now = time.monotonic()
+        self.pushed += 1
+        self._lags.append(max(time.time() - changed_at, 0.0))
+        self._pushed_at.append(now)
+        while self._pushed_at and self._pushed_at[0] < now - self.window:
+            self._pushed_at.popleft()
+
+    def throughput(self) -> float:
+        """Return pushes per second over the window."""
+        cutoff = time.monotonic() - self.window
+        while self._pushed_at and self._pushed_at[0] < cutoff:
+            self._pushed_at.popleft()
+        return len(self._pushed_at) / self.window
+
+    def lag(self, percentile: float) -> Optional[float]:
+        """
+        Return the given percentile of seconds from a row change to its push.
+        """
+        if not self._lags:
+            return None
+        ordered = sorted(self._lags)
+        return ordered[min(int(len(ordered) * percentile / 100), len(ordered) - 1)]
+
+    def snapshot(self) -> dict:
+        return {
+            "received": self.received,
+            "invalid": self.invalid,
+            "coalesced": self.coalesced,
+            "pushed": self.pushed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "pushes_per_second": self.throughput(),
+            "lag_p50": self.lag(50),
+            "lag_p95": self.lag(95),
+            "lag_max": max(self._lags) if self._lags else None,
+        }
+
+
+@dataclass
+class _Pending:
+    event: ChangeEvent
+    first_changed_at: float
+    deadline: float
+    due: float = 0.0
+    changes: int = 1
+    attempts: int = 0
+
+
+class ChangePipeline:
+    """
+    Debounces row changes and pushes them to a sink with a bounded pool of workers.
+
+    Use it as an async context manager, or call start() and stop().
+    """
+
+    def __init__(self, sink, workers: int = WORKERS, debounce: float = DEBOUNCE,
+                 max_delay: float = MAX_DELAY, queue_size: int = QUEUE_SIZE,
+                 max_attempts: int = MAX_ATTEMPTS, retry_backoff: float = RETRY_BACKOFF,
+                 row_loader: Optional[Callable[[ChangeEvent], Awaitable[Optional[dict]]]] = None):
+        """
+        Args:
+            sink: An object with an async push(event) method.
+            workers (int): Changes pushed at once.
+            debounce (float): Seconds a row must be quiet before it is pushed.
+            max_delay (float): Longest a changed row waits while it keeps changing.
+            queue_size (int): Due changes waiting for a worker. When full, rows
+                keep coalescing until a worker is free.
+            max_attempts (int): Pushes of a change before it is counted as failed.
+            retry_backoff (float): Seconds before the first retry, doubled for each
+                later one. A Retry-After header is honoured if longer.
+            row_loader (callable): Async function reading a row back for
+                truncated notifications. Returns None if the row is gone.
+        """
+        self.sink = sink
+        self.workers = workers
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.row_loader = row_loader
+        self.metrics = CdcMetrics()
+        self._pending: Dict[tuple, _Pending] = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._in_flight = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks = []
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._dispatch())]
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def _schedule(self, key: tuple, pending: _Pending, due: float) -> None:
+        pending.due = due
+        heapq.heappush(self._heap, (due, next(self._seq), key))
+        self._wakeup.set()
+
+    def submit(self, event: ChangeEvent) -> None:
+        """
+        Add a change. Must be called from the pipeline's event loop.
+        """
+        now = time.monotonic()
+        self.metrics.received += 1
+        pending = self._pending.get(event.key)
+        if pending is None:
+            pending = _Pending(event, first_changed_at=event.changed_at, deadline=now + self.max_delay)
+            self._pending[event.key] = pending
+        else:
+            self.metrics.coalesced += 1
+            pending.event = _merge(pending.event, event)
+            pending.changes += 1
+        due = min(now + self.debounce, pending.deadline)
+        if pending.attempts:
+            # a row waiting to retry keeps its backoff
+            due = max(due, pending.due)
+        self._schedule(event.key, pending, due)
+
+    def submit_notification(self, channel: str, payload: str) -> None:
+        """
+        Parse and add a notification, counting payloads that cannot be parsed.
+        """
+        try:
+            event = parse_notification(channel, payload)
+        except ValueError as e:
+            self.metrics.invalid += 1
+            logger.warning("Skipping notification: %s", e)
+            return
+        self.submit(event)
+
+    async def _dispatch(self) -> None:
+        while True:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, key = heapq.heappop(self._heap)
+                pending = self._pending.get(key)
+                if pending is None or pending.due != due:
+                    # superseded by a later change to the row
+                    continue
+                if key in self._in_flight:
+                    # keep the row's changes in order; retry after its push finishes
+                    self._schedule(key, pending, now + self.debounce)
+                    continue
+                del self._pending[key]
+                self._in_flight.add(key)
+                await self._queue.put(pending)
+                now = time.monotonic()
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self) -> None:
+        while True:
+            pending = await self._queue.get()
+            event = pending.event
+            try:
+                if event.truncated and event.op != "DELETE" and self.row_loader is not None:
+                    row = await self.row_loader(event)
+                    if row is None:
+                        event = replace(event, op="DELETE", truncated=False)
+                    else:
+                        event = replace(event, row=row, truncated=False)
+                await self.sink.push(event)
+            except Exception as e:
+                pending.attempts += 1
+                if pending.attempts < self.max_attempts and _is_transient(e):
+                    self._retry(pending, e)
+                else:
+                    self.metrics.failed += 1
+                    logger.exception("Failed to push %s change to row %s", event.table, event.row_id)
+            else:
+                self.metrics.record_push(pending.first_changed_at)
+            finally:
+                self._in_flight.discard(event.key)
+                self._queue.task_done()
+
+    def _retry(self, pending: _Pending, error: Exception) -> None:
+        """
+        Schedule a failed push again after a backoff, merged with any newer change to the row.
+        """
+        key = pending.event.key
+        delay = min(self.retry_backoff * 2 ** (pending.attempts - 1), RETRY_BACKOFF_MAX)
+        delay *= random.uniform(0.5, 1.0)
+        response = getattr(error, "response", None)
+        if response is not None and getattr(response, "headers", None) is not None:
+            delay = max(delay, min(retry_after(response) or 0.0, RETRY_BACKOFF_MAX))
+        newer = self._pending.get(key)
+        if newer is not None:
+            # the row changed during the push; the retry sends its latest state
+            newer.event = _merge(pending.event, newer.event)
+            newer.first_changed_at = pending.first_changed_at
+            newer.changes += pending.changes
+            newer.attempts = pending.attempts
+            pending = newer
+        else:
+            self._pending[key] = pending
+        self.metrics.retried += 1
+        logger.warning("Retrying %s change to row %s in %.2fs (attempt %d): %s",
+                       pending.event.table, pending.event.row_id, delay, pending.attempts, error)
+        self._schedule(key, pending, max(time.monotonic() + delay, pending.due))
+
+    def flush(self) -> None:
+        """Make every pending change due now, except rows waiting to retry."""
+        now = time.monotonic()
+        for key, pending in self._pending.items():
+            if not pending.attempts:
+                self._schedule(key, pending, now)
+
+    async def drain(self, flush: bool = True) -> None:
+        """
+        Wait until every submitted change has been pushed or has failed.
+
+        Rows waiting to retry are not hurried, so this can take up to their
+        remaining backoff.
+
+        Args:
+            flush (bool): Push pending changes now rather than after their debounce.
+        """
+        while self._pending or self._in_flight:
+            if flush:
+                self.flush()
+            await asyncio.sleep(0.01)
+
+    async def stop(self, drain: bool = True) -> None:
+        """
+        Stop the workers, first pushing pending changes if drain is set.
+        """
+        if drain:
+            await self.drain()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def snapshot(self) -> dict:
+        """Return the metrics together with the pending and queued counts."""
+        return dict(
+            self.metrics.snapshot(),
+            pending=len(self._pending),
+            queued=self._queue.qsize() if self._queue is not None else 0,
+            in_flight=len(self._in_flight),
+        )
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+
+def row_properties(table: str, row_id: Any, row: dict) -> dict:
+    """
+    Map a row to Notion page properties.
+
+    The title comes from the first of name, title, tool_name or agent_name,
+    strings become rich text, numbers become numbers and booleans checkboxes.
+    The target database needs a property of the same name for each column.
+    """
+    title = next((row[column] for column in TITLE_COLUMNS if row.get(column)), f"{table} {row_id}")
+    properties = {"Name": {"title": [{"type": "text", "text": {"content": str(title)[:NOTION_TEXT_LIMIT]}}]}}
+    for column, value in row.items():
+        if column in TITLE_COLUMNS and value == title:
+            continue
+        if isinstance(value, bool):
+            properties[column] = {"checkbox": value}
+        elif isinstance(value, (int, float)):
+            properties[column] = {"number": value}
+        elif isinstance(value, str):
+            properties[column] = rich_text_value(value[:NOTION_TEXT_LIMIT])
+    return properties
+
+
+def notion_http_client(auth_token: str, base_url: str = NOTION_API_URL, **kwargs) -> AsyncHttpClient:
+    """Return an AsyncHttpClient for the Notion API."""
+    headers = {
+        "Authorization": f"Bearer {auth_token}",
+        "Content-Type": "application/json",
+        "Notion-Version": NOTION_VERSION,
+    }
+    return AsyncHttpClient(base_url=base_url, headers=headers, **kwargs)
+
+
+class NotionSink:
+    """
+    Mirrors row changes into Notion databases, one page per row.
+
+    Pages are found by the ROW_KEY_PROPERTY rich text property. Inserts and
+    updates create or patch the row's page, and deletes archive it.
+    """
+
+    def __init__(self, client: AsyncHttpClient, databases: Dict[str, str],
+                 to_properties: Callable[[str, Any, dict], dict] = row_properties,
+                 key_property: str = ROW_KEY_PROPERTY, cache_size: int = 4096):
+        """
+        Args:
+            client (AsyncHttpClient): Client for the Notion API, see notion_http_client.
+            databases (dict): Notion database id by table name. Other tables are skipped.
+            to_properties (callable): Maps (table, row id, row) to page properties.
+            key_property (str): Notion property holding the row id.
+            cache_size (int): Row to page id mappings kept.
+        """
+        self.client = client
+        self.databases = databases
+        self.to_properties = to_properties
+        self.key_property = key_property
+        self._page_ids = TTLCache(max_size=cache_size)
+
+    async def _call(self, method: str, path: str, payload: dict) -> dict:
+        response = await self.client.request(method, path, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    async def _page_id(self, database_id: str, event: ChangeEvent) -> Optional[str]:
+        page_id = self._page_ids.get(event.key)
+        if page_id is not MISSING:
+            return page_id
+        result = await self._call("POST", f"databases/{database_id}/query", {
+            "filter": {"property": self.key_property, "rich_text": {"equals": str(event.row_id)}},
+            "page_size": 1,
+        })
+        page_id = result["results"][0]["id"] if result.get("results") else None
+        if page_id is not None:
+            self._page_ids.set(event.key, page_id)
+        return page_id
+
+    async def push(self, event: ChangeEvent) -> None:
+        """Apply one change to the row's Notion page."""
+        database_id = self.databases.get(event.table)
+        if database_id is None:
+            return
+        page_id = await self._page_id(database_id, event)
+        if event.op == "DELETE":
+            if page_id is not None:
+                await self._call("PATCH", f"pages/{page_id}", {"archived": True})
+                self._page_ids.delete(event.key)
+                NotionClient.invalidate_page(page_id)
+            return
+        properties = self.to_properties(event.table, event.row_id, event.row or {})
+        properties[self.key_property] = rich_text_value(str(event.row_id))
+        if page_id is None:
+            page = await self._call("POST", "pages", {
+                "parent": {"database_id": database_id}, "properties": properties,
+            })
+            self._page_ids.set(event.key, page["id"])
+        else:
+            page = await self._call("PATCH", f"pages/{page_id}", {"properties": properties})
+        if page.get("object") == "page" and page.get("id"):
+            # the sink has no token to cache the page under, so drop older copies
+            NotionClient.invalidate_page(page["id"], page.get("last_edited_time"))
+
+
+def libpq_dsn(url: str) -> str:
+    """Return a libpq connection string for a SQLAlchemy or libpq URL."""
+    if "+" not in url.split("://", 1)[0]:
+        return url
+    from sqlalchemy.engine import make_url
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def pg_row_loader(dsn: str) -> Callable[[ChangeEvent], Awaitable[Optional[dict]]]:
+    """
+    Return a row_loader reading rows back with psycopg2, for truncated notifications.
+    """
+    import psycopg2
+    from psycopg2 import sql
+
+    def load(event: ChangeEvent) -> Optional[dict]:
+        query = sql.SQL("SELECT to_jsonb(t) FROM {} t WHERE {} = %s").format(
+            sql.Identifier(event.table), sql.Identifier(event.key_column)
+        )
+        with psycopg2.connect(libpq_dsn(dsn)) as conn, conn.cursor() as cur:
+            cur.execute(query, (event.row_id,))
+            found = cur.fetchone()
+        return found[0] if found else None
+
+    async def row_loader(event: ChangeEvent) -> Optional[dict]:
+        return await asyncio.to_thread(load, event)
+
+    return row_loader
+
+
+async def listen(dsn: str, channels: Iterable[str], callback: Callable[[str, str], None],
+                 stop: Optional[asyncio.Event] = None, ready: Optional[asyncio.Event] = None,
+                 reconnect_delay: float = 1.0) -> None:
+    """
+    LISTEN on channels and call callback(channel, payload) for each notification.
+
+    The psycopg2 connection is watched by the event loop, so nothing blocks
+    while waiting. The connection is reopened if it drops.
+
+    Args:
+        dsn (str): A SQLAlchemy or libpq PostgreSQL URL.
+        channels (iterable): Channels to listen on.
+        callback (callable): Called on the event loop for each notification.
+        stop (asyncio.Event): Returns once set. Runs forever if None.
+        ready (asyncio.Event): Set once listening.
+        reconnect_delay (float): Seconds to wait before reconnecting.
+    """
+    import psycopg2
+    from psycopg2 import sql
+    from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+    loop = asyncio.get_running_loop()
+    stop = stop or asyncio.Event()
+    channels = list(channels)
+    while not stop.is_set():
+        try:
+            conn = await asyncio.to_thread(psycopg2.connect, libpq_dsn(dsn))
+        except psycopg2.Error as e:
+            logger.error("Cannot connect to listen for changes: %s", e)
+            await asyncio.sleep(reconnect_delay)
+            continue
+        lost = asyncio.Event()
+        watching = False
+        try:
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                for channel in channels:
+                    cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+
+            def on_readable():
+                try:
+                    conn.poll()
+                except psycopg2.Error as e:
+                    logger.error("Lost the change listener connection: %s", e)
+                    loop.remove_reader(conn.fileno())
+                    lost.set()
+                    return
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    try:
+                        callback(notification.channel, notification.payload)
+                    except Exception:
+                        logger.exception("Change callback failed")
+
+            loop.add_reader(conn.fileno(), on_readable)
+            watching = True
+            logger.info("Listening on %s", ", ".join(channels))
+            if ready is not None:
+                ready.set()
+            stopped = asyncio.ensure_future(stop.wait())
+            dropped = asyncio.ensure_future(lost.wait())
+            await asyncio.wait({stopped, dropped}, return_when=asyncio.FIRST_COMPLETED)
+            stopped.cancel()
+            dropped.cancel()
+        except psycopg2.Error as e:
+            # the connection dropped while LISTEN was being set up
+            logger.error("Cannot listen for changes: %s", e)
+        finally:
+            if watching and not lost.is_set() and not conn.closed:
+                loop.remove_reader(conn.fileno())
+            conn.close()
+        if not stop.is_set():
+            await asyncio.sleep(reconnect_delay)
@@ -11,97 +11,243 @@
 """
 This script allows for the integration of Notion with the Eco-Bot application.
 and connection between the postgres database and the Notion API.
+
+Pages read through NotionClient are kept in an in-process cache keyed by auth
+token and page id, so reading several properties of one page costs one request
+and one integration never sees a page fetched with another's token. The Notion
+API has no conditional GET, so entries are checked against the page's
+last_edited_time instead: a response never replaces a newer cached copy,
+writes store the page Notion returns, and change notifications can drop
+entries older than the edit they report.
 """
+import copy
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
+from data.intergration.http_client import http_session
+from data.database.utils.ttl_cache import TTLCache, MISSING
+
+NOTION_API_URL = 'https://api.notion.com/v1/'
+NOTION_VERSION = '2021-08-16'
+PAGE_CACHE_SIZE = int(os.getenv('NOTION_PAGE_CACHE_SIZE', '256'))
+PAGE_CACHE_TTL = float(os.getenv('NOTION_PAGE_CACHE_TTL', '60'))
+
+
+def rich_text_value(text):
+    """Return a rich_text property value holding plain text."""
+    return {'rich_text': [{'type': 'text', 'text': {'content': text}}]}
+
+
+def multi_select_value(tags):
+    """Return a multi_select property value from tag names or option dicts."""
+    return {'multi_select': [{'name': tag} if isinstance(tag, str) else tag for tag in tags]}
+
+
+def select_value(name):
+    """Return a select property value for the option name."""
+    return {'select': {'name': name}}
+
+
+def _page_key(page_id):
+    # Notion accepts ids with or without dashes, and returns them dashed
+    return page_id.replace('-', '')
+
+
+def _token_key(auth_token):
+    # a digest, so the cache never holds the token itself
+    return hashlib.sha256(auth_token.encode()).hexdigest()[:16]
+
 
 class NotionClient:
+    # (token digest, page id) -> page object, shared by every caller in the process
+    page_cache = TTLCache(max_size=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL)
+
     # Define functions to interact with Notion
-    @classmethod
-    def read_from_notion(page_id, auth_token):
-        base_url = 'https://api.notion.com/v1/'
-        headers = {
+    @staticmethod
+    def _headers(auth_token):
+        return {
             'Authorization': f'Bearer {auth_token}',
             'Content-Type': 'application/json',
-            'Notion-Version': '2021-08-16'
+            'Notion-Version': NOTION_VERSION
         }
+
+    @classmethod
+    def cache_page(cls, page, auth_token):
+        """
+        Store a page object unless the cache already holds a newer copy.
+
+        Args:
+            page (dict): A page object returned by the Notion API.
+            auth_token (str): The Notion integration token the page was fetched with.
+
+        Returns:
+            dict: The page now cached.
+        """
+        key = (_token_key(auth_token), _page_key(page['id']))
+        cached = cls.page_cache.get(key)
+        # ISO 8601 UTC timestamps compare as strings; last_edited_time is only
+        # precise to the minute, so an equal time is treated as newer
+        if cached is not MISSING and cached.get('last_edited_time', '') > page.get('last_edited_time', ''):
+            return cached
+        cls.page_cache.set(key, page)
+        return page
+
+    @classmethod
+    def invalidate_page(cls, page_id, last_edited_time=None, auth_token=None):
+        """
+        Drop a cached page, or only copies not newer than last_edited_time.
+
+        Args:
+            page_id (str): The page that changed.
+            last_edited_time (str): When the page was edited, as reported by the
+                change. None drops the page unconditionally.
+            auth_token (str): Only drop the copy fetched with this token. None
+                drops the page for every token, as a change affects them all.
+        """
+        page_key = _page_key(page_id)
+        if auth_token is not None:
+            keys = [(_token_key(auth_token), page_key)]
+        else:
+            keys = [key for key, _ in cls.page_cache.items() if key[1] == page_key]
+        for key in keys:
+            if last_edited_time is not None:
+                cached = cls.page_cache.get(key)
+                if cached is MISSING or cached.get('last_edited_time', '') > last_edited_time:
+                    continue
+            cls.page_cache.delete(key)
+
+    @classmethod
+    def read_from_notion(cls, page_id, auth_token, use_cache=True):
+        # callers get a copy, so editing the result cannot change the cached page
+        if use_cache:
+            cached = cls.page_cache.get((_token_key(auth_token), _page_key(page_id)))
+            if cached is not MISSING:
+                return copy.deepcopy(cached)
         try:
-            response = requests.get(f'{base_url}pages/{page_id}', headers=headers)
+            response = http_session().get(f'{NOTION_API_URL}pages/{page_id}', headers=cls._headers(auth_token))
             response.raise_for_status()
-            return response.json()
+            return copy.deepcopy(cls.cache_page(response.json(), auth_token))
         except requests.RequestException as e:
             print(f'Error fetching data from Notion: {e}')
             return None
+
     @classmethod
-    def write_to_notion(page_id, data, auth_token):
-        base_url = 'https://api.notion.com/v1/'
-        headers = {
-            'Authorization': f'Bearer {auth_token}',
-            'Content-Type': 'application/json',
-            'Notion-Version': '2021-08-16'
-        }
+    def write_to_notion(cls, page_id, data, auth_token):
         try:
-            response = requests.patch(f'{base_url}pages/{page_id}', headers=headers, json=data)
+            response = http_session().patch(
+                f'{NOTION_API_URL}pages/{page_id}', headers=cls._headers(auth_token), json=data
+            )
             response.raise_for_status()
-            return response.json()
+            page = response.json()
         except requests.RequestException as e:
+            cls.invalidate_page(page_id)
             print(f'Error fetching data from Notion: {e}')
             return None
+        if page.get('object') == 'page' and page.get('id'):
+            # copies fetched with other tokens are now stale
+            cls.invalidate_page(page['id'], page.get('last_edited_time'))
+            cls.cache_page(copy.deepcopy(page), auth_token)
+        return page
+
+    @classmethod
+    def update_page_properties(cls, page_id, properties, auth_token):
+        """
+        Patch only the given properties of a page, without reading it first.
+
+        Args:
+            page_id (str): The page to update.
+            properties (dict): Property values by name, in the Notion API format,
+                such as {'status': select_value('Done')}.
+            auth_token (str): The Notion integration token.
+
+        Returns:
+            dict: The updated page, or None if the request failed.
+        """
+        return cls.write_to_notion(page_id, {'properties': properties}, auth_token)
+
+    @classmethod
+    def update_pages(cls, changes, auth_token, max_workers=1):
+        """
+        Apply property changes to several pages, one request per page.
+
+        Changes to the same page are merged in order, so a later value for a
+        property replaces an earlier one and the page is patched once.
+
+        Args:
+            changes (iterable): (page_id, properties) pairs.
+            auth_token (str): The Notion integration token.
+            max_workers (int): Pages patched at once. Notion allows about three
+                requests a second per integration, so keep this small.
+
+        Returns:
+            dict: The updated page, or None on failure, by page id.
+        """
+        merged = {}
+        for page_id, properties in changes:
+            merged.setdefault(page_id, {}).update(properties)
+
+        def patch(item):
+            page_id, properties = item
+            return page_id, cls.update_page_properties(page_id, properties, auth_token)
+
+        if max_workers > 1 and len(merged) > 1:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(merged))) as pool:
+                return dict(pool.map(patch, merged.items()))
+        return dict(map(patch, merged.items()))
+
     @classmethod
-    def get_page_id(page_url):
+    def get_page_id(cls, page_url):
         page_id = page_url.split('/')[-1]
         return page_id
 
-    def get_page_url(page_id):
+    @classmethod
+    def get_page_url(cls, page_id):
         page_url = f'https://www.notion.so/{page_id}'
         return page_url
 
-    def get_page_title(page_id, auth_token):
-        page_data = read_from_notion(page_id, auth_token)
+    @classmethod
+    def get_page_title(cls, page_id, auth_token):
+        page_data = cls.read_from_notion(page_id, auth_token)
         if page_data:
             return page_data['properties']['title']['title'][0]['plain_text']
         else:
             return None
         
-    def get_page_content(page_id, auth_token):
-        page_data = read_from_notion(page_id, auth_token)
+    @classmethod
+    def get_page_content(cls, page_id, auth_token):
+        page_data = cls.read_from_notion(page_id, auth_token)
         if page_data:
             return page_data['properties']['content']['rich_text'][0]['plain_text']
         else:
             return None
         
-    def update_page_content(page_id, new_content, auth_token):
-        page_data = read_from_notion(page_id, auth_token)
-        if page_data:
-            page_data['properties']['content']['rich_text'][0]['plain_text'] = new_content
-            write_to_notion(page_id, page_data, auth_token)
+    @classmethod
+    def update_page_content(cls, page_id, new_content, auth_token):
+        return cls.update_page_properties(page_id, {'content': rich_text_value(new_content)}, auth_token)
 
-    def get_page_tags(page_id, auth_token):
-        page_data = read_from_notion(page_id, auth_token)
+    @classmethod
+    def get_page_tags(cls, page_id, auth_token):
+        page_data = cls.read_from_notion(page_id, auth_token)
         if page_data:
             return page_data['properties']['tags']['multi_select']
         else:
             return None
         
-    def update_page_tags(page_id, new_tags, auth_token):
-        page_data = read_from_notion(page_id, auth_token)
-        if page_data:
-            page_data['properties']['tags']['multi_select'] = new_tags
-            write_to_notion(page_id, page_data, auth_token)
-        else:
-            print('Page not found')
+    @classmethod
+    def update_page_tags(cls, page_id, new_tags, auth_token):
+        return cls.update_page_properties(page_id, {'tags': multi_select_value(new_tags)}, auth_token)
 
-    def get_page_status(page_id, auth_token):
-        page_data = read_from_notion(page_id, auth_token)
+    @classmethod
+    def get_page_status(cls, page_id, auth_token):
+        page_data = cls.read_from_notion(page_id, auth_token)
         if page_data:
             return page_data['properties']['status']['select']['name']
         else:
             return None
         
-    def update_page_status(page_id, new_status, auth_token):
-        page_data = read_from_notion(page_id, auth_token)
-        if page_data:
-            page_data['properties']['status']['select']['name'] = new_status
-            write_to_notion(page_id, page_data, auth_token)
-        else:
-            print('Page not found')
\ No newline at end of file
+    @classmethod
+    def update_page_status(cls, page_id, new_status, auth_token):
+        return cls.update_page_properties(page_id, {'status': select_value(new_status)}, auth_token)
@@ -0,0 +1,231 @@
+# eco_buddies/context_builder.py
+"""
+Builds the messages EcoBot sends to the chat completions API.
+
+Instead of sending the whole conversation every turn, ContextBuilder keeps a
+token-counted sliding window of the most recent messages and folds the
+messages that drop out of the window into a rolling summary. The summary is
+updated incrementally, only when messages leave the window, so the prompt
+stays within max_tokens however long the session runs.
+
+Updating the summary is itself a model call, so by default it runs on a
+background thread and building the prompt never waits for it. Until the new
+summary is ready the prompt carries the previous one, and the messages being
+summarized are briefly left out.
+
+Tokens are counted with tiktoken when it is installed, and estimated at four
+characters per token otherwise.
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is optional
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Tokens the API adds around every message
+MESSAGE_OVERHEAD = 4
+
+# Roles used in the stored history that the API does not accept
+_ROLE_ALIASES = {"Eco-Bot": "assistant"}
+
+_encodings: Dict[str, object] = {}
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """
+    Count the tokens in text.
+
+    Parameters:
+        text (str): The text to count.
+        model (str): The model whose tokenizer is used when tiktoken is installed.
+
+    Returns:
+        int: The number of tokens.
+    """
+    if tiktoken is not None:
+        encoding = _encodings.get(model)
+        if encoding is None:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+            _encodings[model] = encoding
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def to_api_message(message: dict) -> dict:
+    """
+    Return a stored history message in the form the chat completions API expects.
+    """
+    role = _ROLE_ALIASES.get(message.get("role"), message.get("role", "user"))
+    return {"role": role, "content": message.get("content", "")}
+
+
+class ContextBuilder:
+    """
+    Assembles [system message, summary of older turns, recent turns] within a token budget.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 3000,
+        summary_tokens: int = 400,
+        summarize: Optional[Callable[[str, List[dict], int], str]] = None,
+        model: str = "gpt-4",
+        low_watermark: float = 0.6,
+        background: bool = True,
+    ):
+        """
+        Parameters:
+            max_tokens (int): Budget for the whole prompt.
+            summary_tokens (int): Budget reserved for the rolling summary.
+            summarize (callable): Called as summarize(previous_summary, messages,
+                summary_tokens) and returns the updated summary. Without it,
+                messages that leave the window are dropped.
+            model (str): Model used for token counting.
+            low_watermark (float): When the window overflows it is trimmed to this
+                fraction of its budget, so summarize runs every few turns rather
+                than on every turn.
+            background (bool): Run summarize on a worker thread instead of in build.
+        """
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize
+        self.model = model
+        self.low_watermark = low_watermark
+        self.background = background
+        self.summary = ""
+        self.summarize_calls = 0
+        # index of the first history message not yet folded into the summary
+        self._window_start = 0
+        # number of history messages self.summary covers, behind _window_start
+        # while an update is running
+        self._summarized = 0
+        self._token_counts: List[int] = []
+        self._lock = threading.Lock()
+        # bumped by reset, so an update started before it is discarded
+        self._generation = 0
+        self._summarizer: Optional[ThreadPoolExecutor] = None
+        self._pending: Optional[Future] = None
+
+    def reset(self) -> None:
+        """
+        Forget the summary and cached token counts, e.g. after the history is reloaded.
+        """
+        with self._lock:
+            self._generation += 1
+            self.summary = ""
+            self._summarized = 0
+        self._window_start = 0
+        self._token_counts = []
+
+    def restore(self, summary: str, summarized: int) -> None:
+        """
+        Resume from a saved summary of the first summarized history messages.
+
+        Parameters:
+            summary (str): The summary, as returned by summary_state.
+            summarized (int): Number of messages at the start of the history it covers.
+        """
+        self.reset()
+        with self._lock:
+            self.summary = summary
+            self._summarized = summarized
+        self._window_start = summarized
+
+    def summary_state(self) -> Tuple[str, int]:
+        """
+        Return the summary and the number of history messages it covers.
+        """
+        with self._lock:
+            return self.summary, self._summarized
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """
+        Block until the summary updates started so far have finished.
+        """
+        pending = self._pending
+        if pending is not None:
+            wait([pending], timeout)
+
+    def _count(self, message: dict) -> int:
+        return count_tokens(str(message.get("content", "")), self.model) + MESSAGE_OVERHEAD
+
+    def _update_counts(self, history: List[dict]) -> None:
+        if len(history) < len(self._token_counts):
+            # the history was replaced, not appended to
+            self.reset()
+        for message in history[len(self._token_counts):]:
+            self._token_counts.append(self._count(message))
+
+    def _fold(self, history: List[dict], new_start: int) -> None:
+        """
+        Move history[_window_start:new_start] out of the window and into the summary.
+        """
+        dropped = history[self._window_start:new_start]
+        self._window_start = new_start
+        if not dropped or self.summarize is None:
+            return
+        messages = [to_api_message(m) for m in dropped]
+        if not self.background:
+            self._update_summary(messages, new_start, self._generation)
+            return
+        with self._lock:
+            if self._summarizer is None:
+                # one worker, so each update starts from the summary the previous one produced
+                self._summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-summary")
+            self._pending = self._summarizer.submit(self._update_summary, messages, new_start, self._generation)
+
+    def _update_summary(self, messages: List[dict], summarized: int, generation: int) -> None:
+        try:
+            summary = self.summarize(self.summary, messages, self.summary_tokens)
+        except Exception as e:
+            logger.warning("Could not update the conversation summary: %s", e)
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self.summary = summary
+            self._summarized = summarized
+            self.summarize_calls += 1
+
+    def build(self, system_message: str, history: List[dict]) -> List[dict]:
+        """
+        Return the messages to send for the current turn.
+
+        Parameters:
+            system_message (str): The bot's system message.
+            history (list): The whole conversation so far, ending with the user's input.
+
+        Returns:
+            list: Chat completion messages within max_tokens.
+        """
+        self._update_counts(history)
+        fixed = count_tokens(system_message, self.model) + MESSAGE_OVERHEAD
+        window_budget = max(self.max_tokens - fixed - self.summary_tokens - MESSAGE_OVERHEAD, 0)
+
+        window_tokens = sum(self._token_counts[self._window_start:])
+        if window_tokens > window_budget:
+            target = window_budget * self.low_watermark
+            start = self._window_start
+            # always keep the latest message, even if it alone exceeds the budget
+            while start < len(history) - 1 and window_tokens > target:
+                window_tokens -= self._token_counts[start]
+                start += 1
+            self._fold(history, start)
+
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        summary = self.summary
+        if summary:
+            messages.append({"role": "system", "content": "Summary of the earlier conversation: " + summary})
+        messages.extend(to_api_message(m) for m in history[self._window_start:])
+        return messages
@@ -28,10 +28,15 @@
 """
 import os
 import json
+import queue
+import asyncio
 import logging
-from typing import Optional
+from typing import AsyncIterator, Iterator, Optional
 import openai
 from dotenv import load_dotenv
+from eco_buddies.response_cache import ResponseCache
+from eco_buddies.history_store import JsonlHistoryStore
+from eco_buddies.context_builder import ContextBuilder
 # Set up logging
 LOG_FILE = "../agents/log/eco_bot.log"
 logging.basicConfig(filename=LOG_FILE, level=logging.INFO,
@@ -48,6 +53,26 @@ logging.info("Eco-Bot program started")
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 openai.api_key = api_key
+# Response cache settings
+CACHE_SIZE = int(os.getenv("ECO_BOT_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("ECO_BOT_CACHE_TTL", "3600"))
+SEMANTIC_CACHE = os.getenv("ECO_BOT_SEMANTIC_CACHE", "false").lower() in ("1", "true", "yes")
+SEMANTIC_THRESHOLD = float(os.getenv("ECO_BOT_SEMANTIC_THRESHOLD", "0.92"))
+EMBEDDING_MODEL = os.getenv("ECO_BOT_EMBEDDING_MODEL", "text-embedding-3-small")
+# Conversation history settings
+HISTORY_DIR = os.getenv("ECO_BOT_HISTORY_DIR", "conversation_history")
+HISTORY_LIMIT = int(os.getenv("ECO_BOT_HISTORY_LIMIT", "50"))
+LEGACY_HISTORY_FILE = "conversation_history.json"
+# Prompt size settings
+CHAT_MODEL = "gpt-4-1106-preview"
+CONTEXT_TOKENS = int(os.getenv("ECO_BOT_CONTEXT_TOKENS", "3000"))
+SUMMARY_TOKENS = int(os.getenv("ECO_BOT_SUMMARY_TOKENS", "400"))
+SUMMARY_MODEL = os.getenv("ECO_BOT_SUMMARY_MODEL", "gpt-3.5-turbo")
+# Group chat the turns are recorded under in the messages and chat_history tables
+CHAT_ID = int(os.environ["ECO_BOT_CHAT_ID"]) if os.getenv("ECO_BOT_CHAT_ID") else None
+# Conversation thread and agent row the recorded messages point at
+THREAD_ID = int(os.environ["ECO_BOT_THREAD_ID"]) if os.getenv("ECO_BOT_THREAD_ID") else None
+AGENT_ID = int(os.environ["ECO_BOT_AGENT_ID"]) if os.getenv("ECO_BOT_AGENT_ID") else None
 # Define the conversation history
 # TODO: load the conversation history from the agent db
 # TODO: save the conversation history to the agent db
@@ -78,6 +103,44 @@ def load_personality(filepath: str) -> Optional[dict]:
     finally:
         logging.info("Personality loaded from %s", filepath)
         print(f"Personality loaded from {filepath}")
+def embed_prompt(text: str) -> list:
+    """
+    Return the embedding of a prompt, used by the semantic response cache.
+    """
+    return openai.embeddings.create(model=EMBEDDING_MODEL, input=text).data[0].embedding
+def summarize_history(summary: str, messages: list, max_tokens: int) -> str:
+    """
+    Fold messages that left the context window into the running summary.
+
+    Parameters:
+        summary (str): The summary so far, possibly empty.
+        messages (list): The chat messages to add to it.
+        max_tokens (int): Token budget for the new summary.
+
+    Returns:
+        str: The updated summary.
+    """
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    api_response = openai.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": "Update the summary of a conversation between a user and EcoBot. "
+                                          "Keep facts, preferences and open questions. Be brief."},
+            {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+        ],
+        max_tokens=max_tokens,
+    )
+    return api_response.choices[0].message.content.strip()
+def create_response_cache() -> ResponseCache:
+    """
+    Build the response cache from the ECO_BOT_CACHE_* and ECO_BOT_SEMANTIC_* settings.
+    """
+    return ResponseCache(
+        max_size=CACHE_SIZE,
+        ttl=CACHE_TTL,
+        embed=embed_prompt if SEMANTIC_CACHE else None,
+        similarity_threshold=SEMANTIC_THRESHOLD,
+    )
 personality = load_personality(filepath="../eco_buddies/eco_bot_personality.json")
 system_message = {
         """
@@ -95,21 +158,75 @@ class EcoBot():
     """
     Class representing the EcoBot.
     """
-    def __init__(self):
+    def __init__(
+        self,
+        response_cache: Optional[ResponseCache] = None,
+        session_id: str = "default",
+        history_store: Optional[JsonlHistoryStore] = None,
+        history_limit: int = HISTORY_LIMIT,
+        context_builder: Optional[ContextBuilder] = None,
+        personality: Optional[dict] = None,
+        chat_id: Optional[int] = CHAT_ID,
+        message_writer=None,
+        thread_id: Optional[int] = THREAD_ID,
+        agent_id: Optional[int] = AGENT_ID,
+    ):
         """
         Initializes the object with the given personality.
 
         Parameters:
             personality_data (dict): A dictionary containing the personality traits of the object.
+            response_cache (ResponseCache): Cache of previous answers. Defaults to
+                one built from the ECO_BOT_CACHE_* settings.
+            session_id (str): Identifies the conversation whose history is loaded and saved.
+            history_store (JsonlHistoryStore): Where the history is kept. Defaults to
+                a per-session file in ECO_BOT_HISTORY_DIR.
+            history_limit (int): Number of past messages loaded at startup.
+            context_builder (ContextBuilder): Keeps the prompt within a token budget.
+                Defaults to one built from the ECO_BOT_CONTEXT_* and ECO_BOT_SUMMARY_* settings.
+            personality (dict): Already loaded personality data, so many bots can share
+                one copy. Read from eco_bot_personality.json when not given.
+            chat_id (int): Group chat to record each message under in the database.
+                Nothing is written to the database when None, the default unless
+                ECO_BOT_CHAT_ID is set.
+            message_writer (WriteBehindWriter): Writes the rows in the background.
+                Defaults to the process-wide write_behind.default_writer().
+            thread_id (int): conversation_threads row set as each message's threadid.
+                Defaults to ECO_BOT_THREAD_ID.
+            agent_id (int): agents row set as the agentid of Eco-Bot's messages.
+                The user's messages have no agentid. Defaults to ECO_BOT_AGENT_ID.
 
         Returns:
             None
         """
         # Initialize conversation_history as an instance attribute
         self.conversation_history = []
-        with open("../eco_buddies/eco_bot_personality.json", encoding="utf-8") as f:
-            self.personality = json.load(f)
+        self.history_store = history_store or JsonlHistoryStore(HISTORY_DIR, session_id)
+        self.history_limit = history_limit
+        self.chat_id = chat_id
+        self.message_writer = message_writer
+        self.thread_id = thread_id
+        self.agent_id = agent_id
+        # Number of messages in conversation_history already written to the store
+        self._saved_messages = 0
+        # (summary, messages it covers) last written next to the history
+        self._saved_summary = ("", 0)
+        self.context_builder = context_builder or ContextBuilder(
+            max_tokens=CONTEXT_TOKENS,
+            summary_tokens=SUMMARY_TOKENS,
+            summarize=summarize_history,
+            model=CHAT_MODEL,
+        )
+        if personality is None:
+            with open("../eco_buddies/eco_bot_personality.json", encoding="utf-8") as f:
+                personality = json.load(f)
+        self.personality = personality
         self.system_message = self.personality.get("system_message", "")
+        self.response_cache = response_cache if response_cache is not None else create_response_cache()
+        self.cache_scope = ResponseCache.scope_for(
+            self.system_message, json.dumps(self.personality, sort_keys=True)
+        )
+        self._turn_scope = self.cache_scope
         self.load_conversation_history()
         logging.info("EcoBot initialized with personality: %s", self.personality)
         print(f"EcoBot initialized with personality: {self.personality}")
@@ -122,25 +239,22 @@ class EcoBot():
         :return: The response generated by the Eco-Bot.
         :rtype: str
         """
-        # Add the user input to the conversation history
-        self.conversation_history.append({"role": "user", "content": user_input})
-        self.save_conversation_history()
-        # Construct the prompt from the conversation history
-        prompt_text = self.system_message + "\n".join(
-            [message['content'] for message in self.conversation_history]
-        )
+        cached_response = self._start_turn(user_input)
+        if cached_response is not None:
+            return cached_response
+        # Recent turns plus a summary of older ones, within the token budget
+        messages = self.context_builder.build(self.system_message, self.conversation_history)
 
         try:
             api_response = openai.chat.completions.create(
-                model="gpt-4-1106-preview",
-                messages=self.personality[prompt_text],
+                model=CHAT_MODEL,
+                messages=messages,
                 max_tokens= 5000  # Adjust max_tokens as needed
             )
-            ecobot_response = api_response.choices[0].text.strip()
+            ecobot_response = api_response.choices[0].message.content.strip()
 
             # Add the bot response to the conversation history
-            self.conversation_history.append({"role": "Eco-Bot", "content": ecobot_response})
-            self.save_conversation_history()
+            self._finish_turn(user_input, [ecobot_response], complete=True)
             return ecobot_response
         except openai.OpenAIError as e:  # Specific OpenAI error
             logging.error("OpenAI API error: %s", e)
@@ -148,30 +262,214 @@ class EcoBot():
         except TimeoutError as e:  # Handle timeout issues
             logging.error("Timeout error: %s", e)
             return "Sorry, the request timed out."
+    def stream_response(self, user_input: str) -> Iterator[str]:
+        """
+        Generates a response based on the user input, yielding it as it is produced.
+
+        The conversation history is saved once the stream finishes. A cached
+        response is yielded whole.
+
+        :param user_input: The input provided by the user.
+        :type user_input: str
+        :return: The pieces of the response generated by the Eco-Bot.
+        :rtype: Iterator[str]
+        """
+        cached_response = self._start_turn(user_input)
+        if cached_response is not None:
+            yield cached_response
+            return
+        messages = self.context_builder.build(self.system_message, self.conversation_history)
+
+        pieces = []
+        complete = False
+        try:
+            stream = openai.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                max_tokens= 5000,  # Adjust max_tokens as needed
+                stream=True,
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    pieces.append(delta)
+                    yield delta
+        except openai.OpenAIError as e:  # Specific OpenAI error
+            logging.error("OpenAI API error: %s", e)
+            if not pieces:
+                yield "Sorry, there was an issue with the AI service."
+                return
+        except TimeoutError as e:  # Handle timeout issues
+            logging.error("Timeout error: %s", e)
+            if not pieces:
+                yield "Sorry, the request timed out."
+                return
+        else:
+            complete = True
+        finally:
+            # also runs when the caller stops reading early, keeping what was shown
+            self._finish_turn(user_input, pieces, complete)
+    async def astream_response(self, user_input: str, client: openai.AsyncOpenAI) -> AsyncIterator[str]:
+        """
+        Asynchronous version of stream_response using an AsyncOpenAI client.
+
+        Blocking work such as the history summary runs in a worker thread, so
+        one session does not hold up the event loop for the others. Calls for
+        the same bot must not overlap.
+
+        :param user_input: The input provided by the user.
+        :type user_input: str
+        :param client: The client used for the chat completion.
+        :type client: openai.AsyncOpenAI
+        :return: The pieces of the response generated by the Eco-Bot.
+        :rtype: AsyncIterator[str]
+        """
+        cached_response = await asyncio.to_thread(self._start_turn, user_input)
+        if cached_response is not None:
+            yield cached_response
+            return
+        messages = await asyncio.to_thread(
+            self.context_builder.build, self.system_message, self.conversation_history
+        )
+
+        pieces = []
+        complete = False
+        try:
+            stream = await client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                max_tokens= 5000,  # Adjust max_tokens as needed
+                stream=True,
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    pieces.append(delta)
+                    yield delta
+        except openai.OpenAIError as e:  # Specific OpenAI error
+            logging.error("OpenAI API error: %s", e)
+            if not pieces:
+                yield "Sorry, there was an issue with the AI service."
+                return
+        except (TimeoutError, asyncio.TimeoutError) as e:  # Handle timeout issues
+            logging.error("Timeout error: %s", e)
+            if not pieces:
+                yield "Sorry, the request timed out."
+                return
+        else:
+            complete = True
+        finally:
+            # saving the history and caching the response touch the disk
+            await asyncio.to_thread(self._finish_turn, user_input, pieces, complete)
+    def _finish_turn(self, user_input: str, pieces: list, complete: bool) -> None:
+        """
+        Record the generated response, and cache it if it was received in full.
+        """
+        if not pieces:
+            return
+        response = "".join(pieces).strip()
+        if complete:
+            self.response_cache.set(user_input, response, self._turn_scope)
+        self.conversation_history.append({"role": "Eco-Bot", "content": response})
+        self.save_conversation_history()
+        self._record_message(response, from_bot=True)
+    def _record_message(self, content: str, from_bot: bool = False) -> None:
+        """
+        Queue a Message and ChatHistory row for content, without waiting for the commit.
+
+        The message is linked to the conversation thread, and to Eco-Bot's agent
+        row when from_bot is set, so it can be found again from either.
+        """
+        if self.chat_id is None:
+            return
+        if self.message_writer is None:
+            # imported here so bots without a database never load the models
+            from data.database.utils.write_behind import default_writer
+            self.message_writer = default_writer()
+        try:
+            message = {"content": content, "threadid": self.thread_id}
+            if from_bot:
+                message["agentid"] = self.agent_id
+            self.message_writer.submit_chat_turn(message, self.chat_id)
+        except (queue.Full, RuntimeError) as e:
+            logging.error("Failed to queue chat message for the database: %s", e)
+    def _start_turn(self, user_input: str) -> Optional[str]:
+        """
+        Record the user's input and return a cached response for it, if there is one.
+
+        Responses are cached per conversation so far, so only a turn asked after
+        the same messages (for example the first turn of a session) is answered
+        from the cache. A cached response is also recorded in the conversation history.
+        """
+        # The answer depends on everything said before, so that is part of the cache key
+        self._turn_scope = ResponseCache.context_scope(self.cache_scope, self.conversation_history)
+        # Add the user input to the conversation history
+        self.conversation_history.append({"role": "user", "content": user_input})
+        self.save_conversation_history()
+        self._record_message(user_input)
+        # Answer repeated questions without calling the API
+        cached_response = self.response_cache.get(user_input, self._turn_scope)
+        if cached_response is not None:
+            self.conversation_history.append({"role": "Eco-Bot", "content": cached_response})
+            self.save_conversation_history()
+            self._record_message(cached_response, from_bot=True)
+        return cached_response
     def save_conversation_history(self):
         """
-        Save the conversation history to a JSON file.
+        Append the messages added since the last save to the history store.
 
         No parameters.
         No return value.
         """
+        new_messages = self.conversation_history[self._saved_messages:]
+        if not new_messages:
+            return
         try:
-            with open("conversation_history.json", "w", encoding="utf-8") as file:
-                json.dump(self.conversation_history, file, indent=4)
+            self.history_store.extend(new_messages)
+            self._saved_messages = len(self.conversation_history)
         except IOError as e:
             logging.error("Failed to save conversation history: %s", e)
+            return
+        self._save_summary()
+    def _save_summary(self) -> None:
+        """
+        Store the context summary next to the history once it has changed, so it survives a restart.
+        """
+        summary, summarized = self.context_builder.summary_state()
+        if (summary, summarized) == self._saved_summary:
+            return
+        try:
+            self.history_store.save_summary(summary, max(self._saved_messages - summarized, 0))
+            self._saved_summary = (summary, summarized)
+        except IOError as e:
+            logging.error("Failed to save conversation summary: %s", e)
     def load_conversation_history(self):
         """
-        Load conversation history from "conversation_history.json" and handle exceptions.
+        Load the last history_limit messages of this session from the history store.
+
+        A conversation_history.json left by earlier versions is imported into the
+        default session on first use. The context builder resumes from the saved
+        summary, if there is one.
         """
         try:
-            with open("conversation_history.json", "r", encoding="utf-8") as file:
-                self.conversation_history = json.load(file)
-        except FileNotFoundError:
-            # No existing history, start with an empty list
+            if self.history_store.session_id == "default":
+                self.history_store.import_legacy(LEGACY_HISTORY_FILE)
+            self.conversation_history = self.history_store.tail(self.history_limit)
+        except IOError as e:
+            logging.error("Failed to load conversation history: %s", e)
             self.conversation_history = []
-        except json.JSONDecodeError as e:
-            logging.error("Error decoding conversation history: %s", e)
+        self._saved_messages = len(self.conversation_history)
+        summary, unsummarized = self.history_store.load_summary()
+        if summary:
+            # the summary covers everything before the last unsummarized messages
+            self.context_builder.restore(summary, max(len(self.conversation_history) - unsummarized, 0))
+        else:
+            self.context_builder.reset()
+        self._saved_summary = self.context_builder.summary_state()
 
 # Main execution
 if __name__ == "__main__":
@@ -0,0 +1,233 @@
+# eco_buddies/engine.py
+"""
+Serves many EcoBot chat sessions from one process.
+
+Each session id gets its own EcoBot, so conversation histories never mix.
+Bots are kept in a bounded least-recently-used map and share one personality,
+one response cache and one AsyncOpenAI client. A semaphore caps the number of
+chat completions in flight, and a per-session lock keeps the turns of one
+session in order without serialising the others. A session with a turn in
+progress or waiting is never dropped from the map, so its bot is not rebuilt
+from disk while it is still writing history.
+
+Async callers use astream and agenerate, always from the same event loop.
+Synchronous callers such as Streamlit scripts use stream and generate, which
+run the async methods on a background event loop owned by the engine; do not
+mix the two on one engine.
+
+    engine = default_engine()
+    for piece in engine.stream(session_id, "How do I compost?"):
+        print(piece, end="")
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_SESSIONS = int(os.getenv("ECO_BOT_MAX_SESSIONS", "1000"))
+MAX_CONCURRENCY = int(os.getenv("ECO_BOT_MAX_CONCURRENCY", "32"))
+
+_DONE = object()
+
+
+class EcoBotEngine:
+    """
+    Session-keyed EcoBot front end with bounded API concurrency.
+    """
+
+    def __init__(
+        self,
+        bot_factory: Optional[Callable[[str], object]] = None,
+        client=None,
+        max_sessions: int = MAX_SESSIONS,
+        max_concurrency: int = MAX_CONCURRENCY,
+    ):
+        """
+        Parameters:
+            bot_factory (callable): Builds the bot for a session id. Defaults to
+                an EcoBot sharing the engine's personality and response cache.
+            client (openai.AsyncOpenAI): Client shared by every session. Created
+                on first use when not given.
+            max_sessions (int): Sessions kept in memory. The least recently used
+                idle one is dropped beyond this; its history is already saved and is
+                reloaded if the session returns. Busy sessions are kept even when
+                that leaves more than max_sessions.
+            max_concurrency (int): Maximum number of chat completions in flight.
+        """
+        self.bot_factory = bot_factory or self._default_bot_factory()
+        self.max_sessions = max_sessions
+        self._client = client
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._sessions: "OrderedDict[str, object]" = OrderedDict()
+        # session id -> [lock, number of turns using it], only while a turn runs or waits
+        self._session_locks: Dict[str, list] = {}
+        # guards the two maps above; held only for dictionary operations
+        self._registry_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _default_bot_factory() -> Callable[[str], object]:
+        # imported here because eco_chat loads the personality file on import
+        from eco_buddies import eco_chat
+
+        # Safe to share: responses are keyed on the conversation before each prompt,
+        # so one session only reuses another's answer after an identical history
+        shared_cache = eco_chat.create_response_cache()
+        personality = eco_chat.personality
+
+        def build(session_id: str):
+            return eco_chat.EcoBot(
+                response_cache=shared_cache, session_id=session_id, personality=personality
+            )
+        return build
+
+    @property
+    def client(self):
+        """
+        The AsyncOpenAI client shared by every session.
+        """
+        if self._client is None:
+            import openai
+            self._client = openai.AsyncOpenAI()
+        return self._client
+
+    def session(self, session_id: str):
+        """
+        Return the bot for session_id, creating it if needed.
+        """
+        with self._registry_lock:
+            bot = self._sessions.get(session_id)
+            if bot is not None:
+                self._sessions.move_to_end(session_id)
+                return bot
+        # build outside the lock, since loading the history reads from disk
+        bot = self.bot_factory(session_id)
+        with self._registry_lock:
+            bot = self._sessions.setdefault(session_id, bot)
+            self._sessions.move_to_end(session_id)
+            excess = len(self._sessions) - self.max_sessions
+            if excess > 0:
+                idle = [key for key in self._sessions if key != session_id and key not in self._session_locks]
+                for evicted in idle[:excess]:
+                    del self._sessions[evicted]
+                    logger.debug("Dropped idle EcoBot session %s", evicted)
+        return bot
+
+    @asynccontextmanager
+    async def _session_turn(self, session_id: str) -> AsyncIterator[None]:
+        """
+        Hold the session's lock for one turn, dropping the lock once no turn needs it.
+        """
+        with self._registry_lock:
+            entry = self._session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+            entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            with self._registry_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._session_locks[session_id]
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def astream(self, session_id: str, user_input: str) -> AsyncIterator[str]:
+        """
+        Yield the response to user_input in the given session as it is generated.
+
+        Parameters:
+            session_id (str): Identifies the user's chat session.
+            user_input (str): The input provided by the user.
+
+        Returns:
+            AsyncIterator[str]: The pieces of the response.
+        """
+        async with self._session_turn(session_id):
+            bot = await asyncio.to_thread(self.session, session_id)
+            async with self._semaphore:
+                async for piece in bot.astream_response(user_input, self.client):
+                    yield piece
+
+    async def agenerate(self, session_id: str, user_input: str) -> str:
+        """
+        Return the whole response to user_input in the given session.
+        """
+        return "".join([piece async for piece in self.astream(session_id, user_input)])
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._registry_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever, name="eco-bot-engine", daemon=True
+                )
+                self._loop_thread.start()
+            return self._loop
+
+    def generate(self, session_id: str, user_input: str, timeout: Optional[float] = None) -> str:
+        """
+        Blocking version of agenerate, run on the engine's event loop.
+        """
+        future = asyncio.run_coroutine_threadsafe(self.agenerate(session_id, user_input), self._ensure_loop())
+        return future.result(timeout)
+
+    def stream(self, session_id: str, user_input: str) -> Iterator[str]:
+        """
+        Blocking version of astream, run on the engine's event loop.
+
+        Suitable for st.write_stream.
+        """
+        pieces: "queue.Queue" = queue.Queue()
+
+        async def pump():
+            try:
+                async for piece in self.astream(session_id, user_input):
+                    pieces.put(piece)
+            except BaseException as e:
+                pieces.put(e)
+                raise
+            finally:
+                pieces.put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._ensure_loop())
+        try:
+            while True:
+                piece = pieces.get()
+                if piece is _DONE:
+                    break
+                if isinstance(piece, BaseException):
+                    raise piece
+                yield piece
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def close(self) -> None:
+        """
+        Stop the background event loop, if it was started.
+        """
+        with self._registry_lock:
+            loop, thread = self._loop, self._loop_thread
+            self._loop = self._loop_thread = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+
+@lru_cache(maxsize=None)
+def default_engine() -> EcoBotEngine:
+    """
+    Return the process-wide engine used by the Streamlit pages.
+    """
+    return EcoBotEngine()
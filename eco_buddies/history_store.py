@@ -0,0 +1,210 @@
+# eco_buddies/history_store.py
+"""
+Append-only conversation history for EcoBot.
+
+Each chat session gets its own JSON Lines file with one message per line.
+Saving a message appends a single line, so the cost of a turn no longer grows
+with the length of the conversation, and startup reads only the last N turns
+from the end of the file instead of parsing the whole history.
+
+The rolling summary of older messages is kept next to the file, so a
+restarted bot does not have to summarize the conversation again.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+_BLOCK_SIZE = 8192
+# Longer escaped ids are hashed to stay within file name limits
+_MAX_NAME_LENGTH = 200
+
+
+def session_file_name(session_id: str) -> str:
+    """
+    Map a session id to a file name, so that different ids never share a file.
+
+    Characters other than letters, digits and "_.-" are percent-encoded, which
+    can be reversed with urllib.parse.unquote. Ids too long for a file name are
+    replaced by their SHA-256 digest.
+
+    Parameters:
+        session_id (str): Identifies the session.
+
+    Returns:
+        str: The file name, without the .jsonl extension.
+    """
+    name = quote(session_id, safe="")
+    if len(name) > _MAX_NAME_LENGTH or name in ("", ".", ".."):
+        return "sha256-" + hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+    return name
+
+
+class JsonlHistoryStore:
+    """
+    Stores the messages of one chat session in <directory>/<session_id>.jsonl,
+    and its summary in <directory>/<session_id>.summary.json.
+    """
+
+    def __init__(self, directory: str = "conversation_history", session_id: str = "default"):
+        """
+        Parameters:
+            directory (str): Folder holding one file per session.
+            session_id (str): Identifies the session. Characters that are not
+                safe in file names are escaped, see session_file_name.
+        """
+        self.directory = Path(directory)
+        self.session_id = session_id
+        self.path = self.directory / f"{session_file_name(session_id)}.jsonl"
+        self.summary_path = self.directory / f"{session_file_name(session_id)}.summary.json"
+        self._lock = threading.Lock()
+
+    def append(self, message: dict) -> None:
+        """
+        Append one message to the session file.
+        """
+        self.extend([message])
+
+    def extend(self, messages: Iterable[dict]) -> None:
+        """
+        Append messages to the session file with a single write.
+        """
+        lines = "".join(json.dumps(message, ensure_ascii=False) + "\n" for message in messages)
+        if not lines:
+            return
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(lines)
+
+    def tail(self, n: int) -> List[dict]:
+        """
+        Return the last n messages, reading backwards from the end of the file.
+
+        Parameters:
+            n (int): Number of messages to return.
+
+        Returns:
+            list: Up to n messages, oldest first.
+        """
+        if n <= 0 or not self.path.exists():
+            return []
+        with self._lock, open(self.path, "rb") as file:
+            file.seek(0, os.SEEK_END)
+            position = file.tell()
+            buffer = b""
+            # n lines need n + 1 newlines unless the start of the file is reached
+            while position > 0 and buffer.count(b"\n") <= n:
+                read_size = min(_BLOCK_SIZE, position)
+                position -= read_size
+                file.seek(position)
+                buffer = file.read(read_size) + buffer
+        lines = buffer.splitlines()
+        if position > 0:
+            # the first line is probably partial
+            lines = lines[1:]
+        return self._decode(lines[-n:])
+
+    def __iter__(self) -> Iterator[dict]:
+        """
+        Iterate over every stored message, oldest first.
+        """
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as file:
+            for message in self._decode(file):
+                yield message
+
+    def _decode(self, lines: Iterable[bytes]) -> List[dict]:
+        messages = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                messages.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                # a crash mid-write can leave a truncated last line
+                logger.error("Skipping unreadable history line in %s: %s", self.path, e)
+        return messages
+
+    def import_legacy(self, json_path: str) -> bool:
+        """
+        Copy a conversation_history.json list into this store, once.
+
+        Only runs when the session file does not exist yet.
+
+        Parameters:
+            json_path (str): Path to the old JSON history file.
+
+        Returns:
+            bool: True if messages were imported.
+        """
+        if self.path.exists() or not os.path.exists(json_path):
+            return False
+        try:
+            with open(json_path, "r", encoding="utf-8") as file:
+                messages = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error("Could not import legacy history %s: %s", json_path, e)
+            return False
+        self.extend(messages)
+        logger.info("Imported %d messages from %s into %s", len(messages), json_path, self.path)
+        return True
+
+    def save_summary(self, summary: str, unsummarized: int) -> None:
+        """
+        Store the summary of the older messages, replacing the previous one.
+
+        Parameters:
+            summary (str): The summary.
+            unsummarized (int): Number of messages at the end of the file it does not cover.
+        """
+        with self._lock:
+            # messages appended later are found by reading from this offset
+            size = self.path.stat().st_size if self.path.exists() else 0
+            self.directory.mkdir(parents=True, exist_ok=True)
+            temporary = self.summary_path.with_suffix(".tmp")
+            with open(temporary, "w", encoding="utf-8") as file:
+                json.dump({"summary": summary, "unsummarized": unsummarized, "size": size}, file, ensure_ascii=False)
+            os.replace(temporary, self.summary_path)
+
+    def load_summary(self) -> Tuple[str, int]:
+        """
+        Return the stored summary and the number of messages at the end of the file it does not cover.
+
+        Messages appended since the summary was saved are not covered by it.
+
+        Returns:
+            tuple: The summary, empty if there is none, and the message count.
+        """
+        if not self.summary_path.exists():
+            return "", 0
+        try:
+            with open(self.summary_path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+            with self._lock, open(self.path, "rb") as history:
+                if os.fstat(history.fileno()).st_size < state["size"]:
+                    # the history was replaced since
+                    return "", 0
+                history.seek(state["size"])
+                appended = sum(block.count(b"\n") for block in iter(lambda: history.read(_BLOCK_SIZE), b""))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error("Could not load the conversation summary %s: %s", self.summary_path, e)
+            return "", 0
+        return state["summary"], state["unsummarized"] + appended
+
+    def clear(self) -> None:
+        """
+        Delete the session file and its summary.
+        """
+        with self._lock:
+            for path in (self.path, self.summary_path):
+                if path.exists():
+                    path.unlink()
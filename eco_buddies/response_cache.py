@@ -0,0 +1,310 @@
+# eco_buddies/response_cache.py
+"""
+A response cache for EcoBot.
+
+Much of EcoBot's traffic repeats the same questions ("how do I compost?",
+"How do I compost"). Responses are cached under a hash of the normalised
+prompt and a scope, so an exact repeat is answered from memory. The scope
+covers everything else the model sees: the personality and system message,
+and the conversation so far (see context_scope), so a turn that depends on
+earlier messages is never answered with a response given in another context.
+
+When an embedding function is supplied, a miss on the exact key falls back to
+a similarity search over the embeddings of the cached prompts, so a
+near-duplicate question reuses the stored answer instead of paying for
+another chat completion. numpy is used for the search when it is installed.
+Embeddings are computed in a background thread: a lookup waits at most
+embed_timeout seconds for one, and storing a response never waits.
+
+An optional CacheService can be passed as a second tier to share responses
+between processes.
+"""
+import hashlib
+import logging
+import math
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass, field, fields
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from data.database.utils.ttl_cache import TTLCache, MISSING
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s']+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalise a prompt so trivially different phrasings share a cache key.
+
+    Lower-cases, folds unicode compatibility characters, drops punctuation
+    and collapses whitespace.
+
+    Parameters:
+        prompt (str): The user's input.
+
+    Returns:
+        str: The normalised prompt.
+    """
+    prompt = unicodedata.normalize("NFKC", prompt).replace("’", "'").lower()
+    prompt = _PUNCTUATION.sub(" ", prompt)
+    return _WHITESPACE.sub(" ", prompt).strip()
+
+
+def _unit(vector: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+@dataclass
+class ResponseCacheStats:
+    """Counters for a ResponseCache."""
+    hits: int = 0
+    semantic_hits: int = 0
+    shared_hits: int = 0
+    misses: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, **counts: int) -> None:
+        """Increment counters, safely from any thread."""
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Return the counters as a dict."""
+        with self._lock:
+            return {f.name: getattr(self, f.name) for f in fields(self) if not f.name.startswith("_")}
+
+
+class _VectorIndex:
+    """
+    Embeddings of cached prompts, searched by cosine similarity.
+    """
+
+    def __init__(self):
+        self._vectors: Dict[str, Tuple[str, List[float]]] = {}
+        self._matrix = None
+        self._keys: List[str] = []
+        self._scopes = None
+        self._lock = threading.Lock()
+
+    def add(self, key: str, scope: str, vector: Sequence[float]) -> None:
+        with self._lock:
+            self._vectors[key] = (scope, _unit(vector))
+            self._matrix = None
+
+    def discard(self, keys) -> None:
+        with self._lock:
+            for key in keys:
+                self._vectors.pop(key, None)
+            self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._vectors)
+
+    def nearest(self, scope: str, vector: Sequence[float]) -> Tuple[Optional[str], float]:
+        """
+        Return the key most similar to vector within scope, and its cosine similarity.
+        """
+        query = _unit(vector)
+        with self._lock:
+            if np is not None:
+                if self._matrix is None:
+                    self._keys = [k for k, (s, _) in self._vectors.items()]
+                    rows = [v for _, v in self._vectors.values()]
+                    self._matrix = np.asarray(rows, dtype=np.float32) if rows else None
+                    self._scopes = np.asarray([s for s, _ in self._vectors.values()], dtype=object)
+                if self._matrix is None:
+                    return None, 0.0
+                scores = self._matrix @ np.asarray(query, dtype=np.float32)
+                scores[self._scopes != scope] = -1.0
+                best = int(np.argmax(scores))
+                return self._keys[best], float(scores[best])
+            best_key, best_score = None, -1.0
+            for key, (entry_scope, entry_vector) in self._vectors.items():
+                if entry_scope != scope:
+                    continue
+                score = sum(a * b for a, b in zip(entry_vector, query))
+                if score > best_score:
+                    best_key, best_score = key, score
+            return best_key, best_score
+
+
+class ResponseCache:
+    """
+    Caches EcoBot responses keyed on the normalised prompt and scope.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: Optional[float] = 3600.0,
+        embed: Optional[Callable[[str], Sequence[float]]] = None,
+        similarity_threshold: float = 0.92,
+        shared_cache=None,
+        embed_timeout: float = 0.25,
+    ):
+        """
+        Parameters:
+            max_size (int): Maximum number of cached responses kept in memory.
+            ttl (float): Seconds a response stays valid. None never expires.
+            embed (callable): Returns an embedding for a prompt. Enables the
+                near-duplicate lookup when given.
+            similarity_threshold (float): Minimum cosine similarity for a
+                near-duplicate to count as a hit.
+            shared_cache (CacheService): Optional second tier shared between processes.
+            embed_timeout (float): Seconds a lookup waits for the prompt's embedding
+                before treating the near-duplicate search as a miss.
+        """
+        self.ttl = ttl
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.shared_cache = shared_cache
+        self.embed_timeout = embed_timeout
+        self.stats = ResponseCacheStats()
+        self._responses = TTLCache(max_size=max_size, ttl=ttl)
+        self._index = _VectorIndex()
+        # a miss embeds the prompt, and the following set reuses that embedding
+        self._recent_embeddings = TTLCache(max_size=64, ttl=300)
+        self._embedder = None
+        self._embedder_lock = threading.Lock()
+
+    def _embedding(self, normalized: str) -> Future:
+        """
+        Return a future for the embedding of normalized, starting it if needed.
+        """
+        with self._embedder_lock:
+            future = self._recent_embeddings.get(normalized)
+            if future is MISSING:
+                if self._embedder is None:
+                    self._embedder = ThreadPoolExecutor(max_workers=2, thread_name_prefix="response-cache-embed")
+                future = self._embedder.submit(self.embed, normalized)
+                self._recent_embeddings.set(normalized, future)
+        return future
+
+    def _index_embedding(self, key: str, scope: str, normalized: str, future: Future) -> None:
+        """
+        Add a finished embedding to the index, then drop entries whose response expired.
+        """
+        try:
+            self._index.add(key, scope, future.result())
+        except Exception as e:
+            self._recent_embeddings.delete(normalized)
+            logger.warning("Could not embed prompt for the response cache: %s", e)
+            return
+        if len(self._index) > len(self._responses):
+            live = {k for k, _ in self._responses.items()}
+            self._index.discard([k for k in self._index.keys() if k not in live])
+
+    @staticmethod
+    def scope_for(*parts: str) -> str:
+        """
+        Hash the parts that shape a response, such as the system message and personality.
+        """
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def context_scope(cls, scope: str, history: Iterable[dict]) -> str:
+        """
+        Extend scope with the conversation a prompt is asked in.
+
+        Parameters:
+            scope (str): The personality scope, see scope_for.
+            history (iterable): The messages before the prompt, as role/content dicts.
+
+        Returns:
+            str: scope itself when history is empty, so context-free turns are
+            shared, otherwise a scope unique to that conversation.
+        """
+        parts = [f"{message['role']}\x01{message['content']}" for message in history]
+        return cls.scope_for(scope, *parts) if parts else scope
+
+    @staticmethod
+    def _key(normalized: str, scope: str) -> str:
+        return "eco-bot:response:" + hashlib.sha256(f"{scope}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, prompt: str, scope: str = "") -> Optional[str]:
+        """
+        Return a cached response for prompt, or None.
+
+        Parameters:
+            prompt (str): The user's input.
+            scope (str): Identifies the personality, system message and conversation,
+                see scope_for and context_scope.
+
+        Returns:
+            str or None: The cached response.
+        """
+        normalized = normalize_prompt(prompt)
+        key = self._key(normalized, scope)
+        response = self._responses.get(key)
+        if response is not MISSING:
+            self.stats.add(hits=1)
+            return response
+
+        if self.shared_cache is not None:
+            try:
+                response = self.shared_cache.get(key)
+            except Exception as e:
+                logger.warning("Could not read response from the shared cache: %s", e)
+                response = None
+            if response is not None:
+                self._responses.set(key, response)
+                self.stats.add(shared_hits=1)
+                return response
+
+        if self.embed is not None and len(self._index):
+            try:
+                match, score = self._index.nearest(scope, self._embedding(normalized).result(self.embed_timeout))
+            except FutureTimeout:
+                # keep the request moving, the embedding is reused by set
+                match, score = None, 0.0
+            except Exception as e:
+                self._recent_embeddings.delete(normalized)
+                logger.warning("Embedding lookup failed: %s", e)
+                match, score = None, 0.0
+            if match is not None and score >= self.similarity_threshold:
+                response = self._responses.get(match)
+                if response is not MISSING:
+                    self.stats.add(semantic_hits=1)
+                    return response
+                self._index.discard([match])
+
+        self.stats.add(misses=1)
+        return None
+
+    def set(self, prompt: str, response: str, scope: str = "") -> None:
+        """
+        Cache response for prompt.
+
+        Parameters:
+            prompt (str): The user's input.
+            response (str): The generated response.
+            scope (str): Identifies the personality, system message and conversation,
+                see scope_for and context_scope.
+        """
+        normalized = normalize_prompt(prompt)
+        key = self._key(normalized, scope)
+        self._responses.set(key, response)
+        if self.shared_cache is not None:
+            try:
+                self.shared_cache.set(key, response, ttl=self.ttl)
+            except Exception as e:
+                logger.warning("Could not write response to the shared cache: %s", e)
+        if self.embed is not None:
+            future = self._embedding(normalized)
+            future.add_done_callback(lambda done: self._index_embedding(key, scope, normalized, done))
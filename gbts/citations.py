@@ -0,0 +1,141 @@
+# gbts/citations.py
+"""
+Formats assistant message annotations as numbered footnotes.
+
+Retrieval answers often cite the same few files many times. File metadata is
+kept in a process-wide cache with a time to live, the distinct uncached file
+ids of a message are fetched concurrently, and the message text is rewritten
+in one pass using the annotation offsets.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List
+
+from data.database.utils.ttl_cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+FILE_CACHE_SIZE = int(os.getenv("GAIA_FILE_CACHE_SIZE", "1024"))
+FILE_CACHE_TTL = float(os.getenv("GAIA_FILE_CACHE_TTL", "3600"))
+MAX_FILE_LOOKUPS = 8
+
+# file id -> file object from files.retrieve, shared by every assistant in the process
+_file_cache = TTLCache(max_size=FILE_CACHE_SIZE, ttl=FILE_CACHE_TTL)
+
+
+def _cited_file_id(annotation: Any):
+    for attribute in ("file_citation", "file_path"):
+        cited = getattr(annotation, attribute, None)
+        if cited is not None:
+            return cited.file_id
+    return None
+
+
+def resolve_files(client, file_ids: Iterable[str]) -> Dict[str, Any]:
+    """
+    Return file objects for file_ids, from the cache or fetched concurrently.
+
+    Files that cannot be retrieved are logged and left out.
+
+    Args:
+        client: The OpenAI client.
+        file_ids (iterable): The file ids to resolve. Duplicates are fetched once.
+
+    Returns:
+        dict: File objects by id.
+    """
+    files = {}
+    missing = []
+    for file_id in dict.fromkeys(file_ids):
+        cached = _file_cache.get(file_id)
+        if cached is MISSING:
+            missing.append(file_id)
+        else:
+            files[file_id] = cached
+
+    def retrieve(file_id):
+        try:
+            return file_id, client.files.retrieve(file_id)
+        except Exception as e:
+            logger.error("Error retrieving file citation: %s", e)
+            return file_id, None
+
+    if len(missing) == 1:
+        fetched = [retrieve(missing[0])]
+    elif missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), MAX_FILE_LOOKUPS)) as pool:
+            fetched = list(pool.map(retrieve, missing))
+    else:
+        fetched = []
+    for file_id, cited_file in fetched:
+        if cited_file is not None:
+            _file_cache.set(file_id, cited_file)
+            files[file_id] = cited_file
+    return files
+
+
+def _replacement_spans(text: str, annotations: List[Any]) -> List[tuple]:
+    """
+    Return (start, end, index) for each annotation, ordered by position.
+
+    Uses start_index and end_index when present, otherwise finds the
+    annotation text after the previous match.
+    """
+    spans = []
+    search_from = 0
+    for index, annotation in enumerate(annotations):
+        start, end = getattr(annotation, "start_index", None), getattr(annotation, "end_index", None)
+        if start is None or end is None or text[start:end] != annotation.text:
+            start = text.find(annotation.text, search_from)
+            if start < 0:
+                continue
+            end = start + len(annotation.text)
+        search_from = end
+        spans.append((start, end, index))
+    spans.sort()
+    return spans
+
+
+def format_annotated_text(client, message_content) -> str:
+    """
+    Replace each annotation in the text with a footnote marker and append the citations.
+
+    Args:
+        client: The OpenAI client, used to look up cited files.
+        message_content: A text content block with value and annotations.
+
+    Returns:
+        str: The formatted text.
+    """
+    text = message_content.value
+    annotations = list(message_content.annotations or [])
+    files = resolve_files(client, filter(None, (_cited_file_id(a) for a in annotations)))
+
+    pieces = []
+    position = 0
+    for start, end, index in _replacement_spans(text, annotations):
+        if start < position:
+            # overlapping annotation, already replaced
+            continue
+        pieces.append(text[position:start])
+        pieces.append(f" [{index}]")
+        position = end
+    pieces.append(text[position:])
+
+    citations = []
+    for index, annotation in enumerate(annotations):
+        cited_file = files.get(_cited_file_id(annotation))
+        if cited_file is None:
+            continue
+        if file_citation := getattr(annotation, "file_citation", None):
+            quote = getattr(file_citation, "quote", None)
+            if quote:
+                citations.append("[%d] %s: %s" % (index, cited_file.filename, quote))
+            else:
+                citations.append("[%d] %s" % (index, cited_file.filename))
+        elif getattr(annotation, "file_path", None):
+            citations.append("[%d] Click <here> to download %s" % (index, cited_file.filename))
+
+    # Add footnotes to the end of the message before displaying to user
+    return "".join(pieces) + "\n" + "\n".join(citations)
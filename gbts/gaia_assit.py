@@ -2,10 +2,9 @@
 """This module contains the GaiaAssistant class."""
 
 import sys
-# import os
-from collections import defaultdict
+import os
+from collections import defaultdict, deque
 import json
-import time
 import logging
 import openai
 from autogen.agentchat import UserProxyAgent, AssistantAgent, Agent, GroupChat, GroupChatManager
@@ -13,6 +12,13 @@ from typing import Dict, Optional, Union, List, Tuple, Any
 sys.path.append("../agents")
 from agents.config import get_config_list, get_config_json_string
 from agents.assistants.assistant_retrevial import retrieve_assistants_by_name
+from gbts.citations import format_annotated_text
+from gbts.thread_registry import ThreadRegistry
+from gbts.tool_executor import ToolCallExecutor
+from gbts.run_strategies import (
+    Backoff, MAX_ADDITIONAL_MESSAGES, RunMetrics, list_messages_after, run_strategy_for,
+    split_pending_messages,
+)
 
 logger = logging.getLogger(__name__)
 openai_client = openai.OpenAI()
@@ -30,6 +36,7 @@ class GaiaAssistant(UserProxyAgent,GroupChatManager):
         instructions: Optional[str] = None,
         llm_config: Optional[Union[Dict, bool]] = llm_config,
         overwrite_instructions: bool = False,
+        thread_registry: Optional[ThreadRegistry] = None,
     ):
         """
         Args:
@@ -44,11 +51,22 @@ class GaiaAssistant(UserProxyAgent,GroupChatManager):
             llm_config (dict or False): llm inference configuration.
                 - assistant_id: ID of the assistant to use. If None, a new assistant will be created.
                 - model: Model to use for the assistant (gpt-4-1106-preview, gpt-3.5-turbo-1106).
-                - check_every_ms: check thread run status interval
+                - check_every_ms: first interval between run status checks when polling;
+                        later checks back off exponentially
+                - run_wait: "stream", "poll" or "auto" (default) to stream run events when the client supports it
+                - run_timeout: seconds to wait for a run before giving up
+                - tool_workers: most tool calls executed at once (default 8)
+                - tool_timeout: seconds to wait for a tool call (default 60)
+                - tool_timeouts: per-function timeouts in seconds, by function name
+                - persist_threads: keep threads in the database so restarts and replicas reuse them
+                        (default True when DB_HOST is set).
+                        If the database cannot be reached, threads are kept in memory for that turn.
                 - tools: Give Assistants access to OpenAI-hosted tools like Code Interpreter and Knowledge Retrieval,
                         or build your own tools using Function calling. ref https://platform.openai.com/docs/assistants/tools
                 - file_ids: files used by retrieval in run
             overwrite_instructions (bool): whether to overwrite the instructions of an existing assistant.
+            thread_registry (ThreadRegistry): where threads and read positions are kept, by agent name.
+                Defaults to one backed by the threads table when persist_threads is on.
         """
         # Use AutoGen OpenAIWrapper to create a client
         oai_wrapper = llm_config(**llm_config)
@@ -113,9 +131,26 @@ class GaiaAssistant(UserProxyAgent,GroupChatManager):
 
         # lazily create threads
         self._openai_threads = {}
+        if thread_registry is None and llm_config.get("persist_threads", bool(os.getenv("DB_HOST"))):
+            thread_registry = ThreadRegistry(self._openai_assistant.id)
+        self._thread_registry = thread_registry
         self._unread_index = defaultdict(int)
+        # id of the last message read from each thread
+        self._message_cursors = {}
+        self._run_strategy = run_strategy_for(
+            self._openai_client,
+            mode=llm_config.get("run_wait", "auto"),
+            timeout=llm_config.get("run_timeout"),
+            backoff=Backoff(initial=llm_config.get("check_every_ms", 50) / 1000),
+        )
+        self._tool_executor = ToolCallExecutor(
+            max_workers=llm_config.get("tool_workers", 8),
+            timeout=llm_config.get("tool_timeout", 60),
+            timeouts=llm_config.get("tool_timeouts"),
+        )
+        # wait statistics of the most recent runs
+        self.run_metrics = deque(maxlen=100)
         self.register_reply(Agent, GaiaAssistant._invoke_assistant)
-    @classmethod
     def _invoke_assistant(
         self,
         messages: Optional[List[Dict]] = None,
@@ -136,32 +171,32 @@ class GaiaAssistant(UserProxyAgent,GroupChatManager):
 
         if messages is None:
             messages = self._oai_messages[sender]
-        unread_index = self._unread_index[sender] or 0
+        unread_index = self._load_thread_state(sender, len(messages))
         pending_messages = messages[unread_index:]
 
-        # Check and initiate a new thread if necessary
-        if self._openai_threads.get(sender, None) is None:
-            self._openai_threads[sender] = self._openai_client.beta.threads.create(
-                messages=[],
-            )
-        assistant_thread = self._openai_threads[sender]
-        # Process each unread message
-        for message in pending_messages:
-            self._openai_client.beta.threads.messages.create(
-                thread_id=assistant_thread.id,
-                content=message["content"],
-                role=message["role"],
-            )
+        metrics = RunMetrics()
+        # The latest messages are sent with the run; only a larger backlog is posted first
+        overflow, additional_messages = split_pending_messages(pending_messages)
+        assistant_thread = self._post_pending_messages(sender, overflow, metrics)
 
         # Create a new run to get responses from the assistant
-        run = self._openai_client.beta.threads.runs.create(
-            thread_id=assistant_thread.id,
+        run = self._run_strategy.create_run(
+            self._openai_client,
+            assistant_thread.id,
+            metrics,
             assistant_id=self._openai_assistant.id,
             # pass the latest system message as instructions
             instructions=self.system_message,
+            additional_messages=additional_messages,
         )
 
-        run_response_messages = self._get_run_response(assistant_thread, run)
+        run_response_messages = self._get_run_response(assistant_thread, run, metrics)
+        self.run_metrics.append(metrics)
+        logger.debug(
+            "Run %s %s after %.3fs (started after %.3fs, %d HTTP calls, %d polls, %d events)",
+            metrics.run_id, metrics.status, metrics.wait_seconds, metrics.run_start_seconds or 0.0,
+            metrics.http_calls, metrics.polls, metrics.events,
+        )
         assert len(run_response_messages) > 0, "No response from the assistant."
 
         response = {
@@ -176,22 +211,118 @@ class GaiaAssistant(UserProxyAgent,GroupChatManager):
             response["content"] += message["content"]
 
         self._unread_index[sender] = len(self._oai_messages[sender]) + 1
+        self._save_thread_state(sender, assistant_thread.id, metrics)
         return True, response
-    @staticmethod
-    def _get_run_response(self, thread, run):
+    def _load_thread_state(self, sender: Agent, message_count: int) -> int:
+        """
+        Return the unread index for sender, restoring its thread from the registry on first use.
+
+        Args:
+            sender: The agent whose thread is used.
+            message_count: Number of messages in the local history with sender.
+
+        Returns:
+            The index of the first message not yet sent to the thread.
+        """
+        if sender not in self._unread_index and self._thread_registry is not None:
+            try:
+                state = self._thread_registry.get(sender.name)
+            except Exception as e:
+                logger.error("Could not load thread state for %s, keeping it in memory: %s", sender.name, e)
+                state = None
+            if state is not None:
+                self._openai_threads[sender] = state
+                self._message_cursors[state.id] = state.last_message_id
+                # after a restart the local history starts empty, so all of it is unread
+                self._unread_index[sender] = state.unread_index if state.unread_index <= message_count else 0
+        return self._unread_index[sender]
+    def _save_thread_state(self, sender: Agent, thread_id: str, metrics: RunMetrics) -> None:
+        """
+        Save sender's read position and the finished run to the registry.
+        """
+        if self._thread_registry is None:
+            return
+        try:
+            self._thread_registry.finish_turn(
+                sender.name,
+                self._unread_index[sender],
+                last_message_id=self._message_cursors.get(thread_id),
+                openai_run_id=metrics.run_id,
+                status=metrics.status,
+            )
+        except Exception as e:
+            logger.error("Could not save thread state for %s: %s", sender.name, e)
+    def _post_pending_messages(self, sender: Agent, messages: List[Dict], metrics: RunMetrics) -> Any:
+        """
+        Return the thread for sender, creating it if needed, with messages added to it.
+
+        A new thread is created with the first messages already in it.
+
+        Args:
+            sender: The agent whose thread is used.
+            messages: Messages to add before the run, oldest first.
+            metrics: Counts the HTTP calls made.
+
+        Returns:
+            The thread.
+        """
+        assistant_thread = self._openai_threads.get(sender, None)
+        if assistant_thread is None:
+            initial = messages[:MAX_ADDITIONAL_MESSAGES]
+            created = []
+
+            def create_thread():
+                thread = self._openai_client.beta.threads.create(messages=initial)
+                metrics.http_calls += 1
+                created.append(thread)
+                return thread.id
+
+            assistant_thread = None
+            if self._thread_registry is not None:
+                try:
+                    assistant_thread = self._thread_registry.get_or_create(sender.name, create_thread)
+                except Exception as e:
+                    logger.error("Could not register thread for %s, keeping it in memory: %s", sender.name, e)
+            if assistant_thread is None:
+                if not created:
+                    # an OpenAI error raises again here rather than being hidden
+                    create_thread()
+                assistant_thread = created[0]
+            if created and created[0].id == assistant_thread.id:
+                messages = messages[MAX_ADDITIONAL_MESSAGES:]
+            else:
+                # another process registered a thread for this agent first
+                for thread in created:
+                    self._openai_client.beta.threads.delete(thread.id)
+                    metrics.http_calls += 1
+            self._openai_threads[sender] = assistant_thread
+        # Messages must keep their order, so these are posted one at a time
+        for message in messages:
+            self._openai_client.beta.threads.messages.create(
+                thread_id=assistant_thread.id,
+                content=message["content"],
+                role=message["role"],
+            )
+            metrics.http_calls += 1
+        return assistant_thread
+    def _get_run_response(self, thread, run, metrics: Optional[RunMetrics] = None):
         """
-        Waits for and processes the response of a run from the OpenAI assistant.
+        Processes the response of a run from the OpenAI assistant, submitting tool outputs as needed.
 
         Args:
+            thread: The thread the run belongs to.
             run: The run object initiated with the OpenAI assistant.
+            metrics: Updated with the wait statistics of the run.
 
         Returns:
             Updated run object, status of the run, and response messages.
         """
+        metrics = metrics if metrics is not None else RunMetrics()
         while True:
-            run = self._wait_for_run(run.id, thread.id)
+            if run.status in ("queued", "in_progress"):
+                run = self._wait_for_run(run.id, thread.id, metrics)
             if run.status == "completed":
-                response_messages = self._openai_client.beta.threads.messages.list(thread.id, order="asc")
+                response_messages = self._list_new_messages(thread.id, metrics)
 
                 new_messages = []
                 for msg in response_messages:
@@ -210,87 +341,58 @@ class GaiaAssistant(UserProxyAgent,GroupChatManager):
                                 )
                 return new_messages
             elif run.status == "requires_action":
-                actions = []
-                for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-                    function = tool_call.function
-                    is_exec_success, tool_response = self.execute_function(function.dict())
-                    tool_response["metadata"] = {
-                        "tool_call_id": tool_call.id,
-                        "run_id": run.id,
-                        "thread_id": thread.id,
-                    }
-
-                    logger.info(
-                        "Intermediate executing(%s, Sucess: %s) : %s",
-                        tool_response["name"],
-                        is_exec_success,
-                        tool_response["content"],
-                    )
-                    actions.append(tool_response)
-
-                submit_tool_outputs = {
-                    "tool_outputs": [
-                        {"output": action["content"], "tool_call_id": action["metadata"]["tool_call_id"]}
-                        for action in actions
-                    ],
-                    "run_id": run.id,
-                    "thread_id": thread.id,
-                }
-
-                run = self._openai_client.beta.threads.runs.submit_tool_outputs(**submit_tool_outputs)
+                # Independent calls run concurrently; all outputs go back in one request
+                tool_outputs = self._tool_executor.run(
+                    run.required_action.submit_tool_outputs.tool_calls, self.execute_function
+                )
+                run = self._run_strategy.submit_tool_outputs(
+                    self._openai_client, thread.id, run.id, tool_outputs, metrics
+                )
             else:
                 run_info = json.dumps(run.dict(), indent=2)
                 raise ValueError(f"Unexpected run status: {run.status}. Full run info:\n\n{run_info})")
-    @staticmethod
-    def _wait_for_run(self, run_id: str, thread_id: str) -> Any:
+    def _list_new_messages(self, thread_id: str, metrics: Optional[RunMetrics] = None) -> List[Any]:
+        """
+        Return the messages added to a thread since the last call, oldest first.
+
+        Keeps the id of the last message seen for each thread and lists only
+        the messages after it, following pagination, so the cost depends on
+        the number of new messages rather than the length of the thread.
+
+        Args:
+            thread_id: The ID of the thread.
+            metrics: Counts the HTTP calls made.
+
+        Returns:
+            The new message objects.
+        """
+        new_messages, self._message_cursors[thread_id] = list_messages_after(
+            self._openai_client, thread_id, self._message_cursors.get(thread_id), metrics
+        )
+        return new_messages
+    def _wait_for_run(self, run_id: str, thread_id: str, metrics: Optional[RunMetrics] = None) -> Any:
         """
         Waits for a run to complete or reach a final state.
 
+        Polls with exponential backoff, see run_strategies.PollingRunStrategy.
+
         Args:
             run_id: The ID of the run.
             thread_id: The ID of the thread associated with the run.
+            metrics: Updated with the number of polls and time waited.
 
         Returns:
             The updated run object after completion or reaching a final state.
         """
-        in_progress = True
-        while in_progress:
-            run = self._openai_client.beta.threads.runs.retrieve(run_id, thread_id=thread_id)
-            in_progress = run.status in ("in_progress", "queued")
-            if in_progress:
-                time.sleep(self.llm_config.get("check_every_ms", 1000) / 1000)
-        return run
-    @staticmethod
+        metrics = metrics if metrics is not None else RunMetrics()
+        return self._run_strategy.wait(self._openai_client, thread_id, run_id, metrics)
     def _format_assistant_message(self, message_content):
         """
         Formats the assistant's message to include annotations and citations.
-        """
-
-        annotations = message_content.annotations
-        citations = []
-
-        # Iterate over the annotations and add footnotes
-        for index, annotation in enumerate(annotations):
-            # Replace the text with a footnote
-            message_content.value = message_content.value.replace(annotation.text, f" [{index}]")
-
-            # Gather citations based on annotation attributes
-            if file_citation := getattr(annotation, "file_citation", None):
-                try:
-                    cited_file = self._openai_client.files.retrieve(file_citation.file_id)
-                    citations.append("[%d] %s: %s" % (index, cited_file.filename, file_citation.quote))
-                except Exception as e:
-                    logger.error("Error retrieving file citation: %s", e)
-            elif file_path := getattr(annotation, "file_path", None):
-                try:
-                    cited_file = self._openai_client.files.retrieve(file_path.file_id)
-                    citations.append("[%d] Click <here> to download %s" % (index, cited_file.filename))
-                except Exception as e:
-                    logger.error("Error retrieving file citation: %s", e)
-                # Note: File download functionality not implemented above for brevity
 
-        # Add footnotes to the end of the message before displaying to user
-        message_content.value += "\n" + "\n".join(citations)
+        Cited files are looked up through a process-wide cache, see citations.format_annotated_text.
+        """
+        message_content.value = format_annotated_text(self._openai_client, message_content)
         return message_content.value
     @classmethod
     def can_execute_function(self, name: str) -> bool:
@@ -301,33 +403,51 @@ class GaiaAssistant(UserProxyAgent,GroupChatManager):
             #else:
                 #return False
         pass
-    @classmethod
     def reset(self):
         """
         Resets the agent, clearing any existing conversation thread and unread message indices.
         """
-        super(classmethod).reset()
+        super().reset()
         for thread in self._openai_threads.values():
             # Delete the existing thread to start fresh in the next conversation
             self._openai_client.beta.threads.delete(thread.id)
+        # only the agents this instance talked to; other replicas keep their threads
+        agent_names = [sender.name for sender in self._openai_threads]
         self._openai_threads = {}
         # Clear the record of unread messages
         self._unread_index.clear()
-    @classmethod
+        self._message_cursors.clear()
+        for agent_name in agent_names:
+            self._forget_thread_state(agent_name)
     def clear_history(self, agent: Optional[Agent] = None):
         """Clear the chat history of the agent.
 
         Args:
             agent: the agent with whom the chat history to clear. If None, clear the chat history with all agents.
         """
-        super(classmethod).clear_history(agent)
+        super().clear_history(agent)
+        if agent is not None:
+            # a thread registered by an earlier process is cleared too
+            self._load_thread_state(agent, 0)
         if self._openai_threads.get(agent, None) is not None:
             # Delete the existing thread to start fresh in the next conversation
             thread = self._openai_threads[agent]
             logger.info("Clearing thread %s", thread.id)
             self._openai_client.beta.threads.delete(thread.id)
             self._openai_threads.pop(agent)
+            self._message_cursors.pop(thread.id, None)
             self._unread_index[agent] = 0
+            self._forget_thread_state(agent.name)
+    def _forget_thread_state(self, agent_name: str) -> None:
+        """
+        Remove agent_name's thread from the registry, if there is one.
+        """
+        if self._thread_registry is None:
+            return
+        try:
+            self._thread_registry.forget(agent_name)
+        except Exception as e:
+            logger.error("Could not forget thread state for %s: %s", agent_name, e)
     @classmethod
     def pretty_print_thread(self, thread):
         """Pretty print the thread."""
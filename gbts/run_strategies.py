@@ -0,0 +1,363 @@
+# gbts/run_strategies.py
+"""
+Strategies for waiting on OpenAI assistant runs.
+
+StreamingRunStrategy creates runs and submits tool outputs with stream=True
+and returns as soon as the run event stream reports that the run needs
+action or has finished, so there is no polling delay at all.
+PollingRunStrategy is used when the client cannot stream: it polls
+runs.retrieve with exponential backoff and jitter, starting at 50 ms, so
+short runs are noticed quickly and long runs do not cost a request per second.
+
+Both record how long each run was waited on and how many requests or events
+that took in a RunMetrics. When a timeout is set, both cancel a run that has
+not settled in time and raise TimeoutError; the streaming strategy closes a
+stream that stays silent past the deadline.
+
+Messages posted to a thread since the assistant last ran are sent with the
+run itself as additional_messages, up to MAX_ADDITIONAL_MESSAGES per request,
+instead of one messages.create call each. Replies are read with
+list_messages_after, which only lists the messages after the last one seen.
+"""
+import inspect
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Run statuses that mean the run is still being worked on
+PENDING_STATUSES = ("queued", "in_progress", "cancelling")
+
+# Most messages the API accepts in one threads.create or runs.create request
+MAX_ADDITIONAL_MESSAGES = 32
+
+
+@dataclass
+class RunMetrics:
+    """Wait statistics for one assistant run."""
+    run_id: Optional[str] = None
+    thread_id: Optional[str] = None
+    strategy: str = ""
+    status: Optional[str] = None
+    wait_seconds: float = 0.0
+    polls: int = 0
+    events: int = 0
+    tool_rounds: int = 0
+    # HTTP requests made for the run, including posting the pending messages
+    http_calls: int = 0
+    # seconds from started until the run was created
+    run_start_seconds: Optional[float] = None
+    started: float = field(default_factory=time.monotonic, repr=False)
+
+    def mark_run_started(self) -> None:
+        """Record the time to run start, the first time it is called."""
+        if self.run_start_seconds is None:
+            self.run_start_seconds = time.monotonic() - self.started
+
+
+def split_pending_messages(messages: List[Dict], limit: int = MAX_ADDITIONAL_MESSAGES) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Split pending messages into those to post first and those to send with the run.
+
+    The most recent limit messages go with the run as additional_messages; any
+    older ones must be added to the thread beforehand, in order.
+
+    Args:
+        messages (list): Pending messages, oldest first, with role and content.
+        limit (int): Most messages one request accepts.
+
+    Returns:
+        tuple: (overflow, inline) lists of {"role", "content"} dicts.
+    """
+    messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+    split = max(len(messages) - limit, 0)
+    return messages[:split], messages[split:]
+
+
+def list_messages_after(client, thread_id: str, cursor: Optional[str], metrics: Optional["RunMetrics"] = None,
+                        page_size: int = 100) -> Tuple[List[Any], Optional[str]]:
+    """
+    List the messages of a thread after cursor, oldest first, following pagination.
+
+    Args:
+        client: The OpenAI client.
+        thread_id (str): The thread to read.
+        cursor (str): Id of the last message already seen, or None to list from the start.
+            A cursor whose message no longer exists is ignored.
+        metrics (RunMetrics): Counts the HTTP calls made.
+        page_size (int): Messages requested per page.
+
+    Returns:
+        tuple: The new messages and the cursor to pass next time.
+    """
+    messages = client.beta.threads.messages
+    try:
+        page = messages.list(thread_id, order="asc", limit=page_size, **({"after": cursor} if cursor else {}))
+    except (openai.NotFoundError, openai.BadRequestError) as e:
+        if not cursor:
+            raise
+        logger.warning("Message %s is gone from thread %s, listing from the start: %s", cursor, thread_id, e)
+        if metrics is not None:
+            metrics.http_calls += 1
+        page = messages.list(thread_id, order="asc", limit=page_size)
+    new_messages = []
+    for current_page in page.iter_pages():
+        if metrics is not None:
+            metrics.http_calls += 1
+        new_messages.extend(current_page.data)
+    return new_messages, (new_messages[-1].id if new_messages else cursor)
+
+
+@dataclass
+class Backoff:
+    """
+    Exponential backoff with jitter.
+
+    Args:
+        initial (float): First delay in seconds.
+        maximum (float): Largest delay in seconds.
+        multiplier (float): Growth factor between delays.
+        jitter (float): Each delay is scaled by a random factor in [1 - jitter, 1 + jitter].
+    """
+    initial: float = 0.05
+    maximum: float = 2.0
+    multiplier: float = 1.5
+    jitter: float = 0.2
+
+    def delays(self) -> Iterator[float]:
+        """Yield successive delays, forever."""
+        delay = self.initial
+        while True:
+            yield min(delay, self.maximum) * random.uniform(1 - self.jitter, 1 + self.jitter)
+            delay *= self.multiplier
+
+
+class PollingRunStrategy:
+    """
+    Waits for runs by polling runs.retrieve with exponential backoff.
+    """
+
+    name = "poll"
+
+    def __init__(self, backoff: Optional[Backoff] = None, timeout: Optional[float] = None):
+        """
+        Args:
+            backoff (Backoff): Delays between polls. Defaults to Backoff().
+            timeout (float): Seconds to wait for a run before cancelling it and
+                raising TimeoutError.
+        """
+        self.backoff = backoff or Backoff()
+        self.timeout = timeout
+
+    def _deadline(self) -> Optional[float]:
+        return None if self.timeout is None else time.monotonic() + self.timeout
+
+    def _cancel(self, client, thread_id: str, run_id: Optional[str], metrics: RunMetrics) -> None:
+        """
+        Cancel a run that took too long, so it stops using tokens and frees the thread.
+        """
+        if run_id is None:
+            return
+        try:
+            client.beta.threads.runs.cancel(run_id, thread_id=thread_id)
+            metrics.http_calls += 1
+        except Exception as e:
+            logger.warning("Could not cancel run %s after it timed out: %s", run_id, e)
+
+    def create_run(self, client, thread_id: str, metrics: RunMetrics, **run_kwargs) -> Any:
+        """
+        Create a run on the thread and wait until it needs action or has finished.
+
+        Args:
+            client: The OpenAI client.
+            thread_id (str): The thread to run.
+            metrics (RunMetrics): Updated with the wait statistics.
+            **run_kwargs: Passed to runs.create, such as assistant_id and instructions.
+
+        Returns:
+            The run object, no longer queued or in progress.
+        """
+        started = time.monotonic()
+        run = client.beta.threads.runs.create(thread_id=thread_id, **run_kwargs)
+        metrics.http_calls += 1
+        metrics.mark_run_started()
+        metrics.wait_seconds += time.monotonic() - started
+        return self.wait(client, thread_id, run.id, metrics, initial_run=run)
+
+    def submit_tool_outputs(self, client, thread_id: str, run_id: str, tool_outputs: List[dict],
+                            metrics: RunMetrics) -> Any:
+        """
+        Submit tool outputs for a run and wait until it needs action again or has finished.
+        """
+        started = time.monotonic()
+        run = client.beta.threads.runs.submit_tool_outputs(
+            thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs
+        )
+        metrics.http_calls += 1
+        metrics.wait_seconds += time.monotonic() - started
+        metrics.tool_rounds += 1
+        return self.wait(client, thread_id, run_id, metrics, initial_run=run)
+
+    def wait(self, client, thread_id: str, run_id: str, metrics: RunMetrics, initial_run: Any = None,
+             deadline: Optional[float] = None) -> Any:
+        """
+        Poll a run until it is no longer queued or in progress.
+
+        Args:
+            client: The OpenAI client.
+            thread_id (str): The thread the run belongs to.
+            run_id (str): The run to wait for.
+            metrics (RunMetrics): Updated with the wait statistics.
+            initial_run: A run object already fetched, checked before polling.
+            deadline (float): time.monotonic() value to give up at. Defaults to
+                timeout seconds from now.
+
+        Returns:
+            The run object.
+
+        Raises:
+            TimeoutError: If the run is still pending at the deadline. The run is cancelled.
+        """
+        started = time.monotonic()
+        deadline = self._deadline() if deadline is None else deadline
+        metrics.run_id, metrics.thread_id = run_id, thread_id
+        metrics.strategy = metrics.strategy or self.name
+        run = initial_run
+        delays = self.backoff.delays()
+        try:
+            while run is None or run.status in PENDING_STATUSES:
+                if run is not None:
+                    if deadline is not None and time.monotonic() > deadline:
+                        self._cancel(client, thread_id, run_id, metrics)
+                        raise TimeoutError(f"Run {run_id} still {run.status} after {self.timeout} seconds")
+                    time.sleep(next(delays))
+                run = client.beta.threads.runs.retrieve(run_id, thread_id=thread_id)
+                metrics.polls += 1
+                metrics.http_calls += 1
+        finally:
+            metrics.wait_seconds += time.monotonic() - started
+        metrics.status = run.status
+        return run
+
+
+class StreamingRunStrategy(PollingRunStrategy):
+    """
+    Waits for runs by reading the run event stream.
+
+    If a stream ends before the run settles, waiting continues by polling.
+    """
+
+    name = "stream"
+
+    def create_run(self, client, thread_id: str, metrics: RunMetrics, **run_kwargs) -> Any:
+        started = time.monotonic()
+        deadline = self._deadline()
+        try:
+            stream = client.beta.threads.runs.create(thread_id=thread_id, stream=True, **run_kwargs)
+            metrics.http_calls += 1
+            return self._consume(client, thread_id, stream, metrics, deadline)
+        finally:
+            metrics.wait_seconds += time.monotonic() - started
+
+    def submit_tool_outputs(self, client, thread_id: str, run_id: str, tool_outputs: List[dict],
+                            metrics: RunMetrics) -> Any:
+        started = time.monotonic()
+        deadline = self._deadline()
+        metrics.tool_rounds += 1
+        try:
+            stream = client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs, stream=True
+            )
+            metrics.http_calls += 1
+            return self._consume(client, thread_id, stream, metrics, deadline, run_id)
+        finally:
+            metrics.wait_seconds += time.monotonic() - started
+
+    def _consume(self, client, thread_id: str, stream, metrics: RunMetrics, deadline: Optional[float],
+                 run_id: Optional[str] = None) -> Any:
+        """
+        Read run events until the run needs action, has finished or the deadline passes.
+
+        A stream that stays silent past the deadline is closed from a timer thread,
+        which ends the blocked read.
+        """
+        metrics.strategy = self.name
+        metrics.thread_id = thread_id
+        run = None
+        close = getattr(stream, "close", None)
+        expired = threading.Event()
+        watchdog = None
+        if deadline is not None and close is not None:
+            def expire():
+                expired.set()
+                close()
+            watchdog = threading.Timer(max(deadline - time.monotonic(), 0), expire)
+            watchdog.daemon = True
+            watchdog.start()
+        try:
+            for event in stream:
+                metrics.events += 1
+                if deadline is not None and time.monotonic() > deadline:
+                    expired.set()
+                    break
+                if event.event == "error":
+                    raise RuntimeError(f"Run stream error: {event.data}")
+                if not event.event.startswith("thread.run.") or event.event.startswith("thread.run.step."):
+                    continue
+                run = event.data
+                run_id = metrics.run_id = run.id
+                metrics.mark_run_started()
+                if run.status not in PENDING_STATUSES:
+                    metrics.status = run.status
+                    return run
+        except Exception:
+            # reading a stream the watchdog closed fails, which is the timeout
+            if not expired.is_set():
+                raise
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            if close is not None:
+                close()
+        if expired.is_set():
+            self._cancel(client, thread_id, run_id, metrics)
+            raise TimeoutError(f"Run {run_id} did not settle within {self.timeout} seconds")
+        if run is None:
+            raise RuntimeError("Run stream ended without any run events")
+        logger.info("Run stream for %s ended while %s, polling instead", run.id, run.status)
+        return self.wait(client, thread_id, run.id, metrics, initial_run=run, deadline=deadline)
+
+
+def supports_streaming(client) -> bool:
+    """
+    Whether the client's runs.create accepts stream=True.
+    """
+    try:
+        return "stream" in inspect.signature(client.beta.threads.runs.create).parameters
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
+def run_strategy_for(client, mode: str = "auto", timeout: Optional[float] = None,
+                     backoff: Optional[Backoff] = None) -> PollingRunStrategy:
+    """
+    Choose a run wait strategy for the client.
+
+    Args:
+        client: The OpenAI client.
+        mode (str): "stream", "poll", or "auto" to stream when the client supports it.
+        timeout (float): Seconds to wait for a run before cancelling it and raising TimeoutError.
+        backoff (Backoff): Polling delays.
+
+    Returns:
+        The strategy to use.
+    """
+    if mode == "stream" or (mode == "auto" and supports_streaming(client)):
+        return StreamingRunStrategy(backoff=backoff, timeout=timeout)
+    return PollingRunStrategy(backoff=backoff, timeout=timeout)
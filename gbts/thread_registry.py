@@ -0,0 +1,204 @@
+# gbts/thread_registry.py
+"""
+Durable registry of the OpenAI threads GaiaAssistant holds with other agents.
+
+Each (assistant, agent name) pair maps to one row of the threads table holding
+the OpenAI thread id, the agent's unread message index and the id of the last
+thread message read. Every process running the same assistant therefore
+reuses the same threads after a restart instead of creating new ones, and
+runs are recorded in the runs table.
+
+Lookups go through an in-process TTLCache, so the database is read once per
+agent rather than once per turn.
+
+Creating a thread calls the OpenAI API, so no lock or transaction is held
+while it runs other than an in-process lock for that agent. If two processes
+create a thread for the same agent at once, the unique index on (assistant,
+agent name) keeps the first one registered and the other process is handed
+that thread instead of its own.
+"""
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from logging import getLogger
+from typing import Callable, Dict, Iterator, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from data.database.utils.setconn import Session
+from data.database.utils.db_operations import Run, Thread
+from data.database.utils.ttl_cache import TTLCache, MISSING
+
+logger = getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ThreadState:
+    """The registry entry for one agent."""
+    id: str
+    row_id: int
+    unread_index: int = 0
+    last_message_id: Optional[str] = None
+
+
+class ThreadRegistry:
+    """
+    Maps agent names to OpenAI threads for one assistant, backed by the threads table.
+    """
+
+    def __init__(self, assistant_id: str, session_factory=None, cache_size: int = 1024,
+                 cache_ttl: Optional[float] = 300.0):
+        """
+        Args:
+            assistant_id (str): The OpenAI assistant id the threads belong to.
+            session_factory (callable): Returns a new Session. Defaults to setconn.Session.
+            cache_size (int): Number of agents kept in process.
+            cache_ttl (float): Seconds before a cached entry is read again from the database.
+        """
+        self.assistant_id = assistant_id
+        self.session_factory = session_factory or Session
+        self._cache = TTLCache(max_size=cache_size, ttl=cache_ttl)
+        # agent name -> [lock, number of callers using it], for get_or_create
+        self._key_locks: Dict[str, list] = {}
+        self._key_locks_guard = threading.Lock()
+
+    @staticmethod
+    def _state(row: Thread) -> ThreadState:
+        return ThreadState(
+            id=row.openai_thread_id,
+            row_id=row.id,
+            unread_index=row.unread_index or 0,
+            last_message_id=row.last_message_id,
+        )
+
+    @contextmanager
+    def _key_lock(self, agent_name: str) -> Iterator[None]:
+        """
+        Hold the in-process lock for agent_name, dropping it once no caller needs it.
+        """
+        with self._key_locks_guard:
+            entry = self._key_locks.setdefault(agent_name, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._key_locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[agent_name]
+
+    def _select(self, agent_name: str):
+        return select(Thread).where(
+            Thread.openai_assistant_id == self.assistant_id, Thread.agent_name == agent_name
+        )
+
+    def get(self, agent_name: str) -> Optional[ThreadState]:
+        """
+        Return the thread state for agent_name, or None if it has no thread yet.
+        """
+        state = self._cache.get(agent_name)
+        if state is not MISSING:
+            return state
+        with self.session_factory() as db_session:
+            row = db_session.execute(self._select(agent_name)).scalar_one_or_none()
+            state = self._state(row) if row is not None else None
+        if state is not None:
+            self._cache.set(agent_name, state)
+        return state
+
+    def get_or_create(self, agent_name: str, create_thread: Callable[[], str]) -> ThreadState:
+        """
+        Return the thread state for agent_name, creating the thread if there is none.
+
+        create_thread is only called when no thread is registered for the agent,
+        and only by one caller at a time in this process. It runs outside any
+        transaction; the new row is inserted afterwards in a short one. If another
+        process registered a thread first, that thread is returned instead, and
+        the caller can tell by comparing ids and delete the one it created.
+
+        Args:
+            agent_name (str): The stable name of the agent.
+            create_thread (callable): Creates the OpenAI thread and returns its id.
+
+        Returns:
+            ThreadState: The registered thread.
+        """
+        state = self.get(agent_name)
+        if state is not None:
+            return state
+        with self._key_lock(agent_name):
+            # another caller may have created it while we waited for the lock
+            state = self.get(agent_name)
+            if state is not None:
+                return state
+            thread_id = create_thread()
+            with self.session_factory() as db_session:
+                row = Thread(
+                    openai_assistant_id=self.assistant_id,
+                    agent_name=agent_name,
+                    openai_thread_id=thread_id,
+                    unread_index=0,
+                    title=agent_name,
+                )
+                db_session.add(row)
+                try:
+                    db_session.commit()
+                except IntegrityError:
+                    # another process registered one first; use theirs
+                    db_session.rollback()
+                    logger.warning("Thread for %s was registered concurrently, discarding %s",
+                                   agent_name, thread_id)
+                    row = db_session.execute(self._select(agent_name)).scalar_one()
+                state = self._state(row)
+            self._cache.set(agent_name, state)
+        return state
+
+    def finish_turn(self, agent_name: str, unread_index: int, last_message_id: Optional[str] = None,
+                    openai_run_id: Optional[str] = None, status: Optional[str] = None) -> ThreadState:
+        """
+        Save the read position after a run, and record the run, in one transaction.
+
+        Args:
+            agent_name (str): The agent whose thread ran.
+            unread_index (int): Index of the agent's first unread message.
+            last_message_id (str): Id of the last thread message read.
+            openai_run_id (str): The run that completed, recorded in the runs table.
+            status (str): The run's final status.
+
+        Returns:
+            ThreadState: The updated entry.
+        """
+        state = self.get(agent_name)
+        if state is None:
+            raise KeyError(f"No thread registered for {agent_name}")
+        values = {"unread_index": unread_index}
+        if last_message_id is not None:
+            values["last_message_id"] = last_message_id
+        with self.session_factory() as db_session:
+            db_session.execute(update(Thread).where(Thread.id == state.row_id).values(**values))
+            if openai_run_id is not None:
+                db_session.add(Run(thread_id=state.row_id, openai_run_id=openai_run_id, status=status))
+            db_session.commit()
+        state = replace(state, **values)
+        self._cache.set(agent_name, state)
+        return state
+
+    def forget(self, agent_name: str) -> None:
+        """
+        Remove the entry for agent_name, along with its recorded runs.
+
+        The remote thread is not deleted; that is up to the caller.
+        """
+        with self.session_factory() as db_session:
+            row_ids = list(db_session.execute(
+                select(Thread.id).where(
+                    Thread.openai_assistant_id == self.assistant_id, Thread.agent_name == agent_name
+                )
+            ).scalars())
+            if row_ids:
+                db_session.execute(delete(Run).where(Run.thread_id.in_(row_ids)))
+                db_session.execute(delete(Thread).where(Thread.id.in_(row_ids)))
+            db_session.commit()
+        self._cache.delete(agent_name)
@@ -0,0 +1,112 @@
+# gbts/tool_executor.py
+"""
+Runs the tool calls of an assistant run concurrently.
+
+When a run stops with requires_action it may ask for several independent
+function calls at once. ToolCallExecutor runs them on a bounded thread pool
+and waits for each up to its timeout, so the round takes as long as the
+slowest call rather than the sum of all of them. The outputs are returned in
+the order of the calls, ready for a single submit_tool_outputs request.
+
+Each call's timeout counts from when a worker starts it, so calls queued
+behind max_workers others are not charged for the wait. A queued call that
+has not started by the time every call of the round could have run to its
+timeout one after another is given up on.
+
+A call that times out is reported to the assistant as an error. Its thread
+cannot be stopped and keeps running in the background until the function returns.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# execute_function(function_call) -> (is_exec_success, {"name", "role", "content"})
+ExecuteFunction = Callable[[Dict[str, Any]], Tuple[bool, Dict[str, Any]]]
+
+
+class ToolCallExecutor:
+    """
+    Executes tool calls on a bounded thread pool with per-tool timeouts.
+    """
+
+    def __init__(self, max_workers: int = 8, timeout: Optional[float] = 60.0,
+                 timeouts: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            max_workers (int): Most tool calls running at once.
+            timeout (float): Seconds to wait for a call. None waits indefinitely.
+            timeouts (dict): Timeouts for individual functions by name, overriding timeout.
+        """
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gaia-tool")
+
+    def _timeout_for(self, name: str) -> Optional[float]:
+        return self.timeouts.get(name, self.timeout)
+
+    def run(self, tool_calls: List[Any], execute_function: ExecuteFunction) -> List[Dict[str, Any]]:
+        """
+        Execute tool calls concurrently.
+
+        Args:
+            tool_calls (list): The run's required_action.submit_tool_outputs.tool_calls.
+            execute_function (callable): Executes one function call, as
+                ConversableAgent.execute_function does.
+
+        Returns:
+            list: {"tool_call_id", "output"} dicts in the order of tool_calls.
+        """
+        started = time.monotonic()
+        count = len(tool_calls)
+        start_times: List[Optional[float]] = [None] * count
+        start_events = [threading.Event() for _ in range(count)]
+
+        def call(index: int, function_call: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
+            start_times[index] = time.monotonic()
+            start_events[index].set()
+            return execute_function(function_call)
+
+        futures = [
+            self._pool.submit(call, index, tool_call.function.dict())
+            for index, tool_call in enumerate(tool_calls)
+        ]
+        timeouts = [self._timeout_for(tool_call.function.name) for tool_call in tool_calls]
+        # by then every call would have started even if each ran to its timeout in turn
+        start_limit = None if None in timeouts else sum(timeouts)
+        tool_outputs = []
+        for index, (tool_call, future) in enumerate(zip(tool_calls, futures)):
+            name = tool_call.function.name
+            timeout = timeouts[index]
+            try:
+                if timeout is None:
+                    remaining = None
+                else:
+                    if not start_events[index].wait(max(start_limit - (time.monotonic() - started), 0.0)):
+                        raise FutureTimeoutError
+                    remaining = max(timeout - (time.monotonic() - start_times[index]), 0.0)
+                is_exec_success, tool_response = future.result(timeout=remaining)
+                content = tool_response["content"]
+            except FutureTimeoutError:
+                future.cancel()
+                is_exec_success = False
+                if start_events[index].is_set():
+                    content = f"Error: Function {name} timed out after {timeout} seconds."
+                else:
+                    content = f"Error: Function {name} did not start within {start_limit} seconds."
+            except Exception as e:
+                is_exec_success = False
+                content = f"Error: Function {name} raised {e!r}"
+            logger.info("Intermediate executing(%s, Sucess: %s) : %s", name, is_exec_success, content)
+            tool_outputs.append({"tool_call_id": tool_call.id, "output": str(content)})
+        logger.debug("Executed %d tool calls in %.3fs", len(tool_calls), time.monotonic() - started)
+        return tool_outputs
+
+    def shutdown(self) -> None:
+        """
+        Stop accepting calls. Calls already running are not interrupted.
+        """
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -3,7 +3,11 @@ This script is a template for updating a Notion database using the Notion API.
 
 """
 import csv
-import requests
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from data.intergration.http_client import http_session
 
 # Your Notion API Key and Database ID
 NOTION_API_KEY = 'your_notion_api_key'
@@ -62,7 +66,7 @@ def update_notion_database(data):
             }
         }   
         # Make a POST request to the Notion API to create or update a page
-        response = requests.post(NOTION_API_URL, headers=headers, json=payload, timeout=10)
+        response = http_session().post(NOTION_API_URL, headers=headers, json=payload, timeout=10)
         if response.status_code != 200:
             print(f"Failed to update Notion database: {response.text}")
         else:
@@ -96,5 +100,5 @@ if __name__ == "__main__":
     #Instructions: Replace the NOTION_API_KEY and NOTION_DATABASE_ID with your own values.
                 #Replace the payload with your own properties and CSV structure.
                     #Replace the path to your CSV file.
-#Dependencies: requests, csv
+#Dependencies: requests, csv, data.intergration.http_client
 
@@ -5,8 +5,9 @@ to generate responses to user input.
 """
 import os
 import sys
+import uuid
 sys.path.append("..")
-from eco_buddies.eco_chat import EcoBot
+from eco_buddies.engine import default_engine
 import json
 import datetime
 import logging
@@ -35,21 +36,11 @@ load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 openai.api_key = api_key
 personality = json.load(open("../eco_buddies/eco_bot_personality.json", "r", encoding="utf-8"))
-bot = EcoBot()
+# One engine per process, one conversation per browser session
+engine = default_engine()
+if "eco_bot_session_id" not in st.session_state:
+    st.session_state.eco_bot_session_id = uuid.uuid4().hex
 
-@st.cache_resource
-def get_response(user_input):
-    """
-    Cache the data returned by this function for improved performance.
-
-    Parameters:
-    - user_input (str): The input provided by the user.
-
-    Returns:
-    - str: The generated response.
-    """
-    return bot.generate_response(user_input)
-    
 
 @st.cache_data
 def load_image(image_path):
@@ -93,8 +84,9 @@ if show_chat:
         st.subheader("Chat with Eco-Bot")
         chat_input = st.text_input("Type your message here...")  # <-- Renamed variable
         if chat_input:
-            response = bot.generate_response(chat_input)
-            st.write(f"Eco-Bot: {response}")
+            st.write("Eco-Bot:")
+            # Show the response as it is generated
+            st.write_stream(engine.stream(st.session_state.eco_bot_session_id, chat_input))
         
 # About Section in a Container
 with st.container():
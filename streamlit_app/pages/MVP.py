@@ -8,7 +8,6 @@ eco_buddies:Meet your Eco-Buddies!
 main page has chatbot, settings, eco_buddies, gbts_interaction,"""
 import sys
 import json
-import requests
 import streamlit as st
 import streamlit.components.v1 as components
 from streamlit_webrtc import webrtc_streamer
@@ -17,6 +16,7 @@ from icecream import ic
 sys.path.append("..")
 from gbts.gbts import GBTS
 from eco_buddies.eco_chat import EcoBot
+from data.intergration.http_client import http_session
 
 
 # Initialize icecream setup
@@ -136,7 +136,7 @@ def main():
         # Send button
         if st.button("Send"):
             # Make a request to the AutoGen service with a timeout
-            response = requests.post(AUTOGEN_SERVICE_URL, json={"message": system_message}, timeout=10)
+            response = http_session().post(AUTOGEN_SERVICE_URL, json={"message": system_message}, timeout=10)
 
             if response.status_code == 200:
                 # Assuming the service returns a JSON with agent responses
@@ -1,8 +1,9 @@
 
 
+import uuid
 import streamlit as st
 #import streamlit.components.v1 as components
-from eco_buddies.eco_chat import EcoBot
+from eco_buddies.engine import default_engine
 from icecream import ic
 
 # Streamlit App Configuration
@@ -59,5 +60,13 @@ with st.container():
     
         # Display Eco-Bot Image
         st.image(f"assets/images/eco-bot.png", caption="Eco-Bot", use_column_width=False, width=150)
-        st.chat_input("Ask Eco-Bot a question: ")
-        
\ No newline at end of file
+        question = st.chat_input("Ask Eco-Bot a question: ")
+        if question:
+            if "eco_bot_session_id" not in st.session_state:
+                st.session_state.eco_bot_session_id = uuid.uuid4().hex
+            with st.chat_message("user"):
+                st.write(question)
+            with st.chat_message("assistant"):
+                # Show the response as it is generated
+                st.write_stream(default_engine().stream(st.session_state.eco_bot_session_id, question))
+        
@@ -1,5 +1,6 @@
+import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 from agents.assistants.assistant_retrevial import *
 
 class TestAssistants(unittest.TestCase):
@@ -10,6 +11,7 @@ class TestAssistants(unittest.TestCase):
         self.instructions = "Test instructions"
         self.tools = ["tool1", "tool2"]
         self.model = "gpt-3.5-turbo"
+        catalog.invalidate()
 
     def test_list_assistants(self):
         with patch("openai.beta.assistants.list") as mock_list:
@@ -29,12 +31,155 @@ class TestAssistants(unittest.TestCase):
             assistant_names = get_assistant_names()
             self.assertEqual(assistant_names, [self.assistant_name])
 
+    def test_catalog_pages_and_caches(self):
+        with patch("openai.beta.assistants.list") as mock_list:
+            mock_list.side_effect = [
+                {"data": [{"id": "asst_1", "name": "Gaia"}, {"id": "asst_2", "name": "EcoBot"}], "has_more": True},
+                {"data": [{"id": "asst_3", "name": "Gaia"}], "has_more": False},
+            ]
+            self.assertEqual([a["id"] for a in retrieve_assistants_by_name("Gaia")], ["asst_1", "asst_3"])
+            self.assertEqual(get_assistant_names(), ["Gaia", "EcoBot", "Gaia"])
+            self.assertEqual(catalog.get("asst_2")["name"], "EcoBot")
+            self.assertEqual(mock_list.call_count, 2)
+            mock_list.assert_called_with(limit=100, after="asst_2")
+
+    def test_catalog_refreshes_once_for_concurrent_callers(self):
+        calls = []
+
+        def slow_list(**params):
+            calls.append(params)
+            time.sleep(0.05)
+            return {"data": [{"id": "asst_1", "name": "Gaia"}]}
+
+        client = MagicMock()
+        client.beta.assistants.list.side_effect = slow_list
+        shared = AssistantCatalog(client=client)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: shared.names(), range(8)))
+        self.assertEqual(results, [["Gaia"]] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_catalog_drops_refresh_overtaken_by_invalidate(self):
+        client = MagicMock()
+        shared = AssistantCatalog(client=client)
+
+        def list_then_invalidate(**params):
+            # an assistant is created while this page is being fetched
+            shared.invalidate()
+            return {"data": [{"id": "asst_1", "name": "Gaia"}]}
+
+        client.beta.assistants.list.side_effect = list_then_invalidate
+        self.assertEqual(shared.refresh(), [{"id": "asst_1", "name": "Gaia"}])
+        self.assertIsNone(shared._loaded_at)
+        self.assertIsNone(shared.get("asst_1"))
+        client.beta.assistants.list.side_effect = None
+        client.beta.assistants.list.return_value = {"data": [{"id": "asst_1", "name": "Gaia"}, {"id": "asst_2", "name": "New"}]}
+        self.assertEqual(shared.get("asst_2")["name"], "New")
+
+    def test_create_invalidates_catalog(self):
+        with patch("openai.beta.assistants.list") as mock_list, patch("openai.beta.assistants.create") as mock_create:
+            mock_list.return_value = {"data": []}
+            mock_create.return_value = {"id": self.assistant_id}
+            self.assertEqual(list_assistants(), [])
+            create_assistant(self.assistant_name, self.instructions, self.tools, self.model)
+            mock_list.return_value = {"data": [{"id": self.assistant_id, "name": self.assistant_name}]}
+            self.assertEqual(get_assistant_names(), [self.assistant_name])
+
     def test_delete_assistant(self):
-        with patch("requests.delete") as mock_delete:
+        with patch("agents.assistants.assistant_retrevial.http_session") as mock_session:
+            mock_delete = mock_session.return_value.delete
             mock_delete.return_value.status_code = 200
             delete_assistant(self.assistant_id)
             mock_delete.assert_called_with(f"{BASE_URL}/{self.assistant_id}", headers=HEADERS, timeout=10)
 
+    def test_bulk_delete_retries_rate_limited_items(self):
+        def request(method, url, timeout, **kwargs):
+            response = MagicMock()
+            if url.endswith("asst_2") and not calls.count(url):
+                response.status_code, response.ok, response.headers = 429, False, {"Retry-After": "0.01"}
+            else:
+                response.status_code, response.ok, response.headers = 200, True, {}
+                response.json.return_value = {"id": url.rsplit("/", 1)[-1], "deleted": True}
+            calls.append(url)
+            return response
+
+        calls = []
+        session = MagicMock()
+        session.request.side_effect = request
+        with patch("agents.assistants.assistant_retrevial._pooled_session", return_value=session):
+            results = bulk_delete_assistants(["asst_1", "asst_2", "asst_3"], rate=1000, burst=10)
+        self.assertEqual([r.item for r in results], ["asst_1", "asst_2", "asst_3"])
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual([r.attempts for r in results], [1, 2, 1])
+
+    def test_bulk_create_reports_failures(self):
+        def request(method, url, timeout, json):
+            response = MagicMock()
+            response.ok = json["name"] != "bad"
+            response.status_code = 200 if response.ok else 400
+            response.headers = {}
+            response.text = "invalid model"
+            response.json.return_value = {"id": f"asst_{json['name']}"}
+            return response
+
+        session = MagicMock()
+        session.request.side_effect = request
+        specs = [{"name": "good", "model": self.model}, {"name": "bad", "model": "nope"}]
+        with patch("agents.assistants.assistant_retrevial._pooled_session", return_value=session):
+            results = bulk_create_assistants(specs, rate=1000, burst=10)
+        self.assertEqual((results[0].ok, results[0].assistant_id), (True, "asst_good"))
+        self.assertEqual((results[1].ok, results[1].status_code, results[1].error), (False, 400, "invalid model"))
+
+    def test_bulk_create_retries_only_requests_never_sent(self):
+        from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+        def request(method, url, timeout, json):
+            attempts = calls.setdefault(json["name"], [])
+            attempts.append(method)
+            outcome = outcomes[json["name"]][len(attempts) - 1]
+            if isinstance(outcome, Exception):
+                raise outcome
+            response = MagicMock()
+            response.status_code, response.ok, response.headers = outcome, outcome < 400, {"Retry-After": "0.01"}
+            response.json.return_value = {"id": f"asst_{json['name']}"}
+            return response
+
+        refused = requests.ConnectionError(MaxRetryError(None, BASE_URL, NewConnectionError(None, "refused")))
+        outcomes = {
+            "limited": [429, 200],
+            "refused": [refused, 200],
+            "server_error": [500, 200],
+            "read_timeout": [requests.ReadTimeout("read timed out"), 200],
+        }
+        calls = {}
+        session = MagicMock()
+        session.request.side_effect = request
+        specs = [{"name": name, "model": self.model} for name in outcomes]
+        with patch("agents.assistants.assistant_retrevial._pooled_session", return_value=session), \
+                patch("agents.assistants.assistant_retrevial.time.sleep"):
+            results = bulk_create_assistants(specs, rate=1000, burst=10)
+        self.assertEqual([(r.ok, r.attempts) for r in results], [(True, 2), (True, 2), (False, 1), (False, 1)])
+        self.assertEqual(results[2].error, "HTTP 500")
+
+    def test_bulk_result_survives_unreadable_body(self):
+        response = MagicMock()
+        response.status_code, response.ok, response.headers, response.text = 200, True, {}, "<html>"
+        response.json.side_effect = ValueError("Expecting value")
+        session = MagicMock()
+        session.request.return_value = response
+        with patch("agents.assistants.assistant_retrevial._pooled_session", return_value=session):
+            results = bulk_create_assistants([{"name": "a", "model": self.model}, {"name": "b", "model": self.model}],
+                                             rate=1000, burst=10)
+        self.assertEqual([(r.ok, r.assistant_id) for r in results], [(True, None), (True, None)])
+        self.assertEqual(results[0].error, "Unreadable response body: <html>")
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        started = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.045)
+
     def test_select_assistant(self):
         with patch("openai.beta.assistants.retrieve") as mock_retrieve:
             mock_retrieve.return_value = {"id": self.assistant_id}
@@ -71,7 +71,7 @@ class AgentModelTestCase(unittest.TestCase):
         Raises:
             AssertionError: If the agent's ID is None.
         """
-        agent = Agent('Type1', 'AgentName', ...)  # Fixed the positional argument placement
+        agent = Agent(agenttype='Type1', name='AgentName')
         self.session.add(agent)
         self.session.commit()
         self.assertIsNotNone(agent.agentid)
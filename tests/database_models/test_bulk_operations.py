@@ -0,0 +1,110 @@
+# tests/database_models/test_bulk_operations.py
+"""
+Test case for the bulk insert, upsert and streaming read helpers on BaseCRUD.
+"""
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, scoped_session
+from data.database.utils.db_operations import DebugInfo
+
+class BulkOperationsTestCase(unittest.TestCase):
+    """
+    Test case for BaseCRUD.bulk_create, BaseCRUD.bulk_upsert and BaseCRUD.iter_rows.
+    """
+    @classmethod
+    def setUpClass(cls):
+        """
+        Set up the class by creating an in-memory SQLite database with the debug_info table.
+        """
+        cls.engine = create_engine('sqlite:///:memory:')
+        DebugInfo.__table__.create(cls.engine)
+        cls.Session = scoped_session(sessionmaker(bind=cls.engine))
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Remove the session and drop the table.
+        """
+        cls.Session.remove()
+        DebugInfo.__table__.drop(cls.engine)
+
+    def setUp(self):
+        """
+        Start every test from an empty table.
+        """
+        self.session = self.Session()
+        self.session.query(DebugInfo).delete()
+        self.session.commit()
+
+    def tearDown(self):
+        """
+        Roll back anything left open by the test.
+        """
+        self.session.rollback()
+
+    def test_bulk_create_returns_primary_keys_in_order(self):
+        """
+        Rows spread over several batches are all inserted and their keys returned in order.
+        """
+        rows = ({"file_name": "agent.py", "function_name": "run", "message": f"line {i}"} for i in range(25))
+        ids = DebugInfo.bulk_create(self.session, rows, batch_size=10)
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(ids, sorted(ids))
+        stored = {info.debug_id: info.message for info in self.session.query(DebugInfo)}
+        self.assertEqual(stored[ids[3]], "line 3")
+
+    def test_bulk_upsert_updates_existing_rows(self):
+        """
+        Conflicting rows are updated and new rows are inserted.
+        """
+        first_id, = DebugInfo.bulk_create(self.session, [{"message": "original"}])
+        ids = DebugInfo.bulk_upsert(self.session, [
+            {"debug_id": first_id, "message": "changed"},
+            {"debug_id": first_id + 1, "message": "new"},
+        ])
+        self.assertEqual(ids, [first_id, first_id + 1])
+        self.session.expire_all()
+        self.assertEqual(self.session.get(DebugInfo, first_id).message, "changed")
+
+    def test_bulk_upsert_do_nothing_skips_conflicts(self):
+        """
+        An empty update_columns list leaves conflicting rows untouched.
+        """
+        first_id, = DebugInfo.bulk_create(self.session, [{"message": "original"}])
+        ids = DebugInfo.bulk_upsert(self.session, [{"debug_id": first_id, "message": "ignored"}], update_columns=[])
+        self.assertEqual(ids, [])
+        self.session.expire_all()
+        self.assertEqual(self.session.get(DebugInfo, first_id).message, "original")
+
+    def test_iter_rows_pages_in_key_order(self):
+        """
+        Keyset pagination visits every matching row once, ordered by the column then the key.
+        """
+        ids = DebugInfo.bulk_create(self.session, [
+            {"function_name": "eco-bot" if i % 2 else "gma", "file_name": str(i % 3)} for i in range(20)
+        ])
+        rows = list(DebugInfo.iter_rows(self.session, {"function_name": "eco-bot"}, order_by="file_name", batch_size=3))
+        expected = sorted(
+            (debug_id for i, debug_id in enumerate(ids) if i % 2),
+            key=lambda debug_id: (str(ids.index(debug_id) % 3), debug_id),
+        )
+        self.assertEqual([row.debug_id for row in rows], expected)
+
+    def test_iter_rows_returns_null_keys_last(self):
+        """
+        Rows without an order_by value are paged after the others, in either direction.
+        """
+        ids = DebugInfo.bulk_create(self.session, [
+            {"file_name": None if i % 3 == 0 else str(i % 2)} for i in range(10)
+        ])
+        null_ids = [debug_id for i, debug_id in enumerate(ids) if i % 3 == 0]
+        for descending in (False, True):
+            rows = list(DebugInfo.iter_rows(self.session, order_by="file_name", batch_size=2, descending=descending))
+            self.assertEqual(len(rows), 10)
+            names = [row.file_name for row in rows[:-len(null_ids)]]
+            self.assertEqual(names, sorted(names, reverse=descending))
+            tail = [row.debug_id for row in rows[-len(null_ids):]]
+            self.assertEqual(tail, sorted(null_ids, reverse=descending))
+
+if __name__ == '__main__':
+    unittest.main()
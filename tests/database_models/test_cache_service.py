@@ -0,0 +1,113 @@
+# tests/database_models/test_cache_service.py
+"""
+Test case for the two-tier CacheService backed by the cache_data table.
+"""
+import datetime
+import threading
+import time
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from data.database.utils.db_operations import CacheData
+from data.database.utils.cache_service import CacheService
+
+class CacheServiceTestCase(unittest.TestCase):
+    """
+    Test case for CacheService.
+    """
+    def setUp(self):
+        """
+        Create an in-memory SQLite database shared by every thread, with the cache_data table.
+        """
+        self.engine = create_engine(
+            'sqlite://', connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        CacheData.__table__.create(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.cache = CacheService(session_factory=self.Session, default_ttl=60)
+
+    def tearDown(self):
+        """
+        Stop the cache and drop the table.
+        """
+        self.cache.close()
+        CacheData.__table__.drop(self.engine)
+
+    def test_set_is_visible_to_other_processes_through_l2(self):
+        """
+        A value set by one service is read from the table by a service with a cold L1.
+        """
+        self.cache.set("eco:tip", {"text": "compost"})
+        other = CacheService(session_factory=self.Session)
+        self.assertEqual(other.get("eco:tip"), {"text": "compost"})
+        self.assertEqual(other.stats.l2_hits, 1)
+        self.assertEqual(other.get("eco:tip"), {"text": "compost"})
+        self.assertEqual(other.stats.l1_hits, 1)
+
+    def test_expired_entries_are_missed_and_purged(self):
+        """
+        Entries past their TTL are misses, and purge_expired removes their rows.
+        """
+        self.cache.set("short", "lived", ttl=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get("short"))
+        self.assertEqual(self.cache.stats.misses, 1)
+        self.assertEqual(self.cache.purge_expired(), 1)
+
+    def test_get_or_compute_computes_once_under_contention(self):
+        """
+        Concurrent callers for the same missing key share a single computation.
+        """
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return "answer"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get_or_compute("q", compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["answer"] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_compute_does_not_block_other_keys(self):
+        """
+        A slow computation only holds up callers of the same key.
+        """
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return "slow"
+
+        thread = threading.Thread(target=self.cache.get_or_compute, args=("a", slow))
+        thread.start()
+        self.assertTrue(started.wait(5))
+        self.assertEqual(self.cache.get_or_compute("b", lambda: "fast"), "fast")
+        release.set()
+        thread.join()
+        self.assertEqual(self.cache.get("a"), "slow")
+        self.assertEqual(self.cache.stats.snapshot()["computes"], 2)
+
+    def test_set_overwrites_existing_key(self):
+        """
+        Setting an existing key replaces its value and expiry in place.
+        """
+        self.cache.set("k", 1)
+        self.cache.set("k", 2, ttl=120)
+        with self.Session() as db_session:
+            rows = db_session.query(CacheData).filter_by(cache_key="k").all()
+        self.assertEqual([row.cache_value for row in rows], [2])
+        self.assertGreater(rows[0].expiry_time, datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# tests/database_models/test_crud.py
+"""
+Test case for the read, update and delete helpers on BaseCRUD and their async counterparts.
+"""
+import asyncio
+import datetime
+import os
+import tempfile
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from data.database.utils.db_operations import DebugInfo, Message
+
+class CrudTestCase(unittest.TestCase):
+    """
+    Test case for BaseCRUD.read/update/delete and BaseCRUD.aread/aupdate/adelete.
+    """
+    def setUp(self):
+        """
+        Create a file-backed SQLite database with the debug_info table, shared by the sync and async engines.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "crud.db")
+        self.engine = create_engine(f"sqlite:///{path}")
+        self.addCleanup(self.engine.dispose)
+        DebugInfo.__table__.create(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.async_url = f"sqlite+aiosqlite:///{path}"
+
+    def add_row(self, line_number):
+        with self.Session() as session:
+            return DebugInfo.bulk_create(session, [{"line_number": line_number}])[0]
+
+    def test_sync_lookups_use_the_primary_key(self):
+        """
+        read, update and delete find the record by its primary key.
+        """
+        debug_id = self.add_row(1)
+        with self.Session() as session:
+            self.assertEqual(DebugInfo.read(session, debug_id).line_number, 1)
+            self.assertEqual(DebugInfo.update(session, debug_id, line_number=2).line_number, 2)
+            DebugInfo.delete(session, debug_id)
+            self.assertIsNone(DebugInfo.read(session, debug_id))
+
+    def test_async_lookups_match_the_sync_ones(self):
+        """
+        aread, aupdate and adelete find the same record as their sync counterparts.
+        """
+        debug_id = self.add_row(1)
+
+        async def run():
+            engine = create_async_engine(self.async_url)
+            try:
+                async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+                    found = (await DebugInfo.aread(session, debug_id)).line_number
+                    updated = (await DebugInfo.aupdate(session, debug_id, line_number=3)).line_number
+                    deleted = await DebugInfo.adelete(session, debug_id)
+                    missing = await DebugInfo.aread(session, debug_id)
+                    return found, updated, deleted, missing
+            finally:
+                await engine.dispose()
+
+        self.assertEqual(asyncio.run(run()), (1, 3, True, None))
+        with self.Session() as session:
+            self.assertIsNone(DebugInfo.read(session, debug_id))
+
+    def test_partitioned_models_are_found_by_id_and_timestamp(self):
+        """
+        Models partitioned by time are looked up with an (id, timestamp) tuple, not the id alone.
+        """
+        Message.__table__.create(self.engine)
+        sent = datetime.datetime(2024, 1, 1, 10, 0)
+        with self.Session() as session:
+            Message.bulk_create(session, [{"messageid": 1, "content": "hi", "timestamp": sent}])
+            self.assertEqual(Message.read(session, (1, sent)).content, "hi")
+            self.assertEqual(Message.update(session, (1, sent), content="hello").content, "hello")
+            with self.assertRaises(InvalidRequestError):
+                Message.read(session, 1)
+            Message.delete(session, (1, sent))
+            self.assertIsNone(Message.read(session, (1, sent)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# tests/database_models/test_migrate.py
+"""
+Test case for the SQL migration runner.
+
+The migrations are written for PostgreSQL. Set AGENT_DB_TEST_DSN to a scratch
+PostgreSQL database to run these; the Agent_DB tables, schema_migrations and
+the migrations' functions are created and dropped.
+"""
+import datetime
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from data.database.utils import db_operations
+from data.database.utils.db_operations import Message
+from data.database.utils.migrate import apply_migrations, ensure_partitions, pending_migrations
+
+@unittest.skipUnless(os.getenv("AGENT_DB_TEST_DSN"), "AGENT_DB_TEST_DSN is not set")
+class MigrateTestCase(unittest.TestCase):
+    """
+    Test case for apply_migrations and ensure_partitions.
+    """
+    def setUp(self):
+        self.engine = create_engine(os.environ["AGENT_DB_TEST_DSN"])
+        self.addCleanup(self.engine.dispose)
+
+    def write(self, directory, name, sql):
+        Path(directory, name).write_text(sql, encoding="utf-8")
+
+    def test_applied_migrations_are_recorded_and_skipped(self):
+        """
+        Each file runs once and is recorded, and a failing file is rolled back and not recorded.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        def cleanup():
+            with self.engine.begin() as connection:
+                connection.execute(text("DROP TABLE IF EXISTS migrate_test_a, migrate_test_b, migrate_test_c"))
+                connection.execute(text("DELETE FROM schema_migrations WHERE version LIKE 'test_%'"))
+        self.addCleanup(cleanup)
+
+        self.write(directory.name, "test_001_a.sql", "CREATE TABLE migrate_test_a (id integer);")
+        self.write(directory.name, "test_002_b.sql", "CREATE TABLE migrate_test_b (id integer);")
+        self.assertEqual(apply_migrations(self.engine, directory.name), ["test_001_a", "test_002_b"])
+        self.assertEqual(apply_migrations(self.engine, directory.name), [])
+
+        self.write(directory.name, "test_003_c.sql",
+                   "CREATE TABLE migrate_test_c (id integer); INSERT INTO missing_table VALUES (1);")
+        with self.assertRaises(Exception):
+            apply_migrations(self.engine, directory.name)
+        self.assertEqual([path.stem for path in pending_migrations(self.engine, directory.name)], ["test_003_c"])
+        with self.engine.connect() as connection:
+            recorded = connection.execute(
+                text("SELECT version FROM schema_migrations WHERE version LIKE 'test_%' ORDER BY version")
+            ).scalars().all()
+            created = connection.execute(text("SELECT to_regclass('migrate_test_c')")).scalar()
+        self.assertEqual(recorded, ["test_001_a", "test_002_b"])
+        self.assertIsNone(created)
+
+    def test_partitioned_tables(self):
+        """
+        The migrations partition messages by month, and rows are found by (messageid, timestamp).
+        """
+        def cleanup():
+            tables = ", ".join(f'"{table.name}"' for table in db_operations.Base.metadata.sorted_tables)
+            with self.engine.begin() as connection:
+                connection.execute(text(f"DROP TABLE IF EXISTS {tables}, schema_migrations CASCADE"))
+                connection.execute(text(
+                    "DROP FUNCTION IF EXISTS create_monthly_partitions, partition_table_by_month, notify_row_change"
+                ))
+        self.addCleanup(cleanup)
+
+        db_operations.init_db(self.engine)
+        apply_migrations(self.engine)
+        self.assertEqual(pending_migrations(self.engine), [])
+        ensure_partitions(self.engine, months_ahead=1)
+
+        this_month = datetime.date.today().replace(day=1)
+        with self.engine.connect() as connection:
+            partitions = set(connection.execute(text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "WHERE parent.relname = 'messages'"
+            )).scalars())
+        self.assertIn(f"messages_{this_month:%Y_%m}", partitions)
+        self.assertIn("messages_default", partitions)
+
+        sent = datetime.datetime.now().replace(microsecond=0)
+        with sessionmaker(bind=self.engine)() as session:
+            messageid = session.execute(text("SELECT nextval('messages_messageid_seq')")).scalar()
+            Message.bulk_create(session, [{"messageid": messageid, "content": "hi", "timestamp": sent}])
+            self.assertEqual(Message.update(session, (messageid, sent), content="hello").content, "hello")
+            Message.delete(session, (messageid, sent))
+            self.assertIsNone(Message.read(session, (messageid, sent)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# tests/database_models/test_setconn.py
+"""
+Test case for the pool settings, session scopes and schema reflection cache in setconn.
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from sqlalchemy import MetaData, create_engine, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from data.database.utils.db_operations import DebugInfo
+from data.database.utils.setconn import (
+    async_session_scope, pool_options, reflect_metadata, schema_fingerprint, session_scope,
+)
+
+class PoolOptionsTestCase(unittest.TestCase):
+    """
+    Test case for pool_options.
+    """
+    def test_defaults(self):
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(pool_options(), {
+                "pool_size": 5, "max_overflow": 10, "pool_timeout": 30.0,
+                "pool_recycle": 1800, "pool_pre_ping": True,
+            })
+
+    def test_environment_overrides(self):
+        settings = {
+            "DB_POOL_SIZE": "20", "DB_MAX_OVERFLOW": "0", "DB_POOL_TIMEOUT": "2.5",
+            "DB_POOL_RECYCLE": "60", "DB_POOL_PRE_PING": "off",
+        }
+        with mock.patch.dict(os.environ, settings):
+            self.assertEqual(pool_options(), {
+                "pool_size": 20, "max_overflow": 0, "pool_timeout": 2.5,
+                "pool_recycle": 60, "pool_pre_ping": False,
+            })
+
+class SessionScopeTestCase(unittest.TestCase):
+    """
+    Test case for session_scope and async_session_scope, on a SQLite file.
+    """
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        path = Path(self.tmp.name) / "scope.db"
+        self.engine = create_engine(f"sqlite:///{path}")
+        self.addCleanup(self.engine.dispose)
+        DebugInfo.__table__.create(self.engine)
+        self.async_url = f"sqlite+aiosqlite:///{path}"
+
+    def messages(self):
+        with self.engine.connect() as connection:
+            return sorted(connection.execute(select(DebugInfo.message)).scalars())
+
+    def test_session_scope_commits_or_rolls_back(self):
+        """
+        A block that finishes is committed and one that raises is rolled back.
+        """
+        with mock.patch("data.database.utils.setconn.Session", sessionmaker(bind=self.engine)):
+            with session_scope() as db_session:
+                db_session.add(DebugInfo(message="kept"))
+            with self.assertRaises(ValueError):
+                with session_scope() as db_session:
+                    db_session.add(DebugInfo(message="discarded"))
+                    db_session.flush()
+                    raise ValueError("failed")
+        self.assertEqual(self.messages(), ["kept"])
+
+    def test_async_session_scope_commits_or_rolls_back(self):
+        """
+        The async scope commits a finished block and rolls back one that raises.
+        """
+        async def run():
+            engine = create_async_engine(self.async_url)
+            factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+            try:
+                with mock.patch("data.database.utils.setconn.AsyncSessionFactory", factory):
+                    async with async_session_scope() as db_session:
+                        db_session.add(DebugInfo(message="kept"))
+                    with self.assertRaises(ValueError):
+                        async with async_session_scope() as db_session:
+                            db_session.add(DebugInfo(message="discarded"))
+                            await db_session.flush()
+                            raise ValueError("failed")
+            finally:
+                await engine.dispose()
+
+        asyncio.run(run())
+        self.assertEqual(self.messages(), ["kept"])
+
+class ReflectMetadataTestCase(unittest.TestCase):
+    """
+    Test case for schema_fingerprint and reflect_metadata.
+    """
+    def setUp(self):
+        """
+        Create a SQLite database file with one table and an empty cache directory.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.engine = create_engine(f"sqlite:///{Path(self.tmp.name) / 'agents.db'}")
+        self.addCleanup(self.engine.dispose)
+        with self.engine.begin() as connection:
+            connection.execute(text("CREATE TABLE agents (agentid INTEGER PRIMARY KEY, name VARCHAR(50))"))
+        self.cache_dir = Path(self.tmp.name) / "cache"
+
+    def test_second_reflection_loads_from_cache(self):
+        """
+        The first call reflects and writes the cache, and the second reads it without reflecting.
+        """
+        metadata = reflect_metadata(self.engine, cache_dir=self.cache_dir)
+        self.assertEqual(list(metadata.tables), ["agents"])
+        cache_files = list(self.cache_dir.glob("schema-*.pickle"))
+        self.assertEqual([f.name for f in cache_files], [f"schema-{schema_fingerprint(self.engine)}.pickle"])
+        self.assertEqual(self.cache_dir.stat().st_mode & 0o777, 0o700)
+
+        with mock.patch.object(MetaData, "reflect") as reflect:
+            cached = reflect_metadata(self.engine, cache_dir=self.cache_dir)
+        reflect.assert_not_called()
+        self.assertEqual(list(cached.tables["agents"].columns.keys()), ["agentid", "name"])
+
+    def test_schema_change_changes_the_fingerprint(self):
+        """
+        Adding a column gives a new fingerprint, so the stale cache is not used.
+        """
+        before = schema_fingerprint(self.engine)
+        reflect_metadata(self.engine, cache_dir=self.cache_dir)
+        with self.engine.begin() as connection:
+            connection.execute(text("ALTER TABLE agents ADD COLUMN status VARCHAR(255)"))
+        after = schema_fingerprint(self.engine)
+        self.assertNotEqual(before, after)
+        metadata = reflect_metadata(self.engine, cache_dir=self.cache_dir)
+        self.assertIn("status", metadata.tables["agents"].columns)
+        self.assertEqual(len(list(self.cache_dir.glob("schema-*.pickle"))), 2)
+
+    @unittest.skipUnless(hasattr(os, "getuid"), "file ownership is not checked on this platform")
+    def test_cache_owned_by_another_user_is_ignored(self):
+        """
+        A cache file that belongs to someone else is never unpickled.
+        """
+        reflect_metadata(self.engine, cache_dir=self.cache_dir)
+        with mock.patch("data.database.utils.setconn.os.getuid", return_value=os.getuid() + 1), \
+                mock.patch("data.database.utils.setconn.pickle.load") as load:
+            metadata = reflect_metadata(self.engine, cache_dir=self.cache_dir)
+        load.assert_not_called()
+        self.assertIn("agents", metadata.tables)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+# tests/database_models/test_thread_registry.py
+"""
+Test case for the GaiaAssistant thread registry backed by the threads table.
+"""
+import threading
+import unittest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from data.database.utils.db_operations import Run, Thread
+from gbts.thread_registry import ThreadRegistry
+
+class ThreadRegistryTestCase(unittest.TestCase):
+    """
+    Test case for ThreadRegistry.
+    """
+    def setUp(self):
+        """
+        Create an in-memory SQLite database with the threads and runs tables.
+        """
+        self.engine = create_engine(
+            'sqlite://', connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Thread.__table__.create(self.engine)
+        Run.__table__.create(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.created = []
+
+    def tearDown(self):
+        Run.__table__.drop(self.engine)
+        Thread.__table__.drop(self.engine)
+
+    def create_thread(self):
+        self.created.append(f"thread_{len(self.created)}")
+        return self.created[-1]
+
+    def test_restart_reuses_thread_and_read_position(self):
+        """
+        A new registry, as after a restart, finds the thread and read position saved earlier.
+        """
+        registry = ThreadRegistry("asst_1", session_factory=self.Session)
+        state = registry.get_or_create("EcoBot", self.create_thread)
+        self.assertEqual(state.id, "thread_0")
+        self.assertIs(registry.get_or_create("EcoBot", self.create_thread), state)
+        registry.finish_turn("EcoBot", 4, last_message_id="msg_9", openai_run_id="run_1", status="completed")
+
+        restarted = ThreadRegistry("asst_1", session_factory=self.Session)
+        state = restarted.get_or_create("EcoBot", self.create_thread)
+        self.assertEqual((state.id, state.unread_index, state.last_message_id), ("thread_0", 4, "msg_9"))
+        self.assertEqual(self.created, ["thread_0"])
+        with self.Session() as db_session:
+            run = db_session.execute(select(Run)).scalar_one()
+            self.assertEqual((run.openai_run_id, run.status, run.thread_id), ("run_1", "completed", state.row_id))
+
+    def test_threads_are_per_assistant_and_agent(self):
+        """
+        Different agents and assistants get different threads, and forget removes an entry.
+        """
+        first = ThreadRegistry("asst_1", session_factory=self.Session)
+        second = ThreadRegistry("asst_2", session_factory=self.Session)
+        self.assertEqual(first.get_or_create("EcoBot", self.create_thread).id, "thread_0")
+        self.assertEqual(first.get_or_create("Planner", self.create_thread).id, "thread_1")
+        self.assertEqual(second.get_or_create("EcoBot", self.create_thread).id, "thread_2")
+
+        first.forget("EcoBot")
+        self.assertIsNone(first.get("EcoBot"))
+        self.assertIsNotNone(first.get("Planner"))
+        self.assertIsNotNone(second.get("EcoBot"))
+
+    def test_concurrent_creates(self):
+        """
+        Callers for one agent create a single thread, while other agents are not held up.
+        """
+        registry = ThreadRegistry("asst_1", session_factory=self.Session)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_create():
+            started.set()
+            release.wait(5)
+            return self.create_thread()
+
+        results = []
+        callers = [
+            threading.Thread(target=lambda: results.append(registry.get_or_create("EcoBot", slow_create)))
+            for _ in range(2)
+        ]
+        for caller in callers:
+            caller.start()
+        self.assertTrue(started.wait(5))
+        # another agent's thread is created while EcoBot's is still in flight
+        self.assertEqual(registry.get_or_create("Planner", lambda: "thread_planner").id, "thread_planner")
+        release.set()
+        for caller in callers:
+            caller.join(5)
+        self.assertEqual([state.id for state in results], ["thread_0", "thread_0"])
+        self.assertEqual(self.created, ["thread_0"])
+
+    def test_thread_registered_by_another_process_wins(self):
+        """
+        If another process registers the agent's thread first, its thread is returned.
+        """
+        ours = ThreadRegistry("asst_1", session_factory=self.Session)
+        theirs = ThreadRegistry("asst_1", session_factory=self.Session)
+
+        def create_racing():
+            theirs.get_or_create("EcoBot", self.create_thread)
+            return "thread_ours"
+
+        self.assertEqual(ours.get_or_create("EcoBot", create_racing).id, "thread_0")
+        self.assertEqual(ours.get("EcoBot").id, "thread_0")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+# tests/database_models/test_write_behind.py
+"""
+Test case for the WriteBehindWriter batching, retry and dead letter behaviour.
+"""
+import queue
+import time
+import unittest
+from unittest import mock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from data.database.utils.db_operations import DebugInfo
+from data.database.utils.write_behind import WriteBehindWriter
+
+class FlakySessionFactory:
+    """
+    Session factory whose sessions fail to commit the first `failures` times.
+    """
+    def __init__(self, session_factory, failures):
+        self.session_factory = session_factory
+        self.failures = failures
+        self.commits = 0
+
+    def __call__(self):
+        session = self.session_factory()
+        commit = session.commit
+
+        def flaky_commit():
+            self.commits += 1
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("database unavailable")
+            commit()
+        session.commit = flaky_commit
+        return session
+
+class WriteBehindWriterTestCase(unittest.TestCase):
+    """
+    Test case for WriteBehindWriter.
+    """
+    @classmethod
+    def setUpClass(cls):
+        """
+        Set up the class by creating an in-memory SQLite database with the debug_info table.
+        """
+        cls.engine = create_engine('sqlite://', connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        DebugInfo.__table__.create(cls.engine)
+        cls.Session = sessionmaker(bind=cls.engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Drop the table.
+        """
+        DebugInfo.__table__.drop(cls.engine)
+
+    def setUp(self):
+        """
+        Start every test from an empty table.
+        """
+        with self.Session() as session:
+            session.query(DebugInfo).delete()
+            session.commit()
+
+    def writer(self, **options):
+        writer = WriteBehindWriter(**dict({"session_factory": self.Session}, **options))
+        self.addCleanup(writer.close)
+        return writer
+
+    def stored_lines(self):
+        with self.Session() as session:
+            return sorted(row.line_number for row in session.query(DebugInfo))
+
+    def wait_for(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("condition not met in time")
+            time.sleep(0.01)
+
+    def test_batch_size_triggers_a_flush(self):
+        """
+        A full batch is written without waiting for the flush interval.
+        """
+        writer = self.writer(max_batch_size=5, flush_interval=60)
+        for i in range(5):
+            writer.submit(DebugInfo, {"file_name": "a.py", "line_number": i})
+        self.wait_for(lambda: writer.stats.snapshot()["written"] == 5)
+        self.assertEqual(self.stored_lines(), [0, 1, 2, 3, 4])
+        self.assertEqual(writer.stats.snapshot()["flushes"], 1)
+
+    def test_flush_interval_triggers_a_flush(self):
+        """
+        A partial batch is written once it has waited flush_interval seconds.
+        """
+        writer = self.writer(max_batch_size=100, flush_interval=0.05)
+        writer.submit(DebugInfo, {"file_name": "a.py", "line_number": 7})
+        self.wait_for(lambda: writer.stats.snapshot()["written"] == 1)
+        self.assertEqual(self.stored_lines(), [7])
+
+    def test_failed_batch_is_retried(self):
+        """
+        A batch that fails to commit is retried and written once the database recovers.
+        """
+        factory = FlakySessionFactory(self.Session, failures=2)
+        writer = self.writer(session_factory=factory, max_retries=3, retry_delay=0.01)
+        writer.submit(DebugInfo, {"line_number": 1})
+        writer.submit(DebugInfo, {"line_number": 2})
+        self.assertTrue(writer.flush())
+        self.assertEqual(self.stored_lines(), [1, 2])
+        stats = writer.stats.snapshot()
+        self.assertEqual((stats["retried"], stats["written"], stats["failed"]), (2, 2, 0))
+        self.assertEqual(factory.commits, 3)
+
+    def test_failing_batch_goes_to_dead_letter(self):
+        """
+        A batch that keeps failing is kept in dead_letter and can be queued again.
+        """
+        factory = FlakySessionFactory(self.Session, failures=3)
+        writer = self.writer(session_factory=factory, max_retries=2, retry_delay=0.01)
+        writer.submit(DebugInfo, {"line_number": 1})
+        self.assertTrue(writer.flush())
+        self.assertEqual(self.stored_lines(), [])
+        self.assertEqual(len(writer.dead_letter), 1)
+        self.assertEqual(writer.stats.snapshot()["dead_lettered"], 1)
+
+        self.assertEqual(writer.retry_dead_letter(), 1)
+        self.assertTrue(writer.flush())
+        self.assertEqual(self.stored_lines(), [1])
+        self.assertEqual(len(writer.dead_letter), 0)
+
+    def test_bad_row_is_dead_lettered_alone(self):
+        """
+        When a batch keeps failing because of one row, the other rows are still written.
+        """
+        with self.Session() as session:
+            session.add(DebugInfo(debug_id=12, line_number=0))
+            session.commit()
+        writer = self.writer(max_retries=1, retry_delay=0.01, flush_interval=60)
+        for debug_id in range(10, 15):
+            writer.submit(DebugInfo, {"debug_id": debug_id, "line_number": debug_id})
+        self.assertTrue(writer.flush())
+        self.assertEqual(self.stored_lines(), [0, 10, 11, 13, 14])
+        self.assertEqual([item.values["debug_id"] for item in writer.dead_letter], [12])
+        stats = writer.stats.snapshot()
+        self.assertEqual((stats["written"], stats["failed"]), (4, 1))
+
+    def test_dead_letter_kept_when_queue_is_full(self):
+        """
+        An item that cannot be queued again stays in dead_letter.
+        """
+        factory = FlakySessionFactory(self.Session, failures=1)
+        writer = self.writer(session_factory=factory, max_retries=0)
+        writer.submit(DebugInfo, {"line_number": 1})
+        self.assertTrue(writer.flush())
+        with mock.patch.object(writer._queue, "put", side_effect=queue.Full):
+            with self.assertRaises(queue.Full):
+                writer.retry_dead_letter()
+        self.assertEqual(len(writer.dead_letter), 1)
+        self.assertEqual(writer.retry_dead_letter(), 1)
+        self.assertTrue(writer.flush())
+        self.assertEqual(self.stored_lines(), [1])
+
+    def test_closed_writer_rejects_rows(self):
+        """
+        Rows submitted before close are written and later submissions are refused.
+        """
+        writer = self.writer(flush_interval=60)
+        writer.submit(DebugInfo, {"line_number": 3})
+        writer.close()
+        self.assertEqual(self.stored_lines(), [3])
+        with self.assertRaises(RuntimeError):
+            writer.submit(DebugInfo, {"line_number": 4})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+# tests/test_citations.py
+"""
+Test case for formatting assistant message citations.
+"""
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from gbts import citations
+
+def make_annotation(text, file_id, start=None):
+    end = None if start is None else start + len(text)
+    return SimpleNamespace(
+        text=text, start_index=start, end_index=end,
+        file_citation=SimpleNamespace(file_id=file_id, quote=None), file_path=None,
+    )
+
+class CitationsTestCase(unittest.TestCase):
+    """
+    Test case for format_annotated_text.
+    """
+    def setUp(self):
+        citations._file_cache.clear()
+        self.client = mock.MagicMock()
+        self.client.files.retrieve.side_effect = lambda file_id: SimpleNamespace(filename=f"{file_id}.pdf")
+
+    def test_rewrites_in_one_pass_and_fetches_each_file_once(self):
+        """
+        Every marker is replaced at its offset and each distinct file is retrieved once.
+        """
+        value = "".join(f"fact {i}【{i}†source】 " for i in range(50))
+        annotations = []
+        for i in range(50):
+            marker = f"【{i}†source】"
+            annotations.append(make_annotation(marker, f"file-{i % 3}", start=value.index(marker)))
+        content = SimpleNamespace(value=value, annotations=annotations)
+
+        text = citations.format_annotated_text(self.client, content)
+
+        self.assertTrue(text.startswith("fact 0 [0] fact 1 [1] "))
+        self.assertNotIn("†", text)
+        self.assertIn("[49] file-1.pdf", text)
+        self.assertEqual(self.client.files.retrieve.call_count, 3)
+
+        citations.format_annotated_text(self.client, SimpleNamespace(value=value, annotations=annotations))
+        self.assertEqual(self.client.files.retrieve.call_count, 3)
+
+    def test_missing_offsets_and_failed_lookups(self):
+        """
+        Annotations without offsets are found by text, and failed lookups are skipped.
+        """
+        self.client.files.retrieve.side_effect = [RuntimeError("gone")]
+        content = SimpleNamespace(value="see [a] and [a]", annotations=[
+            make_annotation("[a]", "file-x"), make_annotation("[a]", "file-x"),
+        ])
+        text = citations.format_annotated_text(self.client, content)
+        self.assertEqual(text, "see  [0] and  [1]\n")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+# tests/test_context_builder.py
+"""
+Test case for the token-budgeted EcoBot context builder.
+"""
+import threading
+import unittest
+from eco_buddies.context_builder import ContextBuilder, count_tokens
+
+class ContextBuilderTestCase(unittest.TestCase):
+    """
+    Test case for ContextBuilder.
+    """
+    def setUp(self):
+        """
+        Create a builder whose summarize function records what it was given.
+        """
+        self.folded = []
+
+        def summarize(summary, messages, max_tokens):
+            self.folded.extend(messages)
+            return f"{len(self.folded)} earlier messages"
+
+        self.builder = ContextBuilder(max_tokens=400, summary_tokens=50, summarize=summarize, background=False)
+
+    def prompt_tokens(self, messages):
+        return sum(count_tokens(m["content"]) + 4 for m in messages)
+
+    def test_prompt_stays_within_budget(self):
+        """
+        However long the conversation, the prompt stays within max_tokens and ends with the latest input.
+        """
+        history = []
+        for turn in range(200):
+            history.append({"role": "user", "content": f"question {turn} " + "word " * 20})
+            messages = self.builder.build("You are EcoBot.", history)
+            self.assertLessEqual(self.prompt_tokens(messages), 400)
+            self.assertEqual(messages[-1]["content"], history[-1]["content"])
+            history.append({"role": "Eco-Bot", "content": f"answer {turn} " + "word " * 20})
+
+        self.assertEqual(messages[0], {"role": "system", "content": "You are EcoBot."})
+        self.assertIn("earlier messages", messages[1]["content"])
+        self.assertNotIn("Eco-Bot", {m["role"] for m in messages})
+
+    def test_summary_is_incremental(self):
+        """
+        Each message is summarised once, and not on every turn.
+        """
+        history = []
+        for turn in range(100):
+            history.append({"role": "user", "content": f"question {turn} " + "word " * 20})
+            self.builder.build("You are EcoBot.", history)
+
+        contents = [m["content"] for m in self.folded]
+        self.assertEqual(len(contents), len(set(contents)))
+        self.assertEqual(contents, [m["content"] for m in history[:len(contents)]])
+        self.assertLess(self.builder.summarize_calls, 50)
+
+    def test_short_history_is_sent_whole(self):
+        """
+        A conversation that fits the budget is sent unchanged, without a summary.
+        """
+        history = [{"role": "user", "content": "hi"}, {"role": "Eco-Bot", "content": "hello"}]
+        messages = self.builder.build("sys", history)
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(messages[2], {"role": "assistant", "content": "hello"})
+        self.assertEqual(self.builder.summarize_calls, 0)
+
+    def test_background_summary_does_not_block_build(self):
+        """
+        build returns while the summary is updated, which shows up in a later prompt.
+        """
+        started, release = threading.Event(), threading.Event()
+
+        def summarize(summary, messages, max_tokens):
+            started.set()
+            release.wait(5)
+            return summary + f"+{len(messages)}"
+
+        builder = ContextBuilder(max_tokens=200, summary_tokens=50, summarize=summarize)
+        history = [{"role": "user", "content": f"question {turn} " + "word " * 20} for turn in range(10)]
+        messages = builder.build("sys", history)
+        self.assertTrue(started.wait(5))
+        self.assertEqual(builder.summary_state(), ("", 0))
+        self.assertNotIn("Summary", messages[1]["content"])
+
+        release.set()
+        builder.wait(5)
+        summary, summarized = builder.summary_state()
+        self.assertEqual(summary, f"+{summarized}")
+        self.assertIn(summary, builder.build("sys", history)[1]["content"])
+
+    def test_reset_discards_a_running_update(self):
+        """
+        An update that finishes after reset does not bring back the old summary.
+        """
+        release = threading.Event()
+        builder = ContextBuilder(max_tokens=200, summary_tokens=50,
+                                 summarize=lambda summary, messages, max_tokens: release.wait(5) and "old")
+        history = [{"role": "user", "content": "word " * 20} for _ in range(10)]
+        builder.build("sys", history)
+        builder.reset()
+        release.set()
+        builder.wait(5)
+        self.assertEqual(builder.summary_state(), ("", 0))
+
+        builder.restore("saved", 4)
+        messages = builder.build("sys", history[:6])
+        self.assertEqual(messages[1]["content"], "Summary of the earlier conversation: saved")
+        self.assertEqual(len(messages), 4)
+
+if __name__ == "__main__":
+    unittest.main()
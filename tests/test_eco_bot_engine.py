@@ -0,0 +1,103 @@
+# tests/test_eco_bot_engine.py
+"""
+Test case for the session-keyed EcoBot engine.
+"""
+import asyncio
+import unittest
+from eco_buddies.engine import EcoBotEngine
+
+class FakeBot:
+    """
+    Stands in for EcoBot, recording each session's history and the peak concurrency.
+    """
+    active = 0
+    peak = 0
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.conversation_history = []
+
+    async def astream_response(self, user_input, client):
+        FakeBot.active += 1
+        FakeBot.peak = max(FakeBot.peak, FakeBot.active)
+        try:
+            self.conversation_history.append(user_input)
+            for piece in (self.session_id, ":", user_input):
+                await asyncio.sleep(0.001)
+                yield piece
+        finally:
+            FakeBot.active -= 1
+
+class EcoBotEngineTestCase(unittest.TestCase):
+    """
+    Test case for EcoBotEngine.
+    """
+    def setUp(self):
+        FakeBot.active = FakeBot.peak = 0
+        self.engine = EcoBotEngine(bot_factory=FakeBot, client=object(), max_sessions=500, max_concurrency=8)
+
+    def tearDown(self):
+        self.engine.close()
+
+    def test_sessions_are_isolated(self):
+        """
+        Hundreds of concurrent sessions each see only their own history, within the concurrency limit.
+        """
+        async def chat(i):
+            first = await self.engine.agenerate(f"s{i}", "hello")
+            second = await self.engine.agenerate(f"s{i}", "bye")
+            return first, second
+
+        async def main():
+            return await asyncio.gather(*(chat(i) for i in range(300)))
+
+        results = asyncio.run(main())
+        for i, (first, second) in enumerate(results):
+            self.assertEqual(first, f"s{i}:hello")
+            self.assertEqual(second, f"s{i}:bye")
+        self.assertLessEqual(FakeBot.peak, 8)
+        self.assertEqual(len(self.engine), 300)
+        self.assertEqual(self.engine.session("s123").conversation_history, ["hello", "bye"])
+
+    def test_idle_sessions_are_dropped(self):
+        """
+        Only the most recently used max_sessions bots are kept.
+        """
+        engine = EcoBotEngine(bot_factory=FakeBot, client=object(), max_sessions=2)
+        first = engine.session("a")
+        engine.session("b")
+        engine.session("a")
+        engine.session("c")
+        self.assertEqual(len(engine), 2)
+        self.assertIs(engine.session("a"), first)
+
+    def test_busy_sessions_are_kept(self):
+        """
+        A session with a turn in progress is not dropped, and its lock goes once the turn ends.
+        """
+        engine = EcoBotEngine(bot_factory=FakeBot, client=object(), max_sessions=1)
+
+        async def main():
+            stream = engine.astream("busy", "hello")
+            self.assertEqual(await stream.__anext__(), "busy")
+            bot = engine.session("busy")
+            engine.session("other")
+            engine.session("third")
+            self.assertIs(engine.session("busy"), bot)
+            self.assertEqual(len(engine), 2)
+            self.assertEqual([piece async for piece in stream], [":", "hello"])
+
+        asyncio.run(main())
+        self.assertEqual(engine._session_locks, {})
+        engine.session("fourth")
+        self.assertEqual(len(engine), 1)
+
+    def test_sync_stream(self):
+        """
+        The blocking stream bridge yields the pieces in order.
+        """
+        self.assertEqual(list(self.engine.stream("a", "hi")), ["a", ":", "hi"])
+        self.assertEqual(self.engine.generate("b", "yo", timeout=5), "b:yo")
+
+if __name__ == "__main__":
+    unittest.main()
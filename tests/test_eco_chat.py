@@ -0,0 +1,196 @@
+# tests/test_eco_chat.py
+"""
+Test case for EcoBot's streamed responses, with the OpenAI client replaced by stubs.
+"""
+import asyncio
+import importlib
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+import openai
+from eco_buddies.context_builder import ContextBuilder
+from eco_buddies.history_store import JsonlHistoryStore
+from eco_buddies.response_cache import ResponseCache
+
+ECO_BUDDIES_DIR = Path(__file__).resolve().parents[1] / "eco_buddies"
+PERSONALITY = {"system_message": "You are Eco-Bot.", "traits": ["curious"]}
+
+def import_eco_chat():
+    """
+    Import eco_chat, which reads its personality file relative to the working directory.
+    """
+    cwd = os.getcwd()
+    os.chdir(ECO_BUDDIES_DIR)
+    try:
+        # its log file lives in a directory that only exists on deployed hosts
+        with mock.patch("logging.basicConfig"):
+            return importlib.import_module("eco_buddies.eco_chat")
+    finally:
+        os.chdir(cwd)
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+CHUNKS = [chunk("Use "), SimpleNamespace(choices=[]), chunk(None), chunk("a worm "), chunk("bin.")]
+
+class AsyncStream:
+    """
+    Async iterator over chunks, like the stream returned by AsyncOpenAI.
+    """
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.chunks:
+            raise StopAsyncIteration
+        await asyncio.sleep(0)
+        return self.chunks.pop(0)
+
+class RecordingWriter:
+    """
+    Stands in for WriteBehindWriter, keeping the chat turns submitted to it.
+    """
+    def __init__(self):
+        self.turns = []
+
+    def submit_chat_turn(self, message, chat_id):
+        self.turns.append((message, chat_id))
+
+class EcoBotStreamingTestCase(unittest.TestCase):
+    """
+    Test case for EcoBot.stream_response and EcoBot.astream_response, and the summary they leave.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.eco_chat = import_eco_chat()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.writer = RecordingWriter()
+        self.bot = self.make_bot()
+
+    def make_bot(self):
+        return self.eco_chat.EcoBot(
+            response_cache=ResponseCache(),
+            history_store=JsonlHistoryStore(self.tmp.name, "s1"),
+            personality=PERSONALITY,
+            chat_id=5,
+            message_writer=self.writer,
+            thread_id=7,
+            agent_id=9,
+        )
+
+    def patch_create(self, **options):
+        patcher = mock.patch.object(self.eco_chat.openai.chat.completions, "create", **options)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_stream_response_records_the_finished_turn(self):
+        """
+        The chunks are yielded as they arrive, then the turn is saved, recorded and cached.
+        """
+        create = self.patch_create(return_value=iter(CHUNKS))
+        pieces = list(self.bot.stream_response("How do I compost?"))
+
+        self.assertEqual(pieces, ["Use ", "a worm ", "bin."])
+        self.assertTrue(create.call_args.kwargs["stream"])
+        expected = [{"role": "user", "content": "How do I compost?"}, {"role": "Eco-Bot", "content": "Use a worm bin."}]
+        self.assertEqual(self.bot.conversation_history, expected)
+        self.assertEqual(JsonlHistoryStore(self.tmp.name, "s1").tail(10), expected)
+        self.assertEqual(self.writer.turns, [
+            ({"content": "How do I compost?", "threadid": 7}, 5),
+            ({"content": "Use a worm bin.", "threadid": 7, "agentid": 9}, 5),
+        ])
+        # a new session asking the same first question is answered from the cache
+        create.reset_mock()
+        other = self.eco_chat.EcoBot(
+            response_cache=self.bot.response_cache,
+            history_store=JsonlHistoryStore(self.tmp.name, "s2"),
+            personality=PERSONALITY,
+            chat_id=None,
+        )
+        self.assertEqual(list(other.stream_response("how do I compost")), ["Use a worm bin."])
+        create.assert_not_called()
+
+    def test_stream_stopped_early_keeps_what_was_shown(self):
+        """
+        A stream the caller stops reading is saved as far as it got, but not cached.
+        """
+        self.patch_create(return_value=iter(CHUNKS))
+        stream = self.bot.stream_response("How do I compost?")
+        self.assertEqual(next(stream), "Use ")
+        stream.close()
+
+        self.assertEqual(self.bot.conversation_history[-1], {"role": "Eco-Bot", "content": "Use"})
+        self.assertIsNone(self.bot.response_cache.get("How do I compost?", self.bot.cache_scope))
+
+    def test_stream_error_before_any_chunk(self):
+        """
+        An API error with nothing streamed yields an apology and records no reply.
+        """
+        self.patch_create(side_effect=openai.OpenAIError("service unavailable"))
+        pieces = list(self.bot.stream_response("How do I compost?"))
+
+        self.assertEqual(pieces, ["Sorry, there was an issue with the AI service."])
+        self.assertEqual(self.bot.conversation_history, [{"role": "user", "content": "How do I compost?"}])
+        self.assertEqual(len(self.writer.turns), 1)
+
+    def test_astream_response_records_the_finished_turn(self):
+        """
+        The async stream yields the same pieces and saves and caches the turn when it ends.
+        """
+        client = mock.MagicMock()
+        client.chat.completions.create = mock.AsyncMock(return_value=AsyncStream(CHUNKS))
+
+        async def run():
+            return [piece async for piece in self.bot.astream_response("How do I compost?", client)]
+
+        self.assertEqual(asyncio.run(run()), ["Use ", "a worm ", "bin."])
+        self.assertEqual(self.bot.conversation_history[-1], {"role": "Eco-Bot", "content": "Use a worm bin."})
+        self.assertEqual(self.bot.response_cache.get("How do I compost?", self.bot.cache_scope), "Use a worm bin.")
+        self.assertEqual(len(self.writer.turns), 2)
+
+        # the next turn is asked after that conversation, so it is not served from the cache
+        client.chat.completions.create = mock.AsyncMock(return_value=AsyncStream([chunk("Again?")]))
+        self.assertEqual(asyncio.run(run()), ["Again?"])
+        self.assertEqual(len(self.bot.conversation_history), 4)
+
+    def test_summary_survives_a_restart(self):
+        """
+        A bot reopened on the same history resumes from the saved summary and window.
+        """
+        def make_builder():
+            summarize = lambda summary, messages, max_tokens: summary + "".join(m["content"][0] for m in messages)
+            return ContextBuilder(max_tokens=200, summary_tokens=30, summarize=summarize, background=False)
+
+        def bot(builder):
+            return self.eco_chat.EcoBot(
+                response_cache=ResponseCache(),
+                history_store=JsonlHistoryStore(self.tmp.name, "s1"),
+                context_builder=builder,
+                personality=PERSONALITY,
+                chat_id=None,
+            )
+
+        reply = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="b " + "word " * 15))])
+        self.patch_create(return_value=reply)
+        first = bot(make_builder())
+        for turn in range(8):
+            first.generate_response(f"q{turn} " + "word " * 15)
+        summary, summarized = first.context_builder.summary_state()
+        self.assertTrue(summary)
+
+        second = bot(make_builder())
+        self.assertEqual(second.context_builder.summary_state(), (summary, summarized))
+        self.assertEqual(second.context_builder.build(second.system_message, second.conversation_history),
+                         first.context_builder.build(first.system_message, first.conversation_history))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# tests/test_history_store.py
+"""
+Test case for the append-only EcoBot conversation history store.
+"""
+import json
+import os
+import tempfile
+import unittest
+from urllib.parse import unquote
+from eco_buddies.history_store import JsonlHistoryStore, session_file_name
+
+class JsonlHistoryStoreTestCase(unittest.TestCase):
+    """
+    Test case for JsonlHistoryStore.
+    """
+    def setUp(self):
+        """
+        Create a store in a temporary directory.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = JsonlHistoryStore(self.tmp.name, "user/42")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_and_tail(self):
+        """
+        Messages are appended one line each and tail returns the newest in order.
+        """
+        messages = [{"role": "user", "content": f"message {i} " + "x" * 500} for i in range(100)]
+        for message in messages[:50]:
+            self.store.append(message)
+        self.store.extend(messages[50:])
+
+        with open(self.store.path, encoding="utf-8") as file:
+            self.assertEqual(sum(1 for _ in file), 100)
+        self.assertEqual(self.store.tail(3), messages[-3:])
+        self.assertEqual(self.store.tail(500), messages)
+        self.assertEqual(list(self.store), messages)
+        self.assertEqual(os.path.basename(self.store.path), "user%2F42.jsonl")
+
+    def test_session_ids_never_share_a_file(self):
+        """
+        Ids that only differ in unsafe characters get separate, reversible file names.
+        """
+        ids = ["a/b", "a_b", "a%2Fb", "a b", "..", "", "x" * 500, "x" * 501]
+        names = [session_file_name(session_id) for session_id in ids]
+        self.assertEqual(len(set(names)), len(ids))
+        self.assertEqual(unquote(session_file_name("a/b")), "a/b")
+        self.assertEqual(session_file_name("session-1.2_x"), "session-1.2_x")
+        self.assertTrue(all("/" not in name and len(name) <= 200 for name in names))
+
+        JsonlHistoryStore(self.tmp.name, "a_b").append({"role": "user", "content": "b"})
+        self.assertEqual(JsonlHistoryStore(self.tmp.name, "a/b").tail(5), [])
+
+    def test_truncated_line_is_skipped(self):
+        """
+        A partial last line from an interrupted write does not break loading.
+        """
+        self.store.append({"role": "user", "content": "hello"})
+        with open(self.store.path, "a", encoding="utf-8") as file:
+            file.write('{"role": "Eco-Bot", "cont')
+        self.assertEqual(self.store.tail(5), [{"role": "user", "content": "hello"}])
+
+    def test_import_legacy_once(self):
+        """
+        The old JSON history is imported only while the session file does not exist.
+        """
+        legacy = os.path.join(self.tmp.name, "conversation_history.json")
+        with open(legacy, "w", encoding="utf-8") as file:
+            json.dump([{"role": "user", "content": "old"}], file, indent=4)
+
+        self.assertTrue(self.store.import_legacy(legacy))
+        self.assertFalse(self.store.import_legacy(legacy))
+        self.assertEqual(self.store.tail(10), [{"role": "user", "content": "old"}])
+
+    def test_summary_counts_later_messages(self):
+        """
+        The saved summary comes back with the messages appended since counted as not covered.
+        """
+        self.assertEqual(self.store.load_summary(), ("", 0))
+        self.store.extend([{"role": "user", "content": f"message {i}"} for i in range(10)])
+        self.store.save_summary("first eight", 2)
+        self.store.extend([{"role": "user", "content": "later"}, {"role": "Eco-Bot", "content": "reply"}])
+
+        reopened = JsonlHistoryStore(self.tmp.name, "user/42")
+        self.assertEqual(reopened.load_summary(), ("first eight", 4))
+        reopened.clear()
+        self.assertFalse(os.path.exists(reopened.summary_path))
+        self.assertEqual(reopened.load_summary(), ("", 0))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+# tests/test_http_client.py
+"""
+Test case for the shared HTTP client layer.
+"""
+import asyncio
+import threading
+import unittest
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from data.intergration.http_client import AsyncHttpClient, PooledSession, retry_after
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.connections.add(self.client_address)
+        server.requests += 1
+        if server.failures:
+            server.failures -= 1
+            status, body = 503, b"busy"
+        else:
+            status, body = 200, b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class HttpClientTestCase(unittest.TestCase):
+    """
+    Test case for PooledSession and AsyncHttpClient.
+    """
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.connections, self.server.requests, self.server.failures = set(), 0, 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/page"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_session_reuses_connections_and_retries(self):
+        """
+        Requests share one keep-alive connection and a 503 is retried.
+        """
+        session = PooledSession()
+        for _ in range(5):
+            self.assertEqual(session.get(self.url).json(), {"ok": True})
+        self.assertEqual(len(self.server.connections), 1)
+
+        self.server.failures = 2
+        response = session.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.requests, 8)
+        session.close()
+
+    def test_async_client_retries(self):
+        """
+        The async client retries a 503 and keeps its connection alive.
+        """
+        async def fetch():
+            async with AsyncHttpClient(http2=False) as client:
+                first = await client.get(self.url)
+                second = await client.get(self.url)
+                return first.status_code, second.status_code
+
+        self.server.failures = 1
+        self.assertEqual(asyncio.run(fetch()), (200, 200))
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_retry_after_forms(self):
+        """
+        Retry-After is read as seconds or as an HTTP date, and anything else is ignored.
+        """
+        def response(value):
+            return SimpleNamespace(headers={} if value is None else {"Retry-After": value})
+
+        in_a_minute = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+        self.assertEqual(retry_after(response("2.5")), 2.5)
+        self.assertAlmostEqual(retry_after(response(in_a_minute)), 60, delta=2)
+        self.assertEqual(retry_after(response("-3")), 0.0)
+        self.assertIsNone(retry_after(response("soon")))
+        self.assertIsNone(retry_after(response(None)))
+
+if __name__ == "__main__":
+    unittest.main()
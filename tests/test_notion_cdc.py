@@ -0,0 +1,235 @@
+# tests/test_notion_cdc.py
+"""
+Test case for the Postgres to Notion change data capture pipeline.
+
+The Notion API is replaced by a local HTTP server. Set NOTION_CDC_TEST_DSN to
+a scratch PostgreSQL database to also run the trigger end to end; its
+assistants, threads, runs and tools tables are created and dropped.
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from data.intergration.notion_cdc import (
+    CHANNELS, ChangePipeline, NotionSink, listen, notion_http_client, parse_notification, pg_row_loader,
+)
+from data.intergration.notion_integration import NotionClient
+
+MIGRATION = Path(__file__).resolve().parents[1] / "data" / "database" / "migrations" / "008_notion_change_feed.sql"
+
+def payload(op, row_id, ts=1.0, **row):
+    return json.dumps({"table": "assistants", "op": op, "key": "id", "id": row_id, "ts": ts,
+                       "row": dict(row, id=row_id)})
+
+class FakeNotion(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def reply(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def body(self):
+        return json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+    def page(self, page_id):
+        return dict(self.server.pages[page_id], object="page", id=page_id, last_edited_time="2024-01-01T10:00:00.000Z")
+
+    def do_POST(self):
+        body, pages = self.body(), self.server.pages
+        self.server.calls.append(("POST", self.path))
+        if match := re.fullmatch(r"/v1/databases/(\w+)/query", self.path):
+            row_id = body["filter"]["rich_text"]["equals"]
+            found = [{"id": page_id} for page_id, page in pages.items()
+                     if page["database"] == match.group(1)
+                     and page["properties"]["Row ID"]["rich_text"][0]["text"]["content"] == row_id]
+            self.reply({"results": found[:1]})
+        elif failures := self.server.failures.get(body["properties"]["Name"]["title"][0]["text"]["content"]):
+            self.reply({"object": "error"}, status=failures.pop(0))
+        else:
+            page_id = f"page{len(pages)}"
+            pages[page_id] = {"database": body["parent"]["database_id"], "properties": body["properties"],
+                              "archived": False}
+            self.reply(self.page(page_id))
+
+    def do_PATCH(self):
+        body = self.body()
+        page_id = self.path.rsplit("/", 1)[-1]
+        self.server.calls.append(("PATCH", self.path))
+        page = self.server.pages[page_id]
+        page["properties"].update(body.get("properties", {}))
+        page["archived"] = body.get("archived", page["archived"])
+        self.reply(self.page(page_id))
+
+    def log_message(self, *args):
+        pass
+
+def title(page):
+    return page["properties"]["Name"]["title"][0]["text"]["content"]
+
+class NotionCdcTestCase(unittest.TestCase):
+    """
+    Test case for parse_notification, ChangePipeline and NotionSink.
+    """
+    def setUp(self):
+        NotionClient.page_cache.clear()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeNotion)
+        self.server.pages, self.server.calls, self.server.failures = {}, [], {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/v1/"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_parse_notification(self):
+        """
+        Payloads become ChangeEvents, truncated payloads are flagged and bad ones rejected.
+        """
+        event = parse_notification("assistants_changes", payload("update", 7, name="Gaia"))
+        self.assertEqual((event.table, event.op, event.row_id, event.row["name"]), ("assistants", "UPDATE", 7, "Gaia"))
+        event = parse_notification("tools_changes", json.dumps(
+            {"op": "INSERT", "key": "tool_id", "id": 3, "ts": 1.0, "truncated": True}))
+        self.assertEqual((event.table, event.key_column, event.truncated, event.row), ("tools", "tool_id", True, None))
+        for bad in ("not json", json.dumps({"op": "INSERT"}), json.dumps({"op": "TRUNCATE", "id": 1})):
+            with self.assertRaises(ValueError):
+                parse_notification("assistants_changes", bad)
+
+    def run_pipeline(self, notifications, **options):
+        async def run():
+            async with notion_http_client("token", base_url=self.base_url) as client:
+                sink = NotionSink(client, {"assistants": "db1"})
+                async with ChangePipeline(sink, workers=4, debounce=0.05, **options) as pipeline:
+                    for channel, data in notifications:
+                        pipeline.submit_notification(channel, data)
+                    await pipeline.drain(flush=False)
+                    return pipeline.snapshot()
+        return asyncio.run(run())
+
+    def test_rapid_changes_are_coalesced_per_row(self):
+        """
+        Many changes to a row become one Notion write with the latest state.
+        """
+        notifications = [("assistants_changes", payload("INSERT", 1, name="v0"))]
+        notifications += [("assistants_changes", payload("UPDATE", 1, name=f"v{i}")) for i in range(1, 20)]
+        notifications += [("assistants_changes", payload("INSERT", 2, name="other")),
+                          ("assistants_changes", "garbage")]
+        metrics = self.run_pipeline(notifications)
+
+        self.assertEqual((metrics["received"], metrics["coalesced"], metrics["invalid"]), (21, 19, 1))
+        self.assertEqual((metrics["pushed"], metrics["failed"], metrics["pending"]), (2, 0, 0))
+        self.assertIsNotNone(metrics["lag_p95"])
+        self.assertEqual(sorted(title(page) for page in self.server.pages.values()), ["other", "v19"])
+        writes = [path for _, path in self.server.calls if not path.endswith("/query")]
+        self.assertEqual(len(writes), 2)
+
+    def test_updates_and_deletes_reuse_the_row_page(self):
+        """
+        A later change patches the page created for the row, and a delete archives it.
+        """
+        self.run_pipeline([("assistants_changes", payload("INSERT", 1, name="Gaia"))])
+        NotionClient.cache_page({"id": "page0", "last_edited_time": "2024-01-01T09:00:00.000Z"}, "token")
+        self.run_pipeline([("assistants_changes", payload("UPDATE", 1, name="Gaia 2"))])
+        self.assertEqual(len(self.server.pages), 1)
+        self.assertEqual(title(self.server.pages["page0"]), "Gaia 2")
+        # the copy read before the update is dropped
+        self.assertEqual(len(NotionClient.page_cache), 0)
+
+        self.run_pipeline([("assistants_changes", payload("DELETE", 1, name="Gaia 2"))])
+        self.assertTrue(self.server.pages["page0"]["archived"])
+
+    def test_transient_failures_are_retried(self):
+        """
+        Pushes rejected with 429 or 5xx are retried with backoff, while other errors fail at once.
+        """
+        self.server.failures = {"busy": [503, 429], "invalid": [400], "down": [502] * 3}
+        metrics = self.run_pipeline([
+            ("assistants_changes", payload("INSERT", row_id, name=name))
+            for row_id, name in enumerate(["busy", "invalid", "down"], 1)
+        ], max_attempts=3, retry_backoff=0.01)
+
+        self.assertEqual((metrics["pushed"], metrics["failed"], metrics["retried"], metrics["pending"]), (1, 2, 3, 0))
+        self.assertEqual([title(page) for page in self.server.pages.values()], ["busy"])
+
+    def test_listen_survives_errors_setting_up_listen(self):
+        """
+        A connection that fails during LISTEN is closed and the listener reconnects.
+        """
+        import psycopg2
+        stop = asyncio.Event()
+        broken = mock.MagicMock(closed=False)
+        broken.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.OperationalError("gone")
+
+        def connect(dsn):
+            if connect.calls:
+                stop.set()
+                raise psycopg2.OperationalError("refused")
+            connect.calls += 1
+            return broken
+        connect.calls = 0
+
+        with mock.patch("psycopg2.connect", side_effect=connect) as patched:
+            asyncio.run(listen("postgresql://scratch", ["assistants_changes"], lambda *args: None,
+                               stop=stop, reconnect_delay=0))
+        self.assertEqual(patched.call_count, 2)
+        broken.close.assert_called_once()
+
+    @unittest.skipUnless(os.getenv("NOTION_CDC_TEST_DSN"), "NOTION_CDC_TEST_DSN is not set")
+    def test_postgres_triggers_end_to_end(self):
+        """
+        Row changes committed in PostgreSQL reach Notion through the triggers and listener.
+        """
+        import psycopg2
+        from sqlalchemy import create_engine
+        from data.database.utils.db_operations import Assistant, Run, Thread, Tool
+        from data.intergration.notion_cdc import libpq_dsn
+
+        dsn = os.environ["NOTION_CDC_TEST_DSN"]
+        engine = create_engine(dsn)
+        tables = [Assistant.__table__, Thread.__table__, Run.__table__, Tool.__table__]
+        Assistant.metadata.create_all(engine, tables=tables)
+        self.addCleanup(engine.dispose)
+        self.addCleanup(Assistant.metadata.drop_all, engine, tables=tables)
+        conn = psycopg2.connect(libpq_dsn(dsn))
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            cur.execute(MIGRATION.read_text())
+
+        async def run():
+            async with notion_http_client("token", base_url=self.base_url) as client:
+                sink = NotionSink(client, {"assistants": "db1", "tools": "db2"})
+                async with ChangePipeline(sink, debounce=0.05, row_loader=pg_row_loader(dsn)) as pipeline:
+                    stop, ready = asyncio.Event(), asyncio.Event()
+                    listener = asyncio.create_task(listen(dsn, CHANNELS, pipeline.submit_notification, stop, ready))
+                    await ready.wait()
+                    with conn.cursor() as cur:
+                        cur.execute("INSERT INTO assistants (id, name, role) VALUES (1, 'Gaia', 'guide')")
+                        for i in range(5):
+                            cur.execute("UPDATE assistants SET role = %s WHERE id = 1", (f"role {i}",))
+                        cur.execute("INSERT INTO tools (tool_id, tool_name, tool_description) VALUES (1, 'big', %s)",
+                                    ("x" * 10000,))
+                    while pipeline.metrics.received < 7:
+                        await asyncio.sleep(0.01)
+                    await pipeline.drain()
+                    stop.set()
+                    await listener
+                    return pipeline.snapshot()
+
+        metrics = asyncio.run(asyncio.wait_for(run(), 30))
+        self.assertEqual((metrics["received"], metrics["pushed"], metrics["failed"]), (7, 2, 0))
+        pages = {page["database"]: page for page in self.server.pages.values()}
+        self.assertEqual(pages["db1"]["properties"]["role"]["rich_text"][0]["text"]["content"], "role 4")
+        self.assertEqual(title(pages["db2"]), "big")
+        self.assertEqual(len(pages["db2"]["properties"]["tool_description"]["rich_text"][0]["text"]["content"]), 2000)
+
+if __name__ == "__main__":
+    unittest.main()
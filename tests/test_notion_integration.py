@@ -0,0 +1,111 @@
+# tests/test_notion_integration.py
+"""
+Test case for the Notion client.
+"""
+import unittest
+from unittest.mock import patch
+import requests
+from data.intergration.notion_integration import NotionClient, NOTION_API_URL
+
+class NotionClientTestCase(unittest.TestCase):
+    """
+    Test case for NotionClient property updates and the page cache.
+    """
+    def setUp(self):
+        NotionClient.page_cache.clear()
+        patcher = patch("data.intergration.notion_integration.http_session")
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.session.patch.return_value.json.side_effect = lambda: {"object": "page"}
+
+    def test_update_sends_only_the_changed_property(self):
+        """
+        Updating the status is one PATCH of the status property, with no read.
+        """
+        NotionClient.update_page_status("page_1", "Done", "token")
+        self.session.get.assert_not_called()
+        self.session.patch.assert_called_once()
+        args, kwargs = self.session.patch.call_args
+        self.assertEqual(args[0], f"{NOTION_API_URL}pages/page_1")
+        self.assertEqual(kwargs["json"], {"properties": {"status": {"select": {"name": "Done"}}}})
+
+    def test_update_pages_coalesces_changes_per_page(self):
+        """
+        Several changes to one page become one request, later values winning.
+        """
+        results = NotionClient.update_pages([
+            ("page_1", {"status": {"select": {"name": "Doing"}}}),
+            ("page_2", {"status": {"select": {"name": "Done"}}}),
+            ("page_1", {"tags": {"multi_select": [{"name": "eco"}]}}),
+            ("page_1", {"status": {"select": {"name": "Done"}}}),
+        ], "token")
+        self.assertEqual(set(results), {"page_1", "page_2"})
+        self.assertEqual(self.session.patch.call_count, 2)
+        sent = {call.args[0].rsplit("/", 1)[-1]: call.kwargs["json"] for call in self.session.patch.call_args_list}
+        self.assertEqual(sent["page_1"]["properties"], {
+            "status": {"select": {"name": "Done"}},
+            "tags": {"multi_select": [{"name": "eco"}]},
+        })
+
+    def make_page(self, edited, status="Doing"):
+        return {
+            "object": "page", "id": "aaaa-bbbb", "last_edited_time": edited,
+            "properties": {
+                "title": {"title": [{"plain_text": "Eco-Bot"}]},
+                "content": {"rich_text": [{"plain_text": "Recycle"}]},
+                "tags": {"multi_select": [{"name": "eco"}]},
+                "status": {"select": {"name": status}},
+            },
+        }
+
+    def test_property_reads_share_one_fetch(self):
+        """
+        Reading four properties of a page fetches it once, and a write refreshes the cache.
+        """
+        self.session.get.return_value.json.side_effect = lambda: self.make_page("2024-01-01T10:00:00.000Z")
+        self.assertEqual(NotionClient.get_page_title("aaaabbbb", "token"), "Eco-Bot")
+        self.assertEqual(NotionClient.get_page_content("aaaabbbb", "token"), "Recycle")
+        self.assertEqual(NotionClient.get_page_tags("aaaabbbb", "token"), [{"name": "eco"}])
+        self.assertEqual(NotionClient.get_page_status("aaaa-bbbb", "token"), "Doing")
+        self.assertEqual(self.session.get.call_count, 1)
+
+        self.session.patch.return_value.json.side_effect = lambda: self.make_page("2024-01-01T10:05:00.000Z", "Done")
+        NotionClient.update_page_status("aaaabbbb", "Done", "token")
+        self.assertEqual(NotionClient.get_page_status("aaaabbbb", "token"), "Done")
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_older_copies_do_not_replace_newer(self):
+        """
+        A late response older than the cached page is ignored, and invalidation respects edit times.
+        """
+        NotionClient.cache_page(self.make_page("2024-01-01T10:05:00.000Z", "Done"), "token")
+        NotionClient.cache_page(self.make_page("2024-01-01T10:00:00.000Z", "Doing"), "token")
+        self.assertEqual(NotionClient.get_page_status("aaaabbbb", "token"), "Done")
+
+        NotionClient.invalidate_page("aaaabbbb", "2024-01-01T10:00:00.000Z")
+        self.assertEqual(len(NotionClient.page_cache), 1)
+        NotionClient.invalidate_page("aaaabbbb", "2024-01-01T10:05:00.000Z")
+        self.assertEqual(len(NotionClient.page_cache), 0)
+
+    def test_cache_is_kept_per_token(self):
+        """
+        A page cached for one token is fetched again for another, and readers get copies.
+        """
+        self.session.get.return_value.json.side_effect = lambda: self.make_page("2024-01-01T10:00:00.000Z")
+        page = NotionClient.read_from_notion("aaaabbbb", "token")
+        page["properties"]["status"]["select"]["name"] = "Edited"
+        self.assertEqual(NotionClient.get_page_status("aaaabbbb", "token"), "Doing")
+        self.assertEqual(self.session.get.call_count, 1)
+
+        self.session.get.return_value.raise_for_status.side_effect = requests.HTTPError("404 Not Found")
+        self.assertIsNone(NotionClient.read_from_notion("aaaabbbb", "other-token"))
+        self.assertEqual(self.session.get.call_count, 2)
+        self.assertFalse(any("token" in str(key) for key in dict(NotionClient.page_cache.items())))
+
+        # a change drops the page for every token
+        NotionClient.cache_page(self.make_page("2024-01-01T10:00:00.000Z"), "other-token")
+        NotionClient.invalidate_page("aaaa-bbbb")
+        self.assertEqual(len(NotionClient.page_cache), 0)
+
+if __name__ == "__main__":
+    unittest.main()
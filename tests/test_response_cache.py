@@ -0,0 +1,96 @@
+# tests/test_response_cache.py
+"""
+Test case for the EcoBot response cache.
+"""
+import threading
+import time
+import unittest
+from eco_buddies.response_cache import ResponseCache
+
+def embed(text):
+    """Two-dimensional embedding that only tells compost questions from the rest."""
+    return [1.0, 0.0] if "compost" in text else [0.0, 1.0]
+
+class ResponseCacheTestCase(unittest.TestCase):
+    """
+    Test case for ResponseCache.
+    """
+    def wait_for_index(self, cache, size):
+        deadline = time.monotonic() + 5
+        while len(cache._index) < size:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_context_is_part_of_the_key(self):
+        """
+        A response is only reused after the same conversation, and context-free turns are shared.
+        """
+        cache = ResponseCache()
+        scope = ResponseCache.scope_for("system", "personality")
+        self.assertEqual(ResponseCache.context_scope(scope, []), scope)
+        first = [{"role": "user", "content": "I live in a flat"}]
+        second = [{"role": "user", "content": "I have a garden"}]
+        in_flat = ResponseCache.context_scope(scope, first)
+        self.assertNotEqual(in_flat, ResponseCache.context_scope(scope, second))
+
+        cache.set("How do I compost?", "Use a worm bin.", in_flat)
+        self.assertEqual(cache.get("how do I compost", ResponseCache.context_scope(scope, list(first))),
+                         "Use a worm bin.")
+        self.assertIsNone(cache.get("how do I compost", ResponseCache.context_scope(scope, second)))
+        self.assertIsNone(cache.get("how do I compost", scope))
+
+    def test_near_duplicates_hit_once_indexed(self):
+        """
+        A similar prompt reuses the stored response once its embedding is indexed.
+        """
+        cache = ResponseCache(embed=embed, similarity_threshold=0.9)
+        cache.set("How do I compost?", "Use a worm bin.")
+        self.wait_for_index(cache, 1)
+        self.assertEqual(cache.get("what is the best way to compost kitchen scraps"), "Use a worm bin.")
+        self.assertIsNone(cache.get("what is solar power"))
+        self.assertEqual((cache.stats.semantic_hits, cache.stats.misses), (1, 1))
+
+    def test_slow_embeddings_do_not_hold_up_requests(self):
+        """
+        A lookup gives up on a slow embedding after embed_timeout, and set never waits for one.
+        """
+        release = threading.Event()
+        release.set()
+
+        def slow_embed(text):
+            release.wait(5)
+            return embed(text)
+
+        cache = ResponseCache(embed=slow_embed, embed_timeout=0.05)
+        cache.set("What is solar power?", "Sunlight turned into electricity.")
+        self.wait_for_index(cache, 1)
+        release.clear()
+        started = time.monotonic()
+        cache.set("How do I compost?", "Use a worm bin.")
+        self.assertLess(time.monotonic() - started, 0.05)
+        started = time.monotonic()
+        self.assertIsNone(cache.get("composting tips please"))
+        self.assertLess(time.monotonic() - started, 1)
+        release.set()
+        self.wait_for_index(cache, 2)
+        self.assertEqual(cache.get("composting tips please"), "Use a worm bin.")
+
+    def test_shared_cache_outage_is_a_miss(self):
+        """
+        A failing shared tier does not fail the lookup.
+        """
+        class BrokenSharedCache:
+            def get(self, key):
+                raise ValueError("invalid literal for int() with base 10: 'None'")
+
+            def set(self, key, value, ttl=None):
+                raise ValueError("invalid literal for int() with base 10: 'None'")
+
+        cache = ResponseCache(shared_cache=BrokenSharedCache())
+        self.assertIsNone(cache.get("How do I compost?"))
+        cache.set("How do I compost?", "Use a worm bin.")
+        self.assertEqual(cache.get("how do I compost"), "Use a worm bin.")
+        self.assertEqual(cache.stats.snapshot(), {"hits": 1, "semantic_hits": 0, "shared_hits": 0, "misses": 1})
+
+if __name__ == "__main__":
+    unittest.main()
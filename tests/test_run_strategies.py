@@ -0,0 +1,196 @@
+# tests/test_run_strategies.py
+"""
+Test case for the assistant run wait strategies.
+"""
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+import httpx
+import openai
+from gbts.run_strategies import (
+    Backoff, PollingRunStrategy, RunMetrics, StreamingRunStrategy, list_messages_after, run_strategy_for,
+    split_pending_messages,
+)
+
+def make_run(status, run_id="run_1"):
+    return SimpleNamespace(id=run_id, status=status)
+
+def make_event(name, data):
+    return SimpleNamespace(event=name, data=data)
+
+class FakeMessages:
+    """
+    messages.list over a thread of stored messages, returning pages like the OpenAI client.
+    """
+    def __init__(self, count):
+        self.stored = [SimpleNamespace(id=f"msg_{i}") for i in range(count)]
+        self.calls = []
+
+    def list(self, thread_id, order, limit, after=None):
+        self.calls.append(after)
+        ids = [message.id for message in self.stored]
+        if after is not None and after not in ids:
+            raise openai.NotFoundError(
+                "No message found", response=httpx.Response(404, request=httpx.Request("GET", "https://api")), body=None
+            )
+        start = ids.index(after) + 1 if after is not None else 0
+        remaining = self.stored[start:]
+        pages = [SimpleNamespace(data=remaining[i:i + limit]) for i in range(0, len(remaining), limit)]
+        return SimpleNamespace(iter_pages=lambda: iter(pages or [SimpleNamespace(data=[])]))
+
+class RunStrategiesTestCase(unittest.TestCase):
+    """
+    Test case for PollingRunStrategy and StreamingRunStrategy.
+    """
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.runs = self.client.beta.threads.runs
+
+    @mock.patch("gbts.run_strategies.time.sleep")
+    def test_polling_backs_off(self, sleep):
+        """
+        Polling starts fast, grows the delay, and counts the polls.
+        """
+        self.runs.create.return_value = make_run("queued")
+        self.runs.retrieve.side_effect = [make_run("queued")] * 5 + [make_run("completed")]
+        strategy = PollingRunStrategy(backoff=Backoff(initial=0.05, maximum=1.0, multiplier=2.0, jitter=0.0))
+        metrics = RunMetrics()
+
+        run = strategy.create_run(self.client, "thread_1", metrics, assistant_id="asst_1")
+
+        self.assertEqual(run.status, "completed")
+        self.assertEqual(metrics.polls, 6)
+        self.assertEqual(metrics.status, "completed")
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(delays, [0.05, 0.1, 0.2, 0.4, 0.8, 1.0])
+
+    @mock.patch("gbts.run_strategies.time.sleep")
+    def test_polling_timeout(self, sleep):
+        """
+        A run that never settles raises TimeoutError.
+        """
+        self.runs.retrieve.return_value = make_run("in_progress")
+        strategy = PollingRunStrategy(timeout=0.0)
+        with self.assertRaises(TimeoutError):
+            strategy.wait(self.client, "thread_1", "run_1", RunMetrics(), initial_run=make_run("queued"))
+        self.runs.cancel.assert_called_once_with("run_1", thread_id="thread_1")
+
+    def test_streaming_timeout_cancels_a_silent_run(self):
+        """
+        A stream with no settled event before the deadline is closed and the run cancelled.
+        """
+        closed = threading.Event()
+
+        class SilentStream:
+            def __iter__(self):
+                yield make_event("thread.run.created", make_run("queued"))
+                closed.wait(5)
+                raise ConnectionError("stream closed")
+
+            def close(self):
+                closed.set()
+
+        self.runs.create.return_value = SilentStream()
+        metrics = RunMetrics()
+        with self.assertRaises(TimeoutError):
+            StreamingRunStrategy(timeout=0.05).create_run(self.client, "thread_1", metrics, assistant_id="asst_1")
+        self.assertTrue(closed.is_set())
+        self.assertLess(metrics.wait_seconds, 1)
+        self.runs.cancel.assert_called_once_with("run_1", thread_id="thread_1")
+        self.runs.retrieve.assert_not_called()
+
+    def test_streaming_returns_on_settled_event(self):
+        """
+        The streaming strategy returns on the first settled run event without polling.
+        """
+        self.runs.create.return_value = iter([
+            make_event("thread.run.created", make_run("queued")),
+            make_event("thread.run.in_progress", make_run("in_progress")),
+            make_event("thread.run.step.created", SimpleNamespace(id="step_1", status="in_progress")),
+            make_event("thread.message.delta", SimpleNamespace()),
+            make_event("thread.run.requires_action", make_run("requires_action")),
+        ])
+        self.runs.submit_tool_outputs.return_value = iter([
+            make_event("thread.run.completed", make_run("completed")),
+        ])
+        strategy = StreamingRunStrategy()
+        metrics = RunMetrics()
+
+        run = strategy.create_run(self.client, "thread_1", metrics, assistant_id="asst_1")
+        self.assertEqual(run.status, "requires_action")
+        run = strategy.submit_tool_outputs(self.client, "thread_1", run.id, [], metrics)
+
+        self.assertEqual(run.status, "completed")
+        self.assertEqual(metrics.events, 6)
+        self.assertEqual(metrics.polls, 0)
+        self.assertEqual(metrics.tool_rounds, 1)
+        self.runs.retrieve.assert_not_called()
+        self.assertTrue(self.runs.create.call_args.kwargs["stream"])
+
+    def test_pending_messages_go_with_the_run(self):
+        """
+        Up to 32 pending messages are sent with the run in a single request.
+        """
+        pending = [{"role": "user", "content": f"agent {i}", "name": f"agent{i}"} for i in range(40)]
+        overflow, inline = split_pending_messages(pending)
+        self.assertEqual([m["content"] for m in overflow], [f"agent {i}" for i in range(8)])
+        self.assertEqual(len(inline), 32)
+        self.assertEqual(inline[-1], {"role": "user", "content": "agent 39"})
+        self.assertEqual(split_pending_messages(pending[:5]), ([], [{"role": "user", "content": f"agent {i}"} for i in range(5)]))
+
+        self.runs.create.return_value = make_run("completed")
+        metrics = RunMetrics()
+        PollingRunStrategy().create_run(self.client, "thread_1", metrics, additional_messages=inline)
+        self.assertEqual(metrics.http_calls, 1)
+        self.assertIsNotNone(metrics.run_start_seconds)
+        self.assertEqual(self.runs.create.call_args.kwargs["additional_messages"], inline)
+
+    def test_messages_resume_after_the_cursor(self):
+        """
+        Only messages after the last one seen are listed, and the cursor moves to the newest.
+        """
+        messages = self.client.beta.threads.messages = FakeMessages(5)
+        new, cursor = list_messages_after(self.client, "thread_1", "msg_2")
+        self.assertEqual([m.id for m in new], ["msg_3", "msg_4"])
+        self.assertEqual(cursor, "msg_4")
+        self.assertEqual(messages.calls, ["msg_2"])
+
+        new, cursor = list_messages_after(self.client, "thread_1", cursor)
+        self.assertEqual((new, cursor), ([], "msg_4"))
+
+    def test_messages_follow_pagination(self):
+        """
+        New messages spread over several pages are all returned, in order.
+        """
+        self.client.beta.threads.messages = FakeMessages(250)
+        metrics = RunMetrics()
+        new, cursor = list_messages_after(self.client, "thread_1", None, metrics, page_size=100)
+        self.assertEqual([m.id for m in new], [f"msg_{i}" for i in range(250)])
+        self.assertEqual(cursor, "msg_249")
+        self.assertEqual(metrics.http_calls, 3)
+
+    def test_missing_cursor_lists_from_the_start(self):
+        """
+        A cursor whose message was deleted falls back to listing the whole thread.
+        """
+        messages = self.client.beta.threads.messages = FakeMessages(3)
+        metrics = RunMetrics()
+        new, cursor = list_messages_after(self.client, "thread_1", "msg_deleted", metrics)
+        self.assertEqual([m.id for m in new], ["msg_0", "msg_1", "msg_2"])
+        self.assertEqual(cursor, "msg_2")
+        self.assertEqual(messages.calls, ["msg_deleted", None])
+        self.assertEqual(metrics.http_calls, 2)
+
+    def test_strategy_selection(self):
+        """
+        The streaming strategy is chosen only when the client supports it.
+        """
+        def create(thread_id, assistant_id, stream=False):
+            pass
+        self.runs.create = create
+        self.assertIsInstance(run_strategy_for(self.client), StreamingRunStrategy)
+        self.assertNotIsInstance(run_strategy_for(self.client, mode="poll"), StreamingRunStrategy)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# tests/test_tool_executor.py
+"""
+Test case for concurrent tool call execution.
+"""
+import json
+import time
+import unittest
+from types import SimpleNamespace
+from gbts.tool_executor import ToolCallExecutor
+
+def make_tool_call(call_id, name, seconds):
+    arguments = json.dumps({"seconds": seconds})
+    function = SimpleNamespace(name=name, arguments=arguments)
+    function.dict = lambda: {"name": name, "arguments": arguments}
+    return SimpleNamespace(id=call_id, function=function)
+
+def execute_function(function_call):
+    seconds = json.loads(function_call["arguments"])["seconds"]
+    if seconds < 0:
+        raise RuntimeError("boom")
+    time.sleep(seconds)
+    return True, {"name": function_call["name"], "role": "function", "content": f"slept {seconds}"}
+
+class ToolCallExecutorTestCase(unittest.TestCase):
+    """
+    Test case for ToolCallExecutor.
+    """
+    def setUp(self):
+        self.executor = ToolCallExecutor(max_workers=4, timeout=5, timeouts={"slow": 0.1})
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_calls_run_concurrently_in_order(self):
+        """
+        The round takes about as long as the slowest call and keeps the call order.
+        """
+        calls = [make_tool_call(f"call_{i}", "nap", 0.2) for i in range(4)]
+        started = time.monotonic()
+        outputs = self.executor.run(calls, execute_function)
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual([o["tool_call_id"] for o in outputs], [f"call_{i}" for i in range(4)])
+        self.assertEqual(outputs[0]["output"], "slept 0.2")
+
+    def test_timeouts_and_errors_are_reported(self):
+        """
+        A call over its timeout or raising an error becomes an error output.
+        """
+        calls = [make_tool_call("a", "slow", 0.5), make_tool_call("b", "nap", -1), make_tool_call("c", "nap", 0)]
+        outputs = self.executor.run(calls, execute_function)
+        self.assertIn("timed out", outputs[0]["output"])
+        self.assertIn("boom", outputs[1]["output"])
+        self.assertEqual(outputs[2]["output"], "slept 0")
+
+    def test_queued_calls_get_their_full_timeout(self):
+        """
+        Calls waiting for a free worker are timed from when they start, not from the round start.
+        """
+        executor = ToolCallExecutor(max_workers=1, timeout=0.3)
+        self.addCleanup(executor.shutdown)
+        calls = [make_tool_call(f"call_{i}", "nap", 0.2) for i in range(3)]
+        outputs = executor.run(calls, execute_function)
+        self.assertEqual([o["output"] for o in outputs], ["slept 0.2"] * 3)
+
+if __name__ == "__main__":
+    unittest.main()